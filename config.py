@@ -18,14 +18,50 @@ SCOPES = ['https://www.googleapis.com/auth/gmail.readonly', 'https://www.googlea
 # Name of the SQLite database file. It will be created in the project root directory.
 DATABASE_NAME = 'emails.db'
 
+# Number of rows sent to SQLite per chunk during bulk insertion.
+# All chunks of one bulk insert still share a single transaction.
+DB_INSERT_BATCH_SIZE = 1000
+
+# While fetching, email rows are handed to a separate database writer thread in chunks of
+# this many rows, so storing one chunk overlaps with downloading the next.
+DB_WRITER_CHUNK_SIZE = 500
+
+# Maximum number of chunks waiting for the writer thread before fetching pauses.
+DB_WRITER_QUEUE_SIZE = 4
+
+# File caching the account's label name to label ID mapping between runs, so rule actions
+# can resolve labels without listing them from the API on every run.
+LABEL_CACHE_FILE = '.label_cache.json'
+
 # --- Rule Engine Configuration ---
 # Path to the JSON file containing the email processing rules.
 RULES_FILE = 'rules.json'
 
+# Emails are processed in chunks of this many when message bodies must be downloaded:
+# the bodies of the next chunk are fetched while rules are evaluated against the current one.
+PROCESS_CHUNK_SIZE = 200
+
 # --- Email Fetching Configuration ---
 # Maximum number of emails to fetch from the inbox.
 MAX_EMAIL_FETCH_RESULTS = 50
 
+# Number of message detail requests grouped into a single Gmail batch HTTP request.
+# The Gmail API accepts up to 100 calls per batch; 50 keeps clear of per-user rate limits.
+GMAIL_BATCH_SIZE = 50
+
+# Number of worker threads used for per-message Gmail API calls that cannot be batched.
+# These calls are network-bound, so threads overlap round trips despite the GIL.
+MAX_API_WORKERS = 16
+
+# Number of times a Gmail API request is retried, with exponential backoff, after a
+# rate-limit (429) or server (5xx) error or a dropped connection.
+API_NUM_RETRIES = 3
+
+# --- Logging Configuration ---
+# Level of the library modules' log output when running the scripts. INFO shows one-off
+# progress messages, DEBUG adds a line per email action, WARNING shows only problems.
+LOG_LEVEL = 'INFO'
+
 # --- Folder ID Mapping ---
 # Gmail uses label IDs for folders.
 # Common ones include 'INBOX', 'STARRED', 'SENT', 'DRAFT', 'ALL_MAIL', 'TRASH', 'SPAM'.
@@ -1,11 +1,79 @@
 # database_manager.py
 
 import sqlite3
+import contextlib
+import itertools
 import json
+import logging
+import time
+import zlib
 from datetime import datetime
 
 # Import configuration constants
-from config import DATABASE_NAME
+from config import DATABASE_NAME, DB_INSERT_BATCH_SIZE
+
+logger = logging.getLogger(__name__)
+
+# PRAGMAs applied to every new connection. WAL journaling with synchronous=NORMAL
+# avoids a full fsync on every commit, which dominates write-heavy ingestion.
+# page_size must come first: it only takes effect before the database is created
+# and before the journal mode is switched to WAL.
+SQLITE_PRAGMAS = """
+    PRAGMA page_size=4096;
+    PRAGMA journal_mode=WAL;
+    PRAGMA synchronous=NORMAL;
+    PRAGMA temp_store=MEMORY;
+    PRAGMA mmap_size=268435456;
+    PRAGMA cache_size=-65536;
+    PRAGMA busy_timeout=5000;
+"""
+
+# Message bodies at least this many characters long are stored zlib-compressed as a BLOB.
+# Shorter bodies stay plain text, where compression would save little.
+BODY_COMPRESSION_THRESHOLD = 1024
+
+# Upsert for email rows (requires SQLite 3.24+). Unlike INSERT OR REPLACE, this
+# updates the existing row in place instead of deleting and re-inserting it. A NULL
+# message_body (headers-only fetch) keeps any body already loaded for the row.
+_UPSERT_EMAIL_HEAD = '''
+    INSERT INTO emails (id, thread_id, "from", subject, received_date_time, message_body, label_ids)
+    VALUES '''
+_UPSERT_EMAIL_TAIL = '''
+    ON CONFLICT(id) DO UPDATE SET
+        thread_id = excluded.thread_id,
+        "from" = excluded."from",
+        subject = excluded.subject,
+        received_date_time = excluded.received_date_time,
+        message_body = COALESCE(excluded.message_body, emails.message_body),
+        label_ids = excluded.label_ids
+'''
+_EMAIL_ROW_PLACEHOLDERS = '(?, ?, ?, ?, ?, ?, ?)'
+UPSERT_EMAIL_SQL = _UPSERT_EMAIL_HEAD + _EMAIL_ROW_PLACEHOLDERS + _UPSERT_EMAIL_TAIL
+
+# Bulk inserts send this many rows per multi-row VALUES statement, so SQLite runs one
+# statement per group instead of one per row. 7 columns x 142 rows stays within the
+# 999 bound-variable limit of SQLite builds older than 3.32.
+UPSERT_ROWS_PER_STATEMENT = 999 // 7
+
+
+def _multi_row_upsert_sql(row_count):
+    """
+    Builds the upsert statement for `row_count` rows in a single multi-row VALUES clause.
+
+    Args:
+        row_count (int): Number of rows the statement inserts.
+    Returns:
+        str: The SQL statement.
+    """
+    return _UPSERT_EMAIL_HEAD + ', '.join([_EMAIL_ROW_PLACEHOLDERS] * row_count) + _UPSERT_EMAIL_TAIL
+
+
+# The full-size statement is built once so every group reuses the same prepared statement
+UPSERT_EMAILS_MULTI_ROW_SQL = _multi_row_upsert_sql(UPSERT_ROWS_PER_STATEMENT)
+
+# Per-row statements are kept as module constants so every call passes the identical SQL
+# text and hits the connection's prepared-statement cache instead of being re-prepared.
+UPDATE_MESSAGE_BODY_SQL = 'UPDATE emails SET message_body = ? WHERE id = ?'
 
 
 class DatabaseManager:
@@ -27,49 +95,106 @@ class DatabaseManager:
         self.db_name = db_name
         self.conn = None
         self.cursor = None
+        self._in_transaction = False  # True while a caller-managed transaction is open
         self._connect()
         self._create_table()
 
     def _connect(self):
         """Establishes a connection to the SQLite database."""
         try:
-            self.conn = sqlite3.connect(self.db_name)
+            # isolation_level=None disables the sqlite3 module's implicit BEGIN/COMMIT;
+            # every write is wrapped in an explicit transaction by _transaction().
+            self.conn = sqlite3.connect(self.db_name, isolation_level=None)
+            self.conn.executescript(SQLITE_PRAGMAS)
             self.conn.row_factory = sqlite3.Row  # Allows accessing columns by name
             self.cursor = self.conn.cursor()
-            print(f"Connected to database: {self.db_name}")
+            logger.debug(f"Connected to database: {self.db_name}")
         except sqlite3.Error as e:
-            print(f"Error connecting to database: {e}")
+            logger.error(f"Error connecting to database: {e}")
             raise  # Re-raise the exception to indicate a critical error
 
     def _create_table(self):
         """
-        Creates the 'emails' table in the database if it doesn't already exist.
-        The table schema is designed to store relevant email metadata.
+        Creates the 'emails' and 'sync_state' tables in the database if they don't already exist.
+        The 'emails' schema is designed to store relevant email metadata.
         """
         try:
-            self.cursor.execute(f'''
-                CREATE TABLE IF NOT EXISTS emails (
-                    id TEXT PRIMARY KEY,
-                    thread_id TEXT,
-                    "from" TEXT,
-                    subject TEXT,
-                    received_date_time TEXT, -- Stored as ISO format string
-                    message_body TEXT,
-                    label_ids TEXT -- Stored as JSON string
-                )
-            ''')
-            self.conn.commit()
-            print("Table 'emails' ensured to exist.")
+            with self._transaction():
+                self.cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS emails (
+                        id TEXT PRIMARY KEY,
+                        thread_id TEXT,
+                        "from" TEXT,
+                        subject TEXT,
+                        received_date_time TEXT, -- Stored as ISO format string
+                        message_body TEXT, -- Plain text, or zlib-compressed UTF-8 BLOB for long bodies
+                        label_ids TEXT -- Stored as comma-separated label IDs
+                    )
+                ''')
+                # Key/value store for sync bookkeeping such as the last Gmail history ID
+                self.cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS sync_state (
+                        key TEXT PRIMARY KEY,
+                        value TEXT
+                    )
+                ''')
+                # Secondary indexes for date-range and sender lookups
+                self.cursor.execute('CREATE INDEX IF NOT EXISTS idx_emails_received ON emails(received_date_time)')
+                self.cursor.execute('CREATE INDEX IF NOT EXISTS idx_emails_from ON emails("from")')
+            logger.debug("Table 'emails' ensured to exist.")
         except sqlite3.Error as e:
-            print(f"Error creating table: {e}")
+            logger.error(f"Error creating table: {e}")
+            raise
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        """
+        Runs the enclosed writes in one explicit transaction, committing on success and
+        rolling back on error. Inside a caller-managed transaction (`begin_transaction`)
+        the writes simply join it and the caller decides when to commit.
+        """
+        if self._in_transaction:
+            yield
+            return
+        self.cursor.execute('BEGIN IMMEDIATE')
+        try:
+            yield
+        except BaseException:
             self.conn.rollback()
             raise
+        self.conn.commit()
+
+    def begin_transaction(self):
+        """
+        Opens an explicit transaction so that many writes (`insert_email`,
+        `insert_many_emails`, ...) share a single commit.
+        Must be paired with `commit_transaction` (or `rollback_transaction` on failure).
+        """
+        self.cursor.execute('BEGIN IMMEDIATE')
+        self._in_transaction = True
+
+    def commit_transaction(self):
+        """Commits the transaction opened by `begin_transaction`."""
+        try:
+            self.conn.commit()
+        finally:
+            self._in_transaction = False
+
+    def rollback_transaction(self):
+        """Discards all changes made since `begin_transaction`."""
+        try:
+            self.conn.rollback()
+        finally:
+            self._in_transaction = False
 
     def insert_email(self, email_data):
         """
         Inserts a single email record into the 'emails' table.
         If an email with the same ID already exists, it updates the existing record.
 
+        When called inside `begin_transaction`/`commit_transaction` the row is not
+        committed individually; otherwise it is committed in its own transaction.
+
         Args:
             email_data (dict): A dictionary containing email details.
                                Expected keys: 'id', 'threadId', 'From', 'Subject',
@@ -86,77 +211,181 @@ class DatabaseManager:
                 received_date_time_str = received_dt  # Assume it's already in ISO format
             else:
                 received_date_time_str = None
-            # Convert list of label_ids to JSON string for storage
-            label_ids_json = json.dumps(email_data.get('labelIds', []))
-
-            self.cursor.execute(f'''
-                INSERT OR REPLACE INTO emails (id, thread_id, "from", subject, received_date_time, message_body, label_ids)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                email_data['id'],
-                email_data['threadId'],
-                email_data['From'],
-                email_data['Subject'],
-                received_date_time_str,
-                email_data['Message Body'],
-                label_ids_json
-            ))
-            self.conn.commit()
-            # print(f"Email {email_data['id']} inserted/updated successfully.")
+            # Convert list of label_ids to a comma-separated string for storage
+            label_ids_text = self._encode_label_ids(email_data.get('labelIds', ()))
+
+            with self._transaction():
+                self.cursor.execute(UPSERT_EMAIL_SQL, (
+                    email_data['id'],
+                    email_data['threadId'],
+                    email_data['From'],
+                    email_data['Subject'],
+                    received_date_time_str,
+                    self._encode_body(email_data['Message Body']),
+                    label_ids_text
+                ))
             return True
         except sqlite3.Error as e:
-            print(f"Error inserting/updating email {email_data.get('id')}: {e}")
-            self.conn.rollback()
+            logger.error(f"Error inserting/updating email {email_data.get('id')}: {e}")
             return False
 
-    def insert_many_emails(self, email_data_list):
+    def insert_many_emails(self, email_data_list, batch_size=DB_INSERT_BATCH_SIZE):
         """
         Inserts multiple email records into the 'emails' table in a single transaction.
         If an email with the same ID already exists, it updates the existing record.
         The 'Received Date/Time' field in email_data_list is expected to already be an ISO string.
 
+        Rows are sent to SQLite in chunks of `batch_size` so very large fetches do not
+        build one giant statement batch; all chunks are committed together.
+
         Args:
-            email_data_list (list): A list of dictionaries, where each dictionary
-                                    contains email details. The 'Received Date/Time'
-                                    should already be a string (from Email.to_dict()).
+            email_data_list (list): Either a list of dictionaries, where each dictionary
+                                    contains email details (the 'Received Date/Time'
+                                    should already be a string, as from Email.to_dict()),
+                                    or a list of tuples as produced by Email.to_row().
+            batch_size (int): Maximum number of rows sent to SQLite per chunk.
         Returns:
             int: The number of emails successfully inserted/updated.
         """
         if not email_data_list:
-            print("No emails provided for bulk insertion.")
+            logger.debug("No emails provided for bulk insertion.")
             return 0
 
-        data_to_insert = []
-        for email_data in email_data_list:
-            received_date_time_str = email_data['Received Date/Time']
-            label_ids_json = json.dumps(email_data.get('labelIds', []))
-            data_to_insert.append((
-                email_data['id'],
-                email_data['threadId'],
-                email_data['From'],
-                email_data['Subject'],
-                received_date_time_str,
-                email_data['Message Body'],
-                label_ids_json
-            ))
+        # Bind the encoders locally; the date is already an ISO string, so each row is a plain tuple build.
+        # The input type is checked once, outside the per-row loop.
+        encode_label_ids = self._encode_label_ids
+        encode_body = self._encode_body
+        if isinstance(email_data_list[0], tuple):
+            data_to_insert = [
+                (email_id, thread_id, from_address, subject, received, encode_body(body), encode_label_ids(label_ids))
+                for email_id, thread_id, from_address, subject, received, body, label_ids in email_data_list
+            ]
+        else:
+            data_to_insert = [
+                (
+                    e['id'],
+                    e['threadId'],
+                    e['From'],
+                    e['Subject'],
+                    e['Received Date/Time'],
+                    encode_body(e['Message Body']),
+                    encode_label_ids(e.get('labelIds', ()))
+                )
+                for e in email_data_list
+            ]
 
         try:
             if self.cursor is None:
                 raise sqlite3.Error("Database cursor is not available. Connection may be closed or failed.")
 
-            self.cursor.executemany(f'''
-                INSERT OR REPLACE INTO emails (id, thread_id, "from", subject, received_date_time, message_body, label_ids)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-            ''', data_to_insert)
-            self.conn.commit()
-            print(f"Successfully performed bulk insert/update of {len(email_data_list)} emails.")
+            with self._transaction():
+                for start in range(0, len(data_to_insert), batch_size):
+                    chunk = data_to_insert[start:start + batch_size]
+                    chunk_start_time = time.perf_counter()
+                    self._upsert_rows(chunk)
+                    logger.debug(
+                        "Inserted batch of %d emails in %.4fs.", len(chunk), time.perf_counter() - chunk_start_time
+                    )
+            logger.debug("Successfully performed bulk insert/update of %d emails.", len(email_data_list))
             return len(email_data_list)
         except (sqlite3.Error, AttributeError) as e:
-            print(f"Error during bulk insertion of emails: {e}")
-            if self.conn:
-                self.conn.rollback()
+            logger.error(f"Error during bulk insertion of emails: {e}")
             return 0
 
+    def _upsert_rows(self, rows):
+        """
+        Upserts encoded email rows with multi-row VALUES statements of up to
+        UPSERT_ROWS_PER_STATEMENT rows each; a shorter remainder goes in one final statement.
+
+        Args:
+            rows (list): Row tuples in the column order of the emails table.
+        """
+        flatten = itertools.chain.from_iterable
+        full_rows = len(rows) - len(rows) % UPSERT_ROWS_PER_STATEMENT
+        if full_rows:
+            self.cursor.executemany(UPSERT_EMAILS_MULTI_ROW_SQL, (
+                tuple(flatten(rows[start:start + UPSERT_ROWS_PER_STATEMENT]))
+                for start in range(0, full_rows, UPSERT_ROWS_PER_STATEMENT)
+            ))
+        if full_rows < len(rows):
+            tail = rows[full_rows:]
+            self.cursor.execute(_multi_row_upsert_sql(len(tail)), tuple(flatten(tail)))
+
+    def update_message_body(self, email_id, message_body):
+        """
+        Stores the message body for an existing email record.
+        Used when bodies are fetched on demand after a metadata-only fetch.
+
+        Args:
+            email_id (str): The ID of the email to update.
+            message_body (str): The plain text message body.
+        Returns:
+            bool: True if the operation was successful, False otherwise.
+        """
+        try:
+            with self._transaction():
+                self.cursor.execute(UPDATE_MESSAGE_BODY_SQL, (self._encode_body(message_body), email_id))
+            return True
+        except sqlite3.Error as e:
+            logger.error(f"Error updating message body for email {email_id}: {e}")
+            return False
+
+    def get_sync_state(self, key):
+        """
+        Retrieves a value from the 'sync_state' table.
+
+        Args:
+            key (str): The state key (e.g., 'history_id').
+
+        Returns:
+            str: The stored value, or None if the key is not set.
+        """
+        try:
+            self.cursor.execute('SELECT value FROM sync_state WHERE key = ?', (key,))
+            row = self.cursor.fetchone()
+            return row[0] if row else None
+        except sqlite3.Error as e:
+            logger.error(f"Error reading sync state '{key}': {e}")
+            return None
+
+    def set_sync_state(self, key, value):
+        """
+        Stores a value in the 'sync_state' table, replacing any previous value.
+
+        Args:
+            key (str): The state key (e.g., 'history_id').
+            value (str): The value to store.
+        Returns:
+            bool: True if the operation was successful, False otherwise.
+        """
+        try:
+            with self._transaction():
+                self.cursor.execute(
+                    'INSERT INTO sync_state (key, value) VALUES (?, ?) '
+                    'ON CONFLICT(key) DO UPDATE SET value = excluded.value',
+                    (key, value)
+                )
+            return True
+        except sqlite3.Error as e:
+            logger.error(f"Error writing sync state '{key}': {e}")
+            return False
+
+    def get_stored_email_ids(self):
+        """
+        Retrieves the IDs of all stored emails.
+
+        Returns:
+            set: The email IDs present in the 'emails' table.
+        """
+        try:
+            # Plain tuples are enough here; skip allocating a sqlite3.Row per ID
+            cursor = self.conn.cursor()
+            cursor.row_factory = None
+            return {row[0] for row in cursor.execute('SELECT id FROM emails')}
+        except sqlite3.Error as e:
+            logger.error(f"Error fetching stored email IDs: {e}")
+            return set()
+
     def get_all_emails(self):
         """
         Retrieves all email records from the 'emails' table.
@@ -167,37 +396,168 @@ class DatabaseManager:
                   label_ids JSON strings are converted back to lists.
         """
         try:
-            self.cursor.execute('SELECT * FROM emails')
-            rows = self.cursor.fetchall()
-            emails = []
-            for row in rows:
-                email_dict = dict(row)  # Convert Row object to dictionary
-
-                # Convert received_date_time string back to datetime object
-                if email_dict['received_date_time']:
-                    email_dict['received_date_time'] = datetime.fromisoformat(email_dict['received_date_time'])
-
-                # Convert label_ids JSON string back to list
-                if email_dict['label_ids']:
-                    try:
-                        email_dict['label_ids'] = json.loads(email_dict['label_ids'])
-                    except json.JSONDecodeError:
-                        email_dict['label_ids'] = []  # Handle malformed JSON
-                else:
-                    email_dict['label_ids'] = []
-
-                # Remap keys to match expected format for RuleEngine if needed
-                # Current keys are snake_case from DB. RuleEngine expects PascalCase for fields.
-                # It's better to process this mapping when building Email objects for RuleEngine.
-                emails.append(email_dict)
-            return emails
+            # Convert rows while iterating the cursor rather than materialising them all first
+            return [self._row_to_dict(row) for row in self.cursor.execute('SELECT * FROM emails')]
+        except sqlite3.Error as e:
+            logger.error(f"Error fetching all emails: {e}")
+            return []
+
+    def iter_email_tuples(self, include_body=True):
+        """
+        Lazily retrieves all email records as plain tuples in `Email.to_row()` column order:
+        (id, thread_id, from, subject, received_date_time, message_body, label_ids).
+
+        Skips the sqlite3.Row and dictionary built per row by `get_all_emails`, for callers
+        creating Email objects in bulk (see Email.from_db_tuple). Dates, bodies and label IDs
+        are decoded the same way.
+
+        Args:
+            include_body (bool): Whether to read the 'message_body' column. When False,
+                                 the message body of every tuple is None.
+
+        Yields:
+            tuple: One email record.
+        """
+        body_column = 'message_body' if include_body else 'NULL'
+        decode_body = self._decode_body
+        decode_label_ids = self._decode_label_ids
+        try:
+            # A dedicated cursor keeps the generator independent of self.cursor
+            cursor = self.conn.cursor()
+            cursor.row_factory = None
+            cursor.execute(
+                f'SELECT id, thread_id, "from", subject, received_date_time, {body_column}, label_ids FROM emails'
+            )
+            for email_id, thread_id, from_address, subject, received, body, label_ids in cursor:
+                yield (
+                    email_id,
+                    thread_id,
+                    from_address,
+                    subject,
+                    datetime.fromisoformat(received) if received else None,
+                    decode_body(body),
+                    decode_label_ids(label_ids)
+                )
         except sqlite3.Error as e:
-            print(f"Error fetching all emails: {e}")
+            logger.error(f"Error fetching email records: {e}")
+
+    @staticmethod
+    def _encode_body(message_body):
+        """
+        Prepares a message body for storage, compressing it with zlib when it is long.
+
+        Args:
+            message_body (str): The plain text message body, or None.
+
+        Returns:
+            str | bytes: The body unchanged, or its compressed UTF-8 bytes.
+        """
+        if message_body is None or len(message_body) < BODY_COMPRESSION_THRESHOLD:
+            return message_body
+        return zlib.compress(message_body.encode('utf-8'))
+
+    @staticmethod
+    def _decode_body(stored_body):
+        """
+        Restores a message body written by `_encode_body`.
+
+        Args:
+            stored_body (str | bytes): The stored value, or None.
+
+        Returns:
+            str: The plain text message body, or None.
+        """
+        if isinstance(stored_body, bytes):
+            return zlib.decompress(stored_body).decode('utf-8')
+        return stored_body
+
+    @staticmethod
+    def _encode_label_ids(label_ids):
+        """
+        Serializes label IDs for storage. Gmail label IDs never contain commas, so a
+        plain comma-separated string avoids JSON encoding on every row.
+
+        Args:
+            label_ids (iterable): The label IDs of an email.
+
+        Returns:
+            str: The comma-separated label IDs.
+        """
+        return ','.join(label_ids)
+
+    @staticmethod
+    def _decode_label_ids(label_ids_text):
+        """
+        Deserializes stored label IDs. Rows written before the comma-separated format
+        hold a JSON array and are still decoded as JSON.
+
+        Args:
+            label_ids_text (str): The stored label IDs, or None.
+
+        Returns:
+            list: The label IDs; empty if none are stored or legacy JSON is malformed.
+        """
+        if not label_ids_text:
             return []
+        if label_ids_text[0] in '[{':
+            try:
+                label_ids = json.loads(label_ids_text)
+            except json.JSONDecodeError:
+                return []  # Handle malformed legacy JSON
+            return label_ids if isinstance(label_ids, list) else []
+        return label_ids_text.split(',')
+
+    @staticmethod
+    def _row_to_dict(row):
+        """
+        Converts a database row into an email dictionary, deserializing the
+        received date and label IDs.
+
+        Args:
+            row (sqlite3.Row): A row from the 'emails' table.
+
+        Returns:
+            dict: The email dictionary.
+        """
+        email_dict = dict(row)  # Convert Row object to dictionary
+
+        # Convert received_date_time string back to datetime object
+        if email_dict['received_date_time']:
+            email_dict['received_date_time'] = datetime.fromisoformat(email_dict['received_date_time'])
+
+        # Decompress the message body if it was stored compressed
+        email_dict['message_body'] = DatabaseManager._decode_body(email_dict['message_body'])
+
+        # Convert label_ids string back to list
+        email_dict['label_ids'] = DatabaseManager._decode_label_ids(email_dict['label_ids'])
+
+        # Remap keys to match expected format for RuleEngine if needed
+        # Current keys are snake_case from DB. RuleEngine expects PascalCase for fields.
+        # It's better to process this mapping when building Email objects for RuleEngine.
+        return email_dict
 
     def close_connection(self):
-        """Closes the database connection."""
+        """
+        Closes the database connection. Safe to call more than once.
+        Checkpoints the WAL back into the database file and runs 'PRAGMA optimize'
+        first, so the next open starts from a compact file with fresh planner statistics.
+        """
         if self.conn:
+            try:
+                self.conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+                self.conn.execute('PRAGMA optimize')
+            except sqlite3.Error as e:
+                logger.error(f"Error optimizing database before close: {e}")
             self.conn.close()
-            print("Database connection closed.")
+            self.conn = None
+            self.cursor = None
+            logger.debug("Database connection closed.")
+
+    def __enter__(self):
+        """Allows use as a context manager; the connection is already open."""
+        return self
 
+    def __exit__(self, exc_type, exc_value, traceback):
+        """Closes the connection when leaving the `with` block."""
+        self.close_connection()
+        return False
@@ -3,9 +3,74 @@
 from gmail_client import GmailClient
 from database_manager import DatabaseManager
 from rule_engine import Email  # Only need Email class for object creation
-# import time # No longer needed for individual inserts
-from datetime import datetime  # For date parsing safeguard
-import email.utils  # For robust date parsing
+from datetime import datetime  # For date type safeguard
+import contextlib
+import logging
+import queue
+import threading
+from config import DB_WRITER_CHUNK_SIZE, DB_WRITER_QUEUE_SIZE, LOG_LEVEL
+
+# Key under which the last synced Gmail history ID is stored in the database
+HISTORY_ID_STATE_KEY = 'history_id'
+
+
+def _build_email_row(email_details):
+    """
+    Converts parsed Gmail message details into the row tuple stored in the database.
+
+    Args:
+        email_details (dict): Details as returned by GmailClient.
+
+    Returns:
+        tuple: The email row produced by Email.to_row().
+    """
+    # GmailClient parses the date already; anything but a datetime is stored as unknown
+    received_dt = email_details.get('Received Date/Time')
+    if not isinstance(received_dt, datetime):
+        received_dt = None
+
+    email_obj = Email(
+        id=email_details['id'],
+        thread_id=email_details['threadId'],
+        from_address=email_details['From'],
+        subject=email_details['Subject'],
+        received_date_time=received_dt,
+        message_body=email_details['Message Body'],
+        label_ids=email_details['labelIds']
+    )
+    return email_obj.to_row()
+
+
+def _db_writer(db_name, batch_queue, totals):
+    """
+    Writer thread body: stores queued email batches until it receives the None sentinel.
+
+    SQLite connections cannot be shared across threads, so the writer opens its own
+    DatabaseManager on the same database file.
+
+    Args:
+        db_name (str): The database file to write to.
+        batch_queue (queue.Queue): Queue of lists of email rows, terminated by None.
+        totals (dict): Shared counters; 'stored' is incremented by the rows written.
+    """
+    with contextlib.ExitStack() as stack:
+        writer_db = None
+        try:
+            writer_db = stack.enter_context(DatabaseManager(db_name=db_name))
+        except Exception as e:
+            print(f"Failed to initialize DatabaseManager for the writer thread: {e}")
+
+        # Keep draining the queue even without a connection so the producer never blocks forever
+        while True:
+            batch = batch_queue.get()
+            if batch is None:
+                break
+            if writer_db:
+                # A failed batch is not counted as stored, so the history ID is not advanced
+                try:
+                    totals['stored'] += writer_db.insert_many_emails(batch)
+                except Exception as e:
+                    print(f"Failed to store a batch of {len(batch)} emails: {e}")
 
 
 def fetch_and_store_emails():
@@ -15,78 +80,97 @@ def fetch_and_store_emails():
     """
     print("Starting email fetching and storage script...")
 
-    # 1. Initialize Gmail Client
-    gmail_client = None
-    try:
-        gmail_client = GmailClient()
-    except Exception as e:
-        print(f"Failed to initialize GmailClient: {e}")
-        print("Please ensure your 'credentials.json' is correctly set up and you have internet access.")
-        return  # Exit if GmailClient cannot be initialized
-
-    # 2. Initialize Database Manager
-    db_manager = None
-    try:
-        db_manager = DatabaseManager()
-    except Exception as e:
-        print(f"Failed to initialize DatabaseManager: {e}")
-        print("Please check your database configuration.")
-        if gmail_client:
-            del gmail_client
-        return  # Exit if DBManager cannot be initialized
-
-    # 3. Fetch Emails from Gmail
-    print("\nFetching emails from Gmail...")
-    #TODO: Fetching from 'in:inbox' for now. Can be modified to fetch 'all_mail' etc.
-    gmail_messages_ids = gmail_client.get_emails(query='in:inbox')
-
-    emails_to_store_in_db = []
-    if gmail_messages_ids:
-        print(f"Fetched {len(gmail_messages_ids)} message IDs from Gmail.")
-        for msg_id_dict in gmail_messages_ids:
-            message_id = msg_id_dict['id']
-            email_details = gmail_client.get_email_details(message_id)
-
-            if email_details:
-                # --- Safeguard for 'Received Date/Time' type consistency ---
-                received_dt = email_details.get('Received Date/Time')
-                if isinstance(received_dt, str):
-                    try:
-                        parsed_dt = email.utils.parsedate_to_datetime(received_dt)
-                        if parsed_dt:
-                            received_dt = parsed_dt
-                        else:
-                            received_dt = None
-                    except (ValueError, TypeError):
-                        received_dt = None
-                elif not isinstance(received_dt, datetime):
-                    received_dt = None
-                # --- End Safeguard ---
-
-                email_obj = Email(
-                    id=email_details['id'],
-                    thread_id=email_details['threadId'],
-                    from_address=email_details['From'],
-                    subject=email_details['Subject'],
-                    received_date_time=received_dt,
-                    message_body=email_details['Message Body'],
-                    label_ids=email_details['labelIds']
-                )
-                emails_to_store_in_db.append(email_obj.to_dict())
-
-        # Perform bulk insert after collecting all email data
-        if emails_to_store_in_db:
-            stored_count = db_manager.insert_many_emails(emails_to_store_in_db)
-            print(f"Successfully processed and stored {stored_count} emails in the database.")
+    # The ExitStack closes whatever was opened, in reverse order, however the function exits
+    with contextlib.ExitStack() as stack:
+        # 1. Initialize Gmail Client
+        try:
+            gmail_client = stack.enter_context(GmailClient())
+        except Exception as e:
+            print(f"Failed to initialize GmailClient: {e}")
+            print("Please ensure your 'credentials.json' is correctly set up and you have internet access.")
+            return  # Exit if GmailClient cannot be initialized
+
+        # 2. Initialize Database Manager
+        try:
+            db_manager = stack.enter_context(DatabaseManager())
+        except Exception as e:
+            print(f"Failed to initialize DatabaseManager: {e}")
+            print("Please check your database configuration.")
+            return  # Exit if DBManager cannot be initialized
+
+        # 3. Fetch Emails from Gmail
+        # After a previous run, only messages added since the recorded history ID are listed.
+        # Without a usable history ID, fall back to listing the inbox.
+        print("\nFetching emails from Gmail...")
+        history = None
+        last_history_id = db_manager.get_sync_state(HISTORY_ID_STATE_KEY)
+        if last_history_id:
+            history = gmail_client.get_history(last_history_id)
+
+        if history is not None:
+            gmail_messages_ids, new_history_id = history
+        else:
+            # Read the history ID before listing so messages arriving meanwhile are caught next run
+            new_history_id = gmail_client.get_current_history_id()
+            #TODO: Fetching from 'in:inbox' for now. Can be modified to fetch 'all_mail' etc.
+            gmail_messages_ids = gmail_client.get_emails(query='in:inbox')
+
+        # A failed listing (None) is not an empty mailbox: keep the old history ID so nothing is skipped
+        sync_succeeded = gmail_messages_ids is not None
+
+        emails_to_store_in_db = []
+        if gmail_messages_ids:
+            print(f"Fetched {len(gmail_messages_ids)} message IDs from Gmail.")
+
+            # Skip messages already stored by a previous run; only new ones need their details fetched
+            known_ids = db_manager.get_stored_email_ids()
+            gmail_messages_ids = [msg_id_dict for msg_id_dict in gmail_messages_ids if msg_id_dict['id'] not in known_ids]
+            print(f"{len(gmail_messages_ids)} of them are not yet stored in the database.")
+
+            # Fetch message details in batch HTTP requests instead of one round trip per message.
+            # Only headers are fetched here; bodies are loaded on demand by process_emails.py
+            # when a rule has a condition on the message body.
+            # Each chunk is stored by a writer thread while the next batches are downloaded.
+            message_ids = [msg_id_dict['id'] for msg_id_dict in gmail_messages_ids]
+            batch_queue = queue.Queue(maxsize=DB_WRITER_QUEUE_SIZE)
+            writer_totals = {'queued': 0, 'stored': 0}
+            writer = threading.Thread(target=_db_writer, args=(db_manager.db_name, batch_queue, writer_totals))
+            writer.start()
+            try:
+                for details_batch in gmail_client.iter_emails_details_batches(message_ids, include_body=False):
+                    emails_to_store_in_db.extend(
+                        _build_email_row(email_details) for email_details in details_batch if email_details
+                    )
+                    if len(emails_to_store_in_db) >= DB_WRITER_CHUNK_SIZE:
+                        writer_totals['queued'] += len(emails_to_store_in_db)
+                        batch_queue.put(emails_to_store_in_db)
+                        emails_to_store_in_db = []
+                if emails_to_store_in_db:
+                    writer_totals['queued'] += len(emails_to_store_in_db)
+                    batch_queue.put(emails_to_store_in_db)
+            finally:
+                batch_queue.put(None)  # Sentinel: no more batches
+                writer.join()
+
+            # Messages whose details could not be fetched are never queued, so compare against the request
+            sync_succeeded = writer_totals['stored'] == len(message_ids)
+            if writer_totals['queued']:
+                print(f"Successfully processed and stored {writer_totals['stored']} emails in the database.")
+            else:
+                print("No valid emails found to store after fetching.")
+        elif gmail_messages_ids is None:
+            print("Failed to list emails from Gmail; the sync state is left unchanged.")
         else:
-            print("No valid emails found to store after fetching.")
-    else:
-        print("No emails found in Gmail to store.")
+            print("No emails found in Gmail to store.")
+
+        # Record the history ID so the next run only fetches what changed since now
+        if sync_succeeded and new_history_id:
+            db_manager.set_sync_state(HISTORY_ID_STATE_KEY, new_history_id)
 
-    # Clean Up
-    db_manager.close_connection()
+    # Clean Up (connections were closed by the ExitStack)
     print("Email fetching and storage script finished.")
 
 
 if __name__ == "__main__":
+    logging.basicConfig(level=LOG_LEVEL, format='%(message)s')
     fetch_and_store_emails()
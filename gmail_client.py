@@ -2,7 +2,17 @@
 
 import os
 import base64
-import email
+import json
+import email.utils
+import importlib.util
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+import logging
+import httplib2
+from google_auth_httplib2 import AuthorizedHttp
 from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
@@ -11,7 +21,37 @@ from googleapiclient.errors import HttpError
 from bs4 import BeautifulSoup
 
 # Import configuration constants
-from config import CREDENTIALS_FILE, TOKEN_FILE, SCOPES, MAX_EMAIL_FETCH_RESULTS
+from config import CREDENTIALS_FILE, TOKEN_FILE, SCOPES, MAX_EMAIL_FETCH_RESULTS, GMAIL_BATCH_SIZE, MAX_API_WORKERS, \
+    API_NUM_RETRIES, LABEL_CACHE_FILE
+
+logger = logging.getLogger(__name__)
+
+# BeautifulSoup parser for HTML bodies: the C-based lxml when installed, else the stdlib parser.
+HTML_PARSER = 'lxml' if importlib.util.find_spec('lxml') is not None else 'html.parser'
+
+# Headers requested when fetching messages with format='metadata'.
+METADATA_HEADERS = ['From', 'Subject', 'Date', 'Message-ID']
+
+# Partial-response masks for `messages.get`, limited to the attributes _parse_message reads.
+# The trailing bare `parts` returns nested multipart trees in full.
+FULL_MESSAGE_FIELDS = 'id,threadId,labelIds,internalDate,payload(mimeType,headers(name,value),body/data,parts(mimeType,body/data,parts))'
+METADATA_MESSAGE_FIELDS = 'id,threadId,labelIds,internalDate,payload/headers(name,value)'
+
+# Access tokens expiring within this margin are refreshed up front rather than mid-run.
+TOKEN_REFRESH_MARGIN = timedelta(minutes=5)
+
+# HTTP statuses worth retrying: per-user rate limiting (429) and transient server errors.
+RETRYABLE_STATUSES = (429, 500, 502, 503, 504)
+
+# Upper bound, in seconds, on the backoff delay between retries of failed batch sub-requests.
+MAX_RETRY_DELAY = 32
+
+# Page size for `messages.list` (the API maximum) and the fields it needs to return.
+LIST_PAGE_SIZE = 500
+LIST_FIELDS = 'messages/id,nextPageToken'
+
+# Maximum number of message IDs accepted by a single messages.batchModify call.
+BATCH_MODIFY_MAX_IDS = 1000
 
 
 class GmailClient:
@@ -23,14 +63,42 @@ class GmailClient:
     and moving messages, and applying labels.
     """
 
-    def __init__(self):
+    # Bound once at class level so decoding a body skips the module attribute lookup
+    _b64decode = staticmethod(base64.urlsafe_b64decode)
+
+    def __init__(self, label_cache_file=LABEL_CACHE_FILE):
         """
         Initializes the GmailClient, authenticates with Gmail API,
         and builds the service object.
+
+        Args:
+            label_cache_file (str, optional): JSON file persisting the label name to ID mapping
+                                              between runs. None disables the on-disk cache.
         """
         self.creds = None
         self.service = self._authenticate()
-        self.label_id_map = {}  # Cache for label name to ID mapping
+        self.label_cache_file = label_cache_file
+        self.label_id_map = {}  # Cache for upper-cased label name to ID mapping (None if not found)
+        self._labels_primed = False  # Whether label_id_map holds every label of the account
+        self._labels_from_disk = False  # Whether label_id_map was loaded from label_cache_file
+        self._account_email = None  # Address of the authenticated account, keying label_cache_file
+        self._label_id_remap = {}  # Cached label IDs found changed by _refresh_label_cache
+        self._label_refresh_lock = threading.Lock()  # Label changes may be applied from several threads
+        self._thread_local = threading.local()  # Per-thread HTTP transports for concurrent calls
+
+    def __enter__(self):
+        """Allows use as a context manager; the client is already authenticated."""
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """Closes the service's HTTP connections when leaving the `with` block."""
+        self.close()
+        return False
+
+    def close(self):
+        """Closes the underlying HTTP connections of the Gmail service."""
+        if self.service is not None:
+            self.service.close()
 
     def _authenticate(self):
         """
@@ -46,42 +114,65 @@ class GmailClient:
             IOError: If `credentials.json` is not found.
             Exception: For other authentication-related errors.
         """
-        print("Authenticating with Gmail API...")
+        logger.info("Authenticating with Gmail API...")
 
         # The token.json stores the user's access and refresh tokens, and is
         # created automatically when the authorization flow completes for the first
         # time.
         if os.path.exists(TOKEN_FILE):
             self.creds = Credentials.from_authorized_user_file(TOKEN_FILE, SCOPES)
+        saved_token = self.creds.to_json() if self.creds else None
 
+        # Refresh tokens that expired or are about to, so a run does not hit a 401 midway.
         # If there are no (valid) credentials available, let the user log in.
-        if not self.creds or not self.creds.valid:
-            if self.creds and self.creds.expired and self.creds.refresh_token:
-                self.creds.refresh(Request())
-            else:
-                if not os.path.exists(CREDENTIALS_FILE):
-                    raise IOError(
-                        f"'{CREDENTIALS_FILE}' not found. "
-                        "Please download your OAuth client JSON from Google Cloud Console "
-                        "and place it in the project directory."
-                    )
-                flow = InstalledAppFlow.from_client_secrets_file(CREDENTIALS_FILE, SCOPES)
-                self.creds = flow.run_local_server(port=0)
-            # Save the credentials for the next run
-            with open(TOKEN_FILE, 'w') as token:
-                token.write(self.creds.to_json())
+        if self.creds and self.creds.refresh_token and (self.creds.expired or self._expires_soon(self.creds)):
+            self.creds.refresh(Request())
+        elif not self.creds or not self.creds.valid:
+            if not os.path.exists(CREDENTIALS_FILE):
+                raise IOError(
+                    f"'{CREDENTIALS_FILE}' not found. "
+                    "Please download your OAuth client JSON from Google Cloud Console "
+                    "and place it in the project directory."
+                )
+            flow = InstalledAppFlow.from_client_secrets_file(CREDENTIALS_FILE, SCOPES)
+            self.creds = flow.run_local_server(port=0)
+
+        # Save the credentials for the next run, only if they changed
+        token = self.creds.to_json()
+        if token != saved_token:
+            with open(TOKEN_FILE, 'w') as token_file:
+                token_file.write(token)
 
         try:
-            service = build('gmail', 'v1', credentials=self.creds)
-            print("Gmail API authentication successful.")
+            # The discovery document bundled with googleapiclient avoids fetching it over HTTP
+            service = build('gmail', 'v1', credentials=self.creds, static_discovery=True)
+            logger.info("Gmail API authentication successful.")
             return service
         except HttpError as error:
-            print(f"An HTTP error occurred during authentication: {error}")
+            logger.error(f"An HTTP error occurred during authentication: {error}")
             raise
         except Exception as e:
-            print(f"An unexpected error occurred during authentication: {e}")
+            logger.error(f"An unexpected error occurred during authentication: {e}")
             raise
 
+    @staticmethod
+    def _expires_soon(creds):
+        """
+        Checks whether an access token expires within `TOKEN_REFRESH_MARGIN`.
+
+        Args:
+            creds (google.oauth2.credentials.Credentials): The credentials to check.
+
+        Returns:
+            bool: True if the token's expiry is known and falls within the margin.
+        """
+        expiry = creds.expiry
+        if not isinstance(expiry, datetime):
+            return False
+        # google-auth stores expiry as a naive UTC datetime
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        return expiry - now < TOKEN_REFRESH_MARGIN
+
     def get_emails(self, query='in:inbox', max_results=MAX_EMAIL_FETCH_RESULTS):
         """
         Fetches a list of email messages from the user's Gmail account.
@@ -91,36 +182,131 @@ class GmailClient:
             max_results (int): Maximum number of email messages to retrieve.
 
         Returns:
-            list: A list of dictionaries, where each dictionary represents an email
-                  with 'id', 'threadId', and 'labelIds' (if available).
-                  Returns an empty list if no messages are found or an error occurs.
+            list: A list of dictionaries, where each dictionary represents an email with its 'id'.
+                  Returns an empty list if no messages are found, or None if an error occurs
+                  so callers can tell a failed listing from an empty mailbox.
         """
-        print(f"Fetching emails with query '{query}' (max results: {max_results})...")
+        logger.info(f"Fetching emails with query '{query}' (max results: {max_results})...")
+        messages = []
         try:
-            # Call the Gmail API to fetch messages
-            results = self.service.users().messages().list(userId='me', q=query, maxResults=max_results).execute()
-            messages = results.get('messages', [])
+            for page in self.iter_emails(query, page_size=min(max_results, LIST_PAGE_SIZE)):
+                messages.extend(page[:max_results - len(messages)])
+                if len(messages) >= max_results:
+                    break
+        except HttpError as error:
+            logger.error(f'An HTTP error occurred while fetching emails: {error}')
+            return None
+        except Exception as e:
+            logger.error(f"An unexpected error occurred while fetching emails: {e}")
+            return None
+
+        if not messages:
+            logger.info('No messages found.')
+            return []
+
+        logger.info(f'Fetched {len(messages)} message IDs.')
+        return messages
 
-            if not messages:
-                print('No messages found.')
-                return []
+    def iter_emails(self, query='in:inbox', page_size=LIST_PAGE_SIZE):
+        """
+        Lazily lists all messages matching a query, one page of `messages.list` at a time,
+        following `nextPageToken` until the last page.
 
-            print(f'Fetched {len(messages)} message IDs.')
-            return messages
+        Args:
+            query (str): Gmail search query string.
+            page_size (int): Number of message IDs requested per page (Gmail allows at most 500).
+
+        Yields:
+            list: One page of dictionaries, each holding a message 'id'.
+
+        Raises:
+            HttpError: If a page cannot be fetched, so a partial listing is never
+                       mistaken for a complete one.
+        """
+        page_token = None
+        while True:
+            request_args = {'userId': 'me', 'q': query, 'maxResults': page_size, 'fields': LIST_FIELDS}
+            if page_token:
+                request_args['pageToken'] = page_token
+            results = self.service.users().messages().list(**request_args).execute(num_retries=API_NUM_RETRIES)
+            yield results.get('messages', [])
+            page_token = results.get('nextPageToken')
+            if not page_token:
+                return
+
+    def get_current_history_id(self):
+        """
+        Retrieves the mailbox's current history ID, the starting point for a later
+        incremental sync with `get_history`.
 
+        Returns:
+            str: The current history ID, or None if it cannot be retrieved.
+        """
+        try:
+            profile = self.service.users().getProfile(userId='me').execute(num_retries=API_NUM_RETRIES)
+            return profile.get('historyId')
         except HttpError as error:
-            print(f'An HTTP error occurred while fetching emails: {error}')
-            return []
+            logger.error(f'An HTTP error occurred while getting the mailbox profile: {error}')
+            return None
         except Exception as e:
-            print(f"An unexpected error occurred while fetching emails: {e}")
-            return []
+            logger.error(f"An unexpected error occurred while getting the mailbox profile: {e}")
+            return None
+
+    def get_history(self, start_history_id, label_id='INBOX'):
+        """
+        Lists the messages added to a label since a previous history ID.
+
+        Args:
+            start_history_id (str): The history ID recorded after the previous sync.
+            label_id (str): Only report messages added with this label.
+
+        Returns:
+            tuple: (messages, history_id) where messages is a list of dictionaries with
+                   'id' and 'threadId' (same shape as `get_emails`) and history_id is the
+                   latest history ID to record for the next sync.
+                   Returns None if the history is unavailable (e.g. the start ID is too
+                   old and Gmail answers 404), in which case a full fetch is required.
+        """
+        logger.info(f"Fetching mailbox history since history ID {start_history_id}...")
+        messages = {}
+        history_id = start_history_id
+        page_token = None
+        try:
+            while True:
+                results = self.service.users().history().list(
+                    userId='me', startHistoryId=start_history_id, labelId=label_id,
+                    historyTypes=['messageAdded'], pageToken=page_token
+                ).execute(num_retries=API_NUM_RETRIES)
+                for record in results.get('history', []):
+                    for added in record.get('messagesAdded', []):
+                        message = added['message']
+                        messages[message['id']] = {'id': message['id'], 'threadId': message['threadId']}
+                history_id = results.get('historyId', history_id)
+                page_token = results.get('nextPageToken')
+                if not page_token:
+                    break
+        except HttpError as error:
+            if error.resp.status == 404:
+                logger.info(f"History ID {start_history_id} is too old; a full fetch is required.")
+            else:
+                logger.error(f'An HTTP error occurred while fetching history: {error}')
+            return None
+        except Exception as e:
+            logger.error(f"An unexpected error occurred while fetching history: {e}")
+            return None
+
+        logger.info(f'Found {len(messages)} new message IDs in history.')
+        return list(messages.values()), history_id
 
-    def get_email_details(self, message_id):
+    def get_email_details(self, message_id, include_body=True):
         """
-        Retrieves the full details of a specific email message.
+        Retrieves the details of a specific email message.
 
         Args:
             message_id (str): The ID of the email message to retrieve.
+            include_body (bool): If True, fetch the full payload and extract the message body.
+                                 If False, fetch only the metadata headers; 'Message Body'
+                                 is then None and can be loaded later with `hydrate_bodies`.
 
         Returns:
             dict: A dictionary containing parsed email details (id, threadId, From,
@@ -128,52 +314,270 @@ class GmailClient:
                   Returns None if the message cannot be retrieved or parsed.
         """
         try:
-            # Fetch full message payload
-            message = self.service.users().messages().get(userId='me', id=message_id, format='full').execute()
-
-            headers = message['payload']['headers']
-            msg_data = {
-                'id': message['id'],
-                'threadId': message['threadId'],
-                'labelIds': message.get('labelIds', []),
-                'From': None,
-                'Subject': None,
-                'Received Date/Time': None,
-                'Message Body': None,
-            }
-
-            for header in headers:
-                if header['name'] == 'From':
-                    msg_data['From'] = header['value']
-                elif header['name'] == 'Subject':
-                    msg_data['Subject'] = header['value']
-                elif header['name'] == 'Date':
-                    try:
-                        # Parse date string to datetime object
-                        # Example format: 'Wed, 18 Jun 2025 14:43:00 +0530'
-                        parsed_date = email.utils.parsedate_to_datetime(header['value'])
-                        msg_data['Received Date/Time'] = parsed_date
-                    except ValueError:
-                        msg_data['Received Date/Time'] = None  # Could not parse date
-
-            # Extract message body
-            msg_data['Message Body'] = self._get_message_body(message['payload'])
-
-            return msg_data
+            message = self._get_message_request(message_id, include_body).execute(num_retries=API_NUM_RETRIES)
+            return self._parse_message(message, include_body)
 
         except HttpError as error:
-            print(f'An HTTP error occurred while getting email details for {message_id}: {error}')
+            logger.error(f'An HTTP error occurred while getting email details for {message_id}: {error}')
             return None
         except Exception as e:
-            print(f"An unexpected error occurred while getting email details for {message_id}: {e}")
+            logger.error(f"An unexpected error occurred while getting email details for {message_id}: {e}")
             return None
 
+    def get_emails_details_batch(self, message_ids, batch_size=GMAIL_BATCH_SIZE, include_body=True):
+        """
+        Retrieves the details of many email messages using Gmail batch HTTP requests.
+
+        Message IDs are grouped into batches of `batch_size`, so N messages cost
+        roughly N / batch_size round trips instead of N.
+
+        Args:
+            message_ids (list): The IDs of the email messages to retrieve.
+            batch_size (int): Maximum number of message requests per batch HTTP call.
+            include_body (bool): Whether to fetch full payloads including the message body
+                                 (see `get_email_details`).
+
+        Returns:
+            list: A list of parsed email detail dictionaries (same shape as
+                  `get_email_details`), in the order of `message_ids`. Messages
+                  that could not be retrieved or parsed are omitted.
+        """
+        return [
+            details
+            for batch in self.iter_emails_details_batches(message_ids, batch_size, include_body)
+            for details in batch
+        ]
+
+    def iter_emails_details_batches(self, message_ids, batch_size=GMAIL_BATCH_SIZE, include_body=True):
+        """
+        Lazily retrieves message details one batch HTTP request at a time.
+
+        Lets callers process (e.g. store) each batch while the next one is being
+        fetched. Arguments are the same as for `get_emails_details_batch`.
+
+        Yields:
+            list: The parsed email detail dictionaries of one batch, in the order of
+                  `message_ids`. Messages that could not be retrieved or parsed are omitted.
+        """
+        results = {}
+
+        def collect(request_id, response, exception):
+            if exception is not None:
+                logger.error(f'An error occurred while getting email details for {request_id}: {exception}')
+                return
+            try:
+                results[request_id] = self._parse_message(response, include_body)
+            except Exception as e:
+                logger.error(f"An unexpected error occurred while parsing email details for {request_id}: {e}")
+
+        for start in range(0, len(message_ids), batch_size):
+            chunk = message_ids[start:start + batch_size]
+            self._execute_batch(
+                chunk, lambda message_id: self._get_message_request(message_id, include_body), collect
+            )
+            yield [results.pop(message_id) for message_id in chunk if message_id in results]
+
+    def _execute_batch(self, request_ids, make_request, callback):
+        """
+        Executes one request per ID as a single batch HTTP request.
+
+        Sub-requests failing with a status in `RETRYABLE_STATUSES` (and the whole batch, if the
+        batch call itself fails that way) are retried in a smaller batch after an exponential
+        backoff, up to `API_NUM_RETRIES` times.
+
+        Args:
+            request_ids (list): IDs identifying the sub-requests (e.g. message IDs).
+            make_request (callable): Builds the HttpRequest for an ID. Called again on each retry.
+            callback (callable): Called as callback(request_id, response, exception) once per ID
+                                 with its final outcome.
+        """
+        pending = list(request_ids)
+        for attempt in range(API_NUM_RETRIES + 1):
+            retry_ids = []
+            retry_after = [0]
+            last_attempt = attempt == API_NUM_RETRIES
+
+            def on_response(request_id, response, exception):
+                if not last_attempt and self._is_retryable(exception):
+                    retry_ids.append(request_id)
+                    retry_after[0] = max(retry_after[0], self._retry_after(exception))
+                else:
+                    callback(request_id, response, exception)
+
+            batch = self.service.new_batch_http_request(callback=on_response)
+            for request_id in pending:
+                batch.add(make_request(request_id), request_id=request_id)
+            try:
+                # Per-thread transport: batches may be sent from worker threads (see process_emails.py)
+                batch.execute(http=self._thread_http())
+            except HttpError as error:
+                if last_attempt or not self._is_retryable(error):
+                    logger.error(f'An HTTP error occurred while executing batch request: {error}')
+                    return
+                # The batch call itself was throttled: none of the sub-requests ran
+                retry_ids = pending
+                retry_after[0] = self._retry_after(error)
+            except Exception as e:
+                logger.error(f"An unexpected error occurred while executing batch request: {e}")
+                return
+
+            if not retry_ids:
+                return
+            delay = max(retry_after[0], min(2 ** attempt + random.random(), MAX_RETRY_DELAY))
+            logger.warning(f"Retrying {len(retry_ids)} throttled or failed requests in {delay:.1f}s...")
+            time.sleep(delay)
+            pending = retry_ids
+
+    @staticmethod
+    def _is_retryable(error):
+        """
+        Checks whether an error is a transient HTTP error worth retrying.
+
+        Args:
+            error (Exception): The error raised for a request, or None.
+
+        Returns:
+            bool: True if it is an HttpError with a status in `RETRYABLE_STATUSES`.
+        """
+        return isinstance(error, HttpError) and error.resp.status in RETRYABLE_STATUSES
+
+    @staticmethod
+    def _retry_after(error):
+        """
+        Reads the delay requested by the server's Retry-After header, in seconds.
+
+        Args:
+            error (HttpError): The error carrying the response.
+
+        Returns:
+            int: The requested delay, or 0 if the header is absent or not a number of seconds.
+        """
+        try:
+            return int(error.resp.get('retry-after', 0))
+        except (TypeError, ValueError):
+            return 0
+
+    def hydrate_bodies(self, message_ids, batch_size=GMAIL_BATCH_SIZE):
+        """
+        Fetches the bodies of many messages using Gmail batch HTTP requests.
+
+        Args:
+            message_ids (list): The IDs of the email messages.
+            batch_size (int): Maximum number of message requests per batch HTTP call.
+
+        Returns:
+            dict: A mapping of message ID to plain text body. Messages that could not
+                  be retrieved are omitted.
+        """
+        return {
+            details['id']: details['Message Body']
+            for batch in self.iter_emails_details_batches(message_ids, batch_size, include_body=True)
+            for details in batch
+        }
+
+    def _thread_http(self):
+        """
+        Returns an authorized HTTP transport owned by the calling thread.
+        httplib2 transports are not thread-safe, so concurrent requests must not share
+        the service's default transport.
+
+        Returns:
+            google_auth_httplib2.AuthorizedHttp: The calling thread's transport.
+        """
+        http = getattr(self._thread_local, 'http', None)
+        if http is None:
+            http = AuthorizedHttp(self.creds, http=httplib2.Http())
+            self._thread_local.http = http
+        return http
+
+    def _get_message_request(self, message_id, include_body):
+        """
+        Builds (without executing) the `messages.get` request for a message.
+
+        Args:
+            message_id (str): The ID of the email message.
+            include_body (bool): True for format='full', False for format='metadata'
+                                 restricted to `METADATA_HEADERS`. Either way the response is
+                                 trimmed to the fields the parser uses.
+
+        Returns:
+            googleapiclient.http.HttpRequest: The request object.
+        """
+        messages = self.service.users().messages()
+        if include_body:
+            return messages.get(userId='me', id=message_id, format='full', fields=FULL_MESSAGE_FIELDS)
+        return messages.get(userId='me', id=message_id, format='metadata', metadataHeaders=METADATA_HEADERS,
+                            fields=METADATA_MESSAGE_FIELDS)
+
+    def _parse_message(self, message, include_body=True):
+        """
+        Parses a Gmail message resource into the email details dictionary.
+
+        Args:
+            message (dict): A message resource returned by `messages.get`.
+            include_body (bool): Whether the resource carries the full payload to extract the body from.
+
+        Returns:
+            dict: A dictionary containing parsed email details (id, threadId, From,
+                  Subject, Received Date/Time, Message Body, labelIds).
+        """
+        headers = message['payload']['headers']
+        msg_data = {
+            'id': message['id'],
+            'threadId': message['threadId'],
+            'labelIds': message.get('labelIds', []),
+            'From': None,
+            'Subject': None,
+            'Received Date/Time': None,
+            'Message Body': None,
+        }
+
+        # Prefer Gmail's internalDate (epoch milliseconds): it is the time Gmail received
+        # the message and needs only an integer parse. The RFC 2822 'Date' header is
+        # used only when internalDate is missing.
+        internal_date = message.get('internalDate')
+        if internal_date is not None:
+            msg_data['Received Date/Time'] = datetime.fromtimestamp(int(internal_date) / 1000, tz=timezone.utc)
+
+        header_values = self._extract_headers(headers, ('From', 'Subject', 'Date'))
+        msg_data['From'] = header_values['From']
+        msg_data['Subject'] = header_values['Subject']
+        date_value = header_values['Date']
+        if internal_date is None and date_value:
+            try:
+                # Parse date string to datetime object
+                # Example format: 'Wed, 18 Jun 2025 14:43:00 +0530'
+                msg_data['Received Date/Time'] = email.utils.parsedate_to_datetime(date_value)
+            except (ValueError, TypeError):
+                msg_data['Received Date/Time'] = None  # Could not parse date
+
+        # Extract message body (left as None for metadata-only fetches)
+        if include_body:
+            msg_data['Message Body'] = self._get_message_body(message['payload'])
+
+        return msg_data
+
+    @staticmethod
+    def _extract_headers(headers, names):
+        """
+        Looks up several headers of a message at once.
+
+        Args:
+            headers (list): The 'headers' list of a message payload ({'name': ..., 'value': ...} dicts).
+            names (iterable): Header names to look up.
+
+        Returns:
+            dict: Each requested name mapped to its value, or None if the header is absent.
+        """
+        header_map = {header['name']: header['value'] for header in headers}
+        return {name: header_map.get(name) for name in names}
+
     def _get_message_body(self, payload):
         """
         Extracts the plain text message body from the email payload.
 
-        Handles various MIME types (text/plain, text/html, multipart).
-        Prioritizes text/plain, then converts HTML to text if only HTML is available.
+        Walks the MIME tree (text/plain, text/html, nested multiparts) once, depth-first in
+        document order. Prioritizes text/plain, then converts HTML to text if only HTML is available.
 
         Args:
             payload (dict): The 'payload' dictionary from a Gmail message.
@@ -181,42 +585,43 @@ class GmailClient:
         Returns:
             str: The plain text content of the email body, or an empty string if not found.
         """
-        parts = payload.get('parts')
-        if parts:
-            # Look for text/plain part first
-            for part in parts:
-                mime_type = part.get('mimeType')
-                if mime_type == 'text/plain':
-                    data = part['body'].get('data')
-                    if data:
-                        return base64.urlsafe_b64decode(data).decode('utf-8')
-                elif mime_type == 'multipart/alternative':
-                    # Recursively search in multipart alternatives
-                    text_body = self._get_message_body(part)
-                    if text_body:
-                        return text_body
-
-            # If no text/plain, try to extract from text/html
-            for part in parts:
-                mime_type = part.get('mimeType')
-                if mime_type == 'text/html':
-                    data = part['body'].get('data')
-                    if data:
-                        html_content = base64.urlsafe_b64decode(data).decode('utf-8')
-                        soup = BeautifulSoup(html_content, 'html.parser')
-                        return soup.get_text()  # Convert HTML to plain text
-
-        # Fallback for messages with no parts (e.g., simple text emails)
+        b64decode = self._b64decode
+        plain_data = None
+        html_data = None
+        stack = [payload]
+        while stack:
+            part = stack.pop()
+            mime_type = part.get('mimeType', '')
+            if mime_type == 'text/plain':
+                plain_data = (part.get('body') or {}).get('data')
+                if plain_data:
+                    break  # Nothing can beat the first text/plain part
+            elif mime_type == 'text/html':
+                if html_data is None:
+                    html_data = (part.get('body') or {}).get('data')
+            elif part.get('parts'):
+                stack.extend(reversed(part['parts']))  # Reversed so parts are popped in order
+
+        if plain_data:
+            return b64decode(plain_data).decode('utf-8', errors='replace')
+        if html_data:
+            html_content = b64decode(html_data).decode('utf-8', errors='replace')
+            soup = BeautifulSoup(html_content, HTML_PARSER)
+            return soup.get_text()  # Convert HTML to plain text
+
+        # Fallback for payloads without a recognised MIME type (e.g., simple text emails)
         body = payload.get('body')
         if body and body.get('data'):
-            return base64.urlsafe_b64decode(body['data']).decode('utf-8')
+            return b64decode(body['data']).decode('utf-8', errors='replace')
 
         return ""  # Return empty string if no body content is found
 
-    def _get_label_id(self, label_name):
+    def get_label_id(self, label_name):
         """
-        Retrieves the ID for a given Gmail label name.
-        Caches results to avoid repeated API calls.
+        Retrieves the ID for a given Gmail label name (case-insensitive).
+        The first lookup loads every label at once, from `label_cache_file` if a previous run
+        saved it, otherwise with a single labels.list call. Later lookups, including those for
+        names that do not exist, are answered from the cache.
 
         Args:
             label_name (str): The display name of the Gmail label (e.g., 'Inbox', 'Promotions').
@@ -224,27 +629,131 @@ class GmailClient:
         Returns:
             str: The ID of the label, or None if the label is not found.
         """
-        if label_name in self.label_id_map:
-            return self.label_id_map[label_name]
-
-        print(f"Attempting to find label ID for '{label_name}'...")
+        key = label_name.upper()
+        if key not in self.label_id_map:
+            if not self._labels_primed:
+                self._load_label_cache()
+            # A name missing from a cache saved by an earlier run may be a label created since
+            if key not in self.label_id_map and (not self._labels_primed or self._labels_from_disk):
+                self._prime_label_cache()
+            if self._labels_primed:
+                # Remember misses too, so a rule naming a nonexistent label does not re-list labels
+                self.label_id_map.setdefault(key, None)
+                if self.label_id_map[key] is None:
+                    logger.warning(f"Label '{label_name}' not found.")
+        return self.label_id_map.get(key)
+
+    def _prime_label_cache(self):
+        """
+        Fills the label cache with every label of the account, keyed by upper-cased name,
+        and saves it to `label_cache_file`. On failure the cache is left as it was so the
+        next lookup tries again.
+        """
+        logger.info("Fetching Gmail labels...")
         try:
-            results = self.service.users().labels().list(userId='me').execute()
-            labels = results.get('labels', [])
-
-            for label in labels:
-                if label['name'].upper() == label_name.upper():  # Case-insensitive match
-                    self.label_id_map[label_name] = label['id']  # Cache the ID
-                    print(f"Found label ID for '{label_name}': {label['id']}")
-                    return label['id']
-            print(f"Label '{label_name}' not found.")
-            return None
+            results = self.service.users().labels().list(userId='me').execute(num_retries=API_NUM_RETRIES)
+            self.label_id_map = {label['name'].upper(): label['id'] for label in results.get('labels', [])}
+            self._labels_primed = True
+            self._labels_from_disk = False
         except HttpError as error:
-            print(f"An HTTP error occurred while listing labels: {error}")
-            return None
+            logger.error(f"An HTTP error occurred while listing labels: {error}")
+            return
         except Exception as e:
-            print(f"An unexpected error occurred while getting label ID: {e}")
-            return None
+            logger.error(f"An unexpected error occurred while getting label ID: {e}")
+            return
+        self._save_label_cache()
+
+    def _refresh_label_cache(self):
+        """
+        Lists the labels again after Gmail rejected a label ID, in case it came from a cache
+        saved by an earlier run and the label has since been deleted or recreated.
+
+        Returns:
+            dict: Cached label ID to current label ID (None if the label no longer exists), for
+                  every cached label whose ID changed. Empty if the cache was never loaded from
+                  disk (it is then already current) or the labels cannot be listed.
+        """
+        with self._label_refresh_lock:
+            if self._labels_from_disk:
+                stale_map = self.label_id_map
+                self._prime_label_cache()
+                if not self._labels_from_disk:  # Otherwise listing failed and the stale cache was kept
+                    self._label_id_remap = {
+                        label_id: self.label_id_map.get(name)
+                        for name, label_id in stale_map.items()
+                        if label_id is not None and self.label_id_map.get(name) != label_id
+                    }
+            return self._label_id_remap
+
+    def _get_account_email(self):
+        """
+        Retrieves the address of the authenticated account, once per client.
+
+        Returns:
+            str: The account's email address, or None if the profile cannot be retrieved.
+        """
+        if self._account_email is None:
+            try:
+                profile = self.service.users().getProfile(userId='me').execute(num_retries=API_NUM_RETRIES)
+                self._account_email = profile.get('emailAddress')
+            except HttpError as error:
+                logger.error(f'An HTTP error occurred while getting the mailbox profile: {error}')
+            except Exception as e:
+                logger.error(f"An unexpected error occurred while getting the mailbox profile: {e}")
+        return self._account_email
+
+    def _read_label_cache_file(self):
+        """
+        Reads every account's saved labels from `label_cache_file`.
+
+        Returns:
+            dict: Account email address to that account's label name to ID mapping.
+                  Empty if the file is missing or unreadable.
+        """
+        if not os.path.exists(self.label_cache_file):
+            return {}
+        try:
+            with open(self.label_cache_file, 'r', encoding='utf-8') as f:
+                accounts = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable label cache '{self.label_cache_file}': {e}")
+            return {}
+        return accounts if isinstance(accounts, dict) else {}
+
+    def _load_label_cache(self):
+        """
+        Loads the label cache saved by a previous run for the authenticated account, if there is one.
+        A missing or unreadable file is ignored; labels are then listed from the API.
+        """
+        if not self.label_cache_file:
+            return
+        account_email = self._get_account_email()
+        if not account_email:
+            return  # Without knowing the account, labels saved for another mailbox could be used
+        label_id_map = self._read_label_cache_file().get(account_email)
+        if isinstance(label_id_map, dict):
+            self.label_id_map = label_id_map
+            self._labels_primed = True
+            self._labels_from_disk = True
+
+    def _save_label_cache(self):
+        """
+        Writes the labels listed from the API to `label_cache_file`, under the authenticated
+        account's address, for the next run. Labels saved for other accounts are kept.
+        Failing to write only costs the next run a labels.list call, so errors are reported and ignored.
+        """
+        if not self.label_cache_file:
+            return
+        account_email = self._get_account_email()
+        if not account_email:
+            return
+        accounts = self._read_label_cache_file()
+        accounts[account_email] = self.label_id_map
+        try:
+            with open(self.label_cache_file, 'w', encoding='utf-8') as f:
+                json.dump(accounts, f)
+        except OSError as e:
+            logger.warning(f"Could not save label cache '{self.label_cache_file}': {e}")
 
     def mark_as_read(self, message_id):
         """
@@ -256,20 +765,16 @@ class GmailClient:
         Returns:
             bool: True if successful, False otherwise.
         """
-        print(f"Marking email {message_id} as read...")
+        logger.debug(f"Marking email {message_id} as read...")
         try:
-            self.service.users().messages().modify(
-                userId='me',
-                id=message_id,
-                body={'removeLabelIds': ['UNREAD']}
-            ).execute()
-            print(f"Email {message_id} marked as read successfully.")
+            self._modify(message_id, remove_label_ids=['UNREAD'])
+            logger.debug(f"Email {message_id} marked as read successfully.")
             return True
         except HttpError as error:
-            print(f"An HTTP error occurred while marking email {message_id} as read: {error}")
+            logger.error(f"An HTTP error occurred while marking email {message_id} as read: {error}")
             return False
         except Exception as e:
-            print(f"An unexpected error occurred while marking email {message_id} as read: {e}")
+            logger.error(f"An unexpected error occurred while marking email {message_id} as read: {e}")
             return False
 
     def mark_as_unread(self, message_id):
@@ -282,23 +787,19 @@ class GmailClient:
         Returns:
             bool: True if successful, False otherwise.
         """
-        print(f"Marking email {message_id} as unread...")
+        logger.debug(f"Marking email {message_id} as unread...")
         try:
-            self.service.users().messages().modify(
-                userId='me',
-                id=message_id,
-                body={'addLabelIds': ['UNREAD']}
-            ).execute()
-            print(f"Email {message_id} marked as unread successfully.")
+            self._modify(message_id, add_label_ids=['UNREAD'])
+            logger.debug(f"Email {message_id} marked as unread successfully.")
             return True
         except HttpError as error:
-            print(f"An HTTP error occurred while marking email {message_id} as unread: {error}")
+            logger.error(f"An HTTP error occurred while marking email {message_id} as unread: {error}")
             return False
         except Exception as e:
-            print(f"An unexpected error occurred while marking email {message_id} as unread: {e}")
+            logger.error(f"An unexpected error occurred while marking email {message_id} as unread: {e}")
             return False
 
-    def move_message(self, message_id, destination_mailbox):
+    def move_message(self, message_id, destination_mailbox, current_label_ids=None):
         """
         Moves an email message to a specified mailbox (label).
         This involves removing it from INBOX (if present) and adding to the destination.
@@ -306,16 +807,18 @@ class GmailClient:
         Args:
             message_id (str): The ID of the email message to move.
             destination_mailbox (str): The name of the target mailbox/label (e.g., 'INBOX', 'Promotions').
+            current_label_ids (list, optional): The message's label IDs, if already known (e.g. from
+                                                the database). Saves fetching the message to read them.
 
         Returns:
             bool: True if successful, False otherwise.
         """
-        print(f"Moving email {message_id} to '{destination_mailbox}'...")
+        logger.debug(f"Moving email {message_id} to '{destination_mailbox}'...")
         # First, find the label ID for the destination mailbox
-        label_id = self._get_label_id(destination_mailbox)
+        label_id = self.get_label_id(destination_mailbox)
 
         if not label_id:
-            print(f"Could not move email {message_id}: Destination mailbox '{destination_mailbox}' not found or invalid.")
+            logger.error(f"Could not move email {message_id}: Destination mailbox '{destination_mailbox}' not found or invalid.")
             return False
 
         try:
@@ -324,33 +827,25 @@ class GmailClient:
             # Note: Removing from 'INBOX' and adding to another label automatically moves it.
             # If the email is already in the destination mailbox, this operation might still succeed
             # but won't change anything.
-            current_message = self.service.users().messages().get(userId='me', id=message_id, format='metadata').execute()
-            current_label_ids = current_message.get('labelIds', [])
+            if current_label_ids is None:
+                current_message = self.service.users().messages().get(
+                    userId='me', id=message_id, format='metadata'
+                ).execute(num_retries=API_NUM_RETRIES)
+                current_label_ids = current_message.get('labelIds', [])
 
             labels_to_remove = []
             # 'INBOX' is a special label. If moving from INBOX, remove it.
             if 'INBOX' in current_label_ids and destination_mailbox.upper() != 'INBOX':
                 labels_to_remove.append('INBOX')
 
-            labels_to_add = [label_id]
-
-            body = {
-                'removeLabelIds': labels_to_remove,
-                'addLabelIds': labels_to_add
-            }
-
-            self.service.users().messages().modify(
-                userId='me',
-                id=message_id,
-                body=body
-            ).execute()
-            print(f"Email {message_id} moved to '{destination_mailbox}' successfully.")
+            self._modify(message_id, add_label_ids=[label_id], remove_label_ids=labels_to_remove)
+            logger.debug(f"Email {message_id} moved to '{destination_mailbox}' successfully.")
             return True
         except HttpError as error:
-            print(f"An HTTP error occurred while moving email {message_id}: {error}")
+            logger.error(f"An HTTP error occurred while moving email {message_id}: {error}")
             return False
         except Exception as e:
-            print(f"An unexpected error occurred while moving email {message_id}: {e}")
+            logger.error(f"An unexpected error occurred while moving email {message_id}: {e}")
             return False
 
     def apply_label(self, message_id, label_name):
@@ -364,24 +859,142 @@ class GmailClient:
         Returns:
             bool: True if successful, False otherwise.
         """
-        print(f"Applying label '{label_name}' to email {message_id}...")
-        label_id = self._get_label_id(label_name)
+        logger.debug(f"Applying label '{label_name}' to email {message_id}...")
+        label_id = self.get_label_id(label_name)
 
         if not label_id:
-            print(f"Could not apply label to email {message_id}: Label '{label_name}' not found or invalid.")
+            logger.error(f"Could not apply label to email {message_id}: Label '{label_name}' not found or invalid.")
             return False
 
         try:
-            self.service.users().messages().modify(
-                userId='me',
-                id=message_id,
-                body={'addLabelIds': [label_id]}
-            ).execute()
-            print(f"Label '{label_name}' applied to email {message_id} successfully.")
+            self._modify(message_id, add_label_ids=[label_id])
+            logger.debug(f"Label '{label_name}' applied to email {message_id} successfully.")
             return True
         except HttpError as error:
-            print(f"An HTTP error occurred while applying label '{label_name}' to email {message_id}: {error}")
+            logger.error(f"An HTTP error occurred while applying label '{label_name}' to email {message_id}: {error}")
             return False
         except Exception as e:
-            print(f"An unexpected error occurred while applying label '{label_name}' to email {message_id}: {e}")
+            logger.error(f"An unexpected error occurred while applying label '{label_name}' to email {message_id}: {e}")
             return False
+
+    def modify_many(self, ops, max_workers=MAX_API_WORKERS):
+        """
+        Applies label changes to many messages concurrently using a thread pool.
+
+        Args:
+            ops (list): A list of (message_id, add_label_ids, remove_label_ids) tuples.
+            max_workers (int): Maximum number of concurrent modify requests.
+
+        Returns:
+            dict: A mapping of message ID to True if its change succeeded, False otherwise.
+        """
+        if not ops:
+            return {}
+
+        def modify_one(op):
+            message_id, add_label_ids, remove_label_ids = op
+            try:
+                self._modify(message_id, add_label_ids, remove_label_ids, http=self._thread_http())
+                return True
+            except HttpError as error:
+                logger.error(f"An HTTP error occurred while modifying email {message_id}: {error}")
+                return False
+            except Exception as e:
+                logger.error(f"An unexpected error occurred while modifying email {message_id}: {e}")
+                return False
+
+        logger.info(f"Modifying labels of {len(ops)} emails...")
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            results = executor.map(modify_one, ops)
+            return {op[0]: succeeded for op, succeeded in zip(ops, results)}
+
+    def batch_modify(self, message_ids, add_label_ids=None, remove_label_ids=None):
+        """
+        Applies the same label change to many messages with messages.batchModify,
+        one request per BATCH_MODIFY_MAX_IDS messages. Requests go through the calling
+        thread's own transport, so several label changes can be sent from different threads.
+
+        If Gmail rejects a chunk with a 4xx error (e.g. one of the IDs no longer exists),
+        the labels are listed again when they came from the on-disk cache, and the chunk is
+        resent once with any label IDs that changed. Otherwise, that chunk is retried message
+        by message through modify_many.
+
+        Args:
+            message_ids (list): IDs of the messages to modify.
+            add_label_ids (list, optional): Label IDs to add to every message.
+            remove_label_ids (list, optional): Label IDs to remove from every message.
+
+        Returns:
+            dict: A mapping of message ID to True if its change succeeded, False otherwise.
+        """
+        results = {}
+        for start in range(0, len(message_ids), BATCH_MODIFY_MAX_IDS):
+            chunk = message_ids[start:start + BATCH_MODIFY_MAX_IDS]
+            try:
+                self.service.users().messages().batchModify(
+                    userId='me',
+                    body={
+                        'ids': chunk,
+                        'addLabelIds': add_label_ids or [],
+                        'removeLabelIds': remove_label_ids or []
+                    }
+                ).execute(http=self._thread_http(), num_retries=API_NUM_RETRIES)
+                results.update(dict.fromkeys(chunk, True))
+            except HttpError as error:
+                # 429 is left out: retrying a throttled chunk one message at a time would only add load
+                if 400 <= error.resp.status < 500 and error.resp.status != 429:
+                    # A label ID from a stale cache is rejected for every message alike
+                    remapped = self._refresh_label_cache()
+                    label_ids = (add_label_ids or []) + (remove_label_ids or [])
+                    if any(label_id in remapped for label_id in label_ids):
+                        logger.warning(f"Label IDs changed since they were cached; resending {len(chunk)} emails.")
+                        add_label_ids = self._remap_label_ids(add_label_ids, remapped)
+                        remove_label_ids = self._remap_label_ids(remove_label_ids, remapped)
+                        results.update(self.batch_modify(chunk, add_label_ids, remove_label_ids))
+                        continue
+                    logger.warning(f"Batch modify of {len(chunk)} emails was rejected ({error}); retrying them individually.")
+                    results.update(self.modify_many([(message_id, add_label_ids, remove_label_ids) for message_id in chunk]))
+                else:
+                    logger.error(f"An HTTP error occurred while batch modifying {len(chunk)} emails: {error}")
+                    results.update(dict.fromkeys(chunk, False))
+            except Exception as e:
+                logger.error(f"An unexpected error occurred while batch modifying {len(chunk)} emails: {e}")
+                results.update(dict.fromkeys(chunk, False))
+        return results
+
+    @staticmethod
+    def _remap_label_ids(label_ids, remapped):
+        """
+        Replaces label IDs by their current ones, dropping those of labels that no longer exist.
+
+        Args:
+            label_ids (list): Label IDs, or None.
+            remapped (dict): Old label ID to current label ID (or None), from _refresh_label_cache.
+
+        Returns:
+            list: The current label IDs, or None if `label_ids` was None.
+        """
+        if label_ids is None:
+            return None
+        current_ids = (remapped.get(label_id, label_id) for label_id in label_ids)
+        return [label_id for label_id in current_ids if label_id is not None]
+
+    def _modify(self, message_id, add_label_ids=None, remove_label_ids=None, http=None):
+        """
+        Adds and/or removes labels on a single message. Errors propagate to the caller.
+
+        Args:
+            message_id (str): The ID of the email message to modify.
+            add_label_ids (list, optional): Label IDs to add.
+            remove_label_ids (list, optional): Label IDs to remove.
+            http (httplib2.Http, optional): Transport to execute the request with.
+                                            Defaults to the service's shared transport.
+        """
+        body = {}
+        if remove_label_ids:
+            body['removeLabelIds'] = list(remove_label_ids)
+        if add_label_ids:
+            body['addLabelIds'] = list(add_label_ids)
+        self.service.users().messages().modify(userId='me', id=message_id, body=body).execute(
+            http=http, num_retries=API_NUM_RETRIES
+        )
@@ -1,8 +1,111 @@
 # process_emails.py
 
+import contextlib
+import logging
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from database_manager import DatabaseManager
 from rule_engine import RuleEngine, Email
 from gmail_client import GmailClient
+from config import LOG_LEVEL, PROCESS_CHUNK_SIZE
+
+logger = logging.getLogger(__name__)
+
+
+def store_message_bodies(emails, bodies, db_manager):
+    """
+    Fills in and persists the message bodies fetched for emails that were stored without one.
+
+    Args:
+        emails (list): Email objects; those whose message_body is None are updated in place.
+        bodies (dict): Message ID to body, as returned by GmailClient.hydrate_bodies.
+        db_manager (DatabaseManager): Database the fetched bodies are persisted to.
+    """
+    if not bodies:
+        return
+
+    db_manager.begin_transaction()
+    try:
+        for email_obj in emails:
+            body = bodies.get(email_obj.id)
+            if email_obj.message_body is None and body is not None:
+                email_obj.message_body = body
+                db_manager.update_message_body(email_obj.id, body)
+        db_manager.commit_transaction()
+    except Exception:
+        db_manager.rollback_transaction()
+        raise
+
+
+def _body_fetcher(chunks, gmail_client, chunk_queue, stop_event):
+    """
+    Fetcher thread body: downloads the missing message bodies of each chunk of emails and
+    queues (chunk, bodies) pairs, followed by the None sentinel. A chunk whose download fails
+    is still queued, with no bodies, so the rules not reading bodies are evaluated for it.
+
+    Args:
+        chunks (list): Lists of Email objects.
+        gmail_client (GmailClient): Client used to fetch the full message payloads.
+        chunk_queue (queue.Queue): Receives (chunk, bodies) pairs, terminated by None.
+        stop_event (threading.Event): Set by the consumer to stop fetching early.
+    """
+    try:
+        for chunk in chunks:
+            if stop_event.is_set():
+                break
+            missing_ids = [email_obj.id for email_obj in chunk if email_obj.message_body is None]
+            bodies = {}
+            if missing_ids:
+                try:
+                    bodies = gmail_client.hydrate_bodies(missing_ids)
+                except Exception as e:
+                    logger.error(f"Failed to fetch message bodies for {len(missing_ids)} emails: {e}")
+            chunk_queue.put((chunk, bodies))
+    finally:
+        chunk_queue.put(None)  # Sentinel: no more chunks
+
+
+def collect_label_changes_with_bodies(emails, rule_engine, gmail_client, db_manager):
+    """
+    Loads missing message bodies and evaluates the rules, chunk by chunk.
+
+    A fetcher thread downloads the bodies of the next chunk while this thread stores the
+    current chunk's bodies and evaluates the rules against it.
+
+    Args:
+        emails (list): Email objects to process.
+        rule_engine (RuleEngine): Engine whose rules are evaluated.
+        gmail_client (GmailClient): Client used to fetch bodies and resolve labels.
+        db_manager (DatabaseManager): Database the fetched bodies are persisted to.
+
+    Returns:
+        list: The label changes gathered by RuleEngine.collect_label_changes.
+    """
+    chunks = [emails[start:start + PROCESS_CHUNK_SIZE] for start in range(0, len(emails), PROCESS_CHUNK_SIZE)]
+    missing_count = sum(1 for email_obj in emails if email_obj.message_body is None)
+    if missing_count:
+        print(f"Fetching message bodies for {missing_count} emails...")
+
+    # Unbounded: the emails are already in memory, and the fetcher never blocks on a stopped consumer
+    chunk_queue = queue.Queue()
+    stop_event = threading.Event()
+    fetcher = threading.Thread(target=_body_fetcher, args=(chunks, gmail_client, chunk_queue, stop_event))
+    fetcher.start()
+    ops = []
+    try:
+        for chunk, bodies in iter(chunk_queue.get, None):
+            store_message_bodies(chunk, bodies, db_manager)
+            ops.extend(rule_engine.collect_label_changes(chunk, gmail_client))
+    finally:
+        stop_event.set()
+        fetcher.join()
+
+    unloaded_count = sum(1 for email_obj in emails if email_obj.message_body is None)
+    if unloaded_count:
+        logger.warning(f"Message bodies of {unloaded_count} emails could not be loaded; "
+                       f"rules with a condition on the message body were skipped for them.")
+    return ops
 
 
 def process_stored_emails():
@@ -12,54 +115,70 @@ def process_stored_emails():
     """
     print("Starting email processing script...")
 
-    # 1. Initialize Database Manager (to read emails)
-    db_manager = None
-    try:
-        db_manager = DatabaseManager()
-    except Exception as e:
-        print(f"Failed to initialize DatabaseManager: {e}")
-        print("Please check your database configuration.")
-        return  # Exit if DBManager cannot be initialized
-
-    # 2. Initialize Gmail Client (to perform actions)
-    # The processing script also needs to authenticate to perform actions like mark as read/unread, move, apply label.
-    gmail_client = None
-    try:
-        gmail_client = GmailClient()
-    except Exception as e:
-        print(f"Failed to initialize GmailClient for processing actions: {e}")
-        print("Please ensure your 'credentials.json' is correctly set up and you have internet access.")
-        db_manager.close_connection()  # Close DB connection before exiting
-        return  # Exit if GmailClient cannot be initialized
-
-    # 3. Retrieve Emails from Database
-    print("\nRetrieving emails from the database...")
-    db_emails_raw = db_manager.get_all_emails()
-
-    if not db_emails_raw:
-        print("No emails found in the database to process.")
-        db_manager.close_connection()
-        del gmail_client
-        return
+    # The ExitStack closes whatever was opened, in reverse order, however the function exits
+    with contextlib.ExitStack() as stack:
+        # 1. Initialize Gmail Client (to perform actions) in the background
+        # The processing script also needs to authenticate to perform actions like mark as read/unread, move, apply label.
+        # Authentication is network-bound, so it runs while the database is being opened.
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            gmail_future = executor.submit(GmailClient)
+
+            # 2. Initialize Database Manager (to read emails)
+            # Opened on this thread: SQLite connections may only be used by the thread that created them.
+            try:
+                db_manager = stack.enter_context(DatabaseManager())
+            except Exception as e:
+                db_manager = None
+                print(f"Failed to initialize DatabaseManager: {e}")
+                print("Please check your database configuration.")
+
+            try:
+                gmail_client = stack.enter_context(gmail_future.result())
+            except Exception as e:
+                print(f"Failed to initialize GmailClient for processing actions: {e}")
+                print("Please ensure your 'credentials.json' is correctly set up and you have internet access.")
+                return  # Exit if GmailClient cannot be initialized
+
+        if db_manager is None:
+            return  # Exit if DBManager cannot be initialized
+
+        # 3. Initialize Rule Engine
+        print("\nInitializing Rule Engine...")
+        rule_engine = RuleEngine()  # This will load rules from rules.json
+        needs_body = rule_engine.requires_message_body()
+
+        # 4. Retrieve Emails from Database
+        # Message bodies are only read (and loaded on demand) when a rule has a condition on them.
+        print("\nRetrieving emails from the database...")
+        # Records come back as plain tuples, turned into Email objects without an intermediate dictionary
+        emails_to_process = [Email.from_db_tuple(row) for row in db_manager.iter_email_tuples(include_body=needs_body)]
+
+        if not emails_to_process:
+            print("No emails found in the database to process.")
+            return
 
-    # Convert raw database rows into Email objects
-    emails_to_process = [Email.from_db_row(row) for row in db_emails_raw]
-    print(f"Retrieved {len(emails_to_process)} emails from the database for processing.")
+        print(f"Retrieved {len(emails_to_process)} emails from the database for processing.")
 
-    # 4. Initialize Rule Engine and Process Emails
-    print("\nInitializing Rule Engine and processing emails...")
-    rule_engine = RuleEngine()  # This will load rules from rules.json
+        # 5. Process Emails
+        if not rule_engine.rules:
+            print("No rules configured. Email processing skipped.")
+            return
 
-    if rule_engine.rules:
-        rule_engine.process_emails(emails_to_process, gmail_client)
-    else:
-        print("No rules configured. Email processing skipped.")
+        print(f"\nStarting to process {len(emails_to_process)} emails with {len(rule_engine.rules)} rules...")
+        # Bodies are not downloaded at fetch time; load them only if a rule needs them,
+        # overlapping the download with rule evaluation.
+        if needs_body:
+            ops = collect_label_changes_with_bodies(emails_to_process, rule_engine, gmail_client, db_manager)
+        else:
+            ops = rule_engine.collect_label_changes(emails_to_process, gmail_client)
+        # All changes are sent at the end so identical ones share batchModify calls
+        rule_engine.apply_label_changes(ops, gmail_client)
+        print("\nEmail processing complete.")
 
-    # 5. Clean Up
-    db_manager.close_connection()
-    del gmail_client
+    # 6. Clean Up (connections were closed by the ExitStack)
     print("\nEmail processing script finished.")
 
 
 if __name__ == "__main__":
+    logging.basicConfig(level=LOG_LEVEL, format='%(message)s')
     process_stored_emails()
@@ -1,14 +1,39 @@
 # rule_engine.py
 
+import contextlib
 import json
 from datetime import datetime, timedelta
-import os
 import logging
+import operator
+import sys
+import time
 from datetime import timezone
-from config import RULES_FILE
+from concurrent.futures import ThreadPoolExecutor
+from config import RULES_FILE, MAX_API_WORKERS
 
 logger = logging.getLogger(__name__)
 
+# Rules file parser: orjson when installed, else the stdlib json module.
+# orjson.JSONDecodeError subclasses json.JSONDecodeError, so error handling is the same for both.
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _epoch_seconds(value):
+    """
+    Returns the POSIX timestamp of a datetime, treating naive datetimes as UTC.
+
+    Returns:
+        float: Seconds since the epoch, or None if the value is not a datetime.
+    """
+    if not isinstance(value, datetime):
+        return None
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
 
 class Email:
     """
@@ -19,6 +44,10 @@ class Email:
     consistently across the application, especially for rule evaluation.
     """
 
+    # Fixed attribute set: smaller instances and faster attribute access for large batches
+    __slots__ = ('id', 'thread_id', 'from_address', 'subject', 'received_date_time', 'message_body', 'label_ids',
+                 '_from_lc', '_subject_lc', '_body_lc', '_received_ts')
+
     def __init__(self, id, thread_id, from_address, subject, received_date_time, message_body, label_ids=None):
         """
         Initializes an Email object.
@@ -37,8 +66,31 @@ class Email:
         self.from_address = from_address
         self.subject = subject
         self.received_date_time = received_date_time
+        # Date conditions compare plain numbers instead of timezone-aware datetimes
+        self._received_ts = _epoch_seconds(received_date_time)
         self.message_body = message_body
         self.label_ids = label_ids if label_ids is not None else []
+        # Lower-cased text fields for case-insensitive matching; see cache_lowercase_fields()
+        self._from_lc = None
+        self._subject_lc = None
+        self._body_lc = None
+
+    def cache_lowercase_fields(self, fields=None):
+        """
+        Stores lower-cased copies of the sender, subject and body, so case-insensitive
+        conditions of every rule reuse them instead of lower-casing the fields on each evaluation.
+        Must be called again if those fields change afterwards.
+
+        Args:
+            fields (collection, optional): Rule field names ("From", "Subject", "Message") to cache.
+                                           Defaults to all three; fields left out are not copied.
+        """
+        if fields is None or "From" in fields:
+            self._from_lc = self.from_address.lower() if isinstance(self.from_address, str) else None
+        if fields is None or "Subject" in fields:
+            self._subject_lc = self.subject.lower() if isinstance(self.subject, str) else None
+        if fields is None or "Message" in fields:
+            self._body_lc = self.message_body.lower() if isinstance(self.message_body, str) else None
 
     def to_dict(self):
         """
@@ -58,11 +110,31 @@ class Email:
             'labelIds': self.label_ids
         }
 
+    def to_row(self):
+        """
+        Converts the Email object to a tuple in the 'emails' table column order,
+        for bulk insertion without building an intermediate dictionary.
+
+        Returns:
+            tuple: (id, thread_id, from, subject, received_date_time as ISO string,
+                    message_body, label_ids).
+        """
+        return (
+            self.id,
+            self.thread_id,
+            self.from_address,
+            self.subject,
+            self.received_date_time.isoformat() if self.received_date_time else None,
+            self.message_body,
+            self.label_ids
+        )
+
     @classmethod
     def from_db_row(cls, row_dict):
         """
         Creates an Email object from a dictionary representing a database row.
-        Converts date string back to datetime object.
+        Converts date string back to datetime object. Body-free records are read in bulk
+        with DatabaseManager.iter_email_tuples(include_body=False) and Email.from_db_tuple.
 
         Args:
             row_dict (dict): A dictionary where keys are column names from the database.
@@ -77,15 +149,36 @@ class Email:
             elif isinstance(row_dict['received_date_time'], datetime):
                 received_dt = row_dict['received_date_time']  # Already a datetime object from DBManager
 
-        return cls(
-            id=row_dict['id'],
-            thread_id=row_dict['thread_id'],
-            from_address=row_dict['from'],
-            subject=row_dict['subject'],
-            received_date_time=received_dt,
-            message_body=row_dict['message_body'],
-            label_ids=row_dict.get('label_ids', [])
-        )
+        return cls.from_db_tuple((
+            row_dict['id'],
+            row_dict['thread_id'],
+            row_dict['from'],
+            row_dict['subject'],
+            received_dt,
+            row_dict['message_body'],
+            row_dict.get('label_ids', [])
+        ))
+
+    @classmethod
+    def from_db_tuple(cls, row):
+        """
+        Creates an Email object from a positional record, as yielded by
+        DatabaseManager.iter_email_tuples. This is the bulk-loading path: no
+        per-row dictionary is built or looked up.
+
+        Args:
+            row (tuple): (id, thread_id, from, subject, received_date_time as datetime or None,
+                          message_body, label_ids).
+
+        Returns:
+            Email: An Email object.
+        """
+        email_id, thread_id, from_address, subject, received_dt, message_body, label_ids = row
+        # Senders and label IDs repeat across a mailbox; interning keeps one copy of each string
+        if isinstance(from_address, str):
+            from_address = sys.intern(from_address)
+        label_ids = [sys.intern(label_id) if isinstance(label_id, str) else label_id for label_id in label_ids or ()]
+        return cls(email_id, thread_id, from_address, subject, received_dt, message_body, label_ids)
 
 
 class Condition:
@@ -97,6 +190,8 @@ class Condition:
     against a given Email object.
     """
 
+    __slots__ = ('field', 'predicate', 'value', '_eval')
+
     def __init__(self, field, predicate, value):
         """
         Initializes a Condition object.
@@ -105,10 +200,19 @@ class Condition:
             field (str): The email field to check (e.g., "From", "Subject", "Message", "Received Date/Time").
             predicate (str): The comparison predicate (e.g., "contains", "equals", "less than").
             value (any): The value to compare against.
+
+        Raises:
+            ValueError: If the field or the predicate is not supported.
         """
+        # Checked once here, so that evaluating the condition never has to report a bad rule
+        if field not in _FIELD_GETTERS:
+            raise ValueError(f"Unknown field '{field}'")
+        if predicate not in _PREDICATE_COMPILERS:
+            raise ValueError(f"Unknown predicate '{predicate}' for field '{field}'")
         self.field = field
         self.predicate = predicate
         self.value = value
+        self._eval = self._compile()  # Resolved once; evaluate() only calls it
 
     def evaluate(self, email_obj):
         """
@@ -120,81 +224,218 @@ class Condition:
         Returns:
             bool: True if the condition matches, False otherwise.
         """
-        email_value = self._get_email_field_value(email_obj, self.field)
+        return self._eval(email_obj)
 
-        # Handle cases where email_value might be None
-        if email_value is None and self.predicate not in ["equals", "does not equal"]:
-            # For predicates like 'contains', 'less than' etc., if email_value is None,
-            # it typically means the condition cannot be met, so return False.
-            # However, for 'equals/does not equal', None can be a valid comparison.
-            return False
+    def _compile(self):
+        """
+        Builds the function that evaluates this condition, resolving the field getter,
+        the predicate and any preprocessed value once instead of on every evaluation.
+
+        Returns:
+            callable: A function taking an Email object and returning a bool.
+        """
+        compiler = _PREDICATE_COMPILERS[self.predicate]
+        return compiler(self.field, self.value, _FIELD_GETTERS[self.field])
+
+
+# Rule field names mapped to the Email attribute they read
+_FIELD_GETTERS = {
+    "From": operator.attrgetter('from_address'),
+    "Subject": operator.attrgetter('subject'),
+    "Message": operator.attrgetter('message_body'),
+    "Received Date/Time": operator.attrgetter('received_date_time'),
+}
 
-        if self.predicate == "contains":
-            return self.value.lower() in (email_value or "").lower() if isinstance(email_value, str) else False
-        elif self.predicate == "does not contain":
-            return self.value.lower() not in (email_value or "").lower() if isinstance(email_value, str) else False
-        elif self.predicate == "equals":
-            # Case-insensitive comparison for strings
-            if isinstance(email_value, str) and isinstance(self.value, str):
-                return email_value.lower() == self.value.lower()
-            return email_value == self.value
-        elif self.predicate == "does not equal":
-            # Case-insensitive comparison for strings
-            if isinstance(email_value, str) and isinstance(self.value, str):
-                return email_value.lower() != self.value.lower()
-            return email_value != self.value
-        elif self.predicate == "less than":
-            if self.field == "Received Date/Time" and isinstance(email_value, datetime):
-                if isinstance(self.value, dict):
-                    if "days" in self.value:
-                        threshold_date = datetime.now(timezone.utc) - timedelta(days=self.value["days"])
-                        return email_value > threshold_date  # Email is MORE recent than threshold, i.e., "less than X days old"
-                    elif "months" in self.value:
-                        # Simple month calculation: subtract days equivalent to months
-                        # TODO: change  this to use dateutils.relativedelta
-                        approx_days = self.value["months"] * 30.44  # Average days in a month
-                        threshold_date = datetime.now(timezone.utc) - timedelta(days=approx_days)
-                        return email_value > threshold_date
-            return False
-        elif self.predicate == "greater than":
-            if self.field == "Received Date/Time" and isinstance(email_value, datetime):
-                if isinstance(self.value, dict):
-                    if "days" in self.value:
-                        threshold_date = datetime.now(timezone.utc) - timedelta(days=self.value["days"])
-                        # Email is OLDER than threshold, i.e., "greater than X days old"
-                        return email_value < threshold_date
-                    elif "months" in self.value:
-                        approx_days = self.value["months"] * 30.44
-                        threshold_date = datetime.now(timezone.utc) - timedelta(days=approx_days)
-                        return email_value < threshold_date
-            return False
-        else:
-            logger.warning(f"Warning: Unknown predicate '{self.predicate}' for field '{self.field}'. Condition will not be met.")
-            return False
 
-    def _get_email_field_value(self, email_obj, field_name):
+# Email attributes holding the lower-cased copy of a text field (see Email.cache_lowercase_fields)
+_LOWERCASE_CACHE_ATTRS = {
+    "From": '_from_lc',
+    "Subject": '_subject_lc',
+    "Message": '_body_lc',
+}
+
+
+def _lowered_getter(field, getter):
+    """
+    Returns a function giving the lower-cased value of a field, or None if it is not a string.
+    The copy cached on the Email is used when present; otherwise the value is lower-cased on the fly.
+    """
+    cache_attr = _LOWERCASE_CACHE_ATTRS.get(field)
+    cached_getter = operator.attrgetter(cache_attr) if cache_attr else None
+
+    def lowered(email_obj):
+        if cached_getter is not None:
+            cached = cached_getter(email_obj)
+            if cached is not None:
+                return cached
+        email_value = getter(email_obj)
+        return email_value.lower() if isinstance(email_value, str) else None
+    return lowered
+
+
+def _compile_contains(field, value, getter):
+    """Returns an evaluator for 'contains': case-insensitive substring match on a string field."""
+    if not isinstance(value, str):
+        return lambda email_obj: False
+    needle = value.lower()
+    lowered = _lowered_getter(field, getter)
+
+    def evaluate(email_obj):
+        email_value = lowered(email_obj)
+        return email_value is not None and needle in email_value
+    return evaluate
+
+
+def _compile_does_not_contain(field, value, getter):
+    """Returns an evaluator for 'does not contain'; missing or non-string fields never match."""
+    if not isinstance(value, str):
+        return lambda email_obj: False
+    needle = value.lower()
+    lowered = _lowered_getter(field, getter)
+
+    def evaluate(email_obj):
+        email_value = lowered(email_obj)
+        return email_value is not None and needle not in email_value
+    return evaluate
+
+
+def _compile_equals(field, value, getter):
+    """Returns an evaluator for 'equals': case-insensitive for strings, plain equality otherwise."""
+    if not isinstance(value, str):
+        return lambda email_obj: getter(email_obj) == value
+    target = value.lower()
+    lowered = _lowered_getter(field, getter)
+
+    def evaluate(email_obj):
+        email_value = lowered(email_obj)
+        if email_value is not None:
+            return email_value == target
+        return getter(email_obj) == value
+    return evaluate
+
+
+def _compile_does_not_equal(field, value, getter):
+    """Returns an evaluator for 'does not equal', the negation of 'equals'."""
+    equals = _compile_equals(field, value, getter)
+    return lambda email_obj: not equals(email_obj)
+
+
+def _age_delta(value):
+    """
+    Converts a date condition value ({"days": n} or {"months": n}) to a timedelta.
+
+    Returns:
+        timedelta: The age, or None if the value has neither key.
+    """
+    if not isinstance(value, dict):
+        return None
+    if "days" in value:
+        return timedelta(days=value["days"])
+    if "months" in value:
+        # Simple month calculation: subtract days equivalent to months
+        # TODO: change  this to use dateutils.relativedelta
+        return timedelta(days=value["months"] * 30.44)  # Average days in a month
+    return None
+
+
+class _ReferenceTime:
+    """
+    The instant the age of emails is measured from. RuleEngine pins it while evaluating a batch,
+    so the clock is read once per batch; when unpinned, each evaluation reads the current time.
+    """
+
+    __slots__ = ('pinned',)
+
+    def __init__(self):
+        self.pinned = None
+
+    @contextlib.contextmanager
+    def pin(self, now=None):
         """
-        Helper method to retrieve the correct attribute from the Email object
-        based on the field name specified in the rule.
+        Fixes the reference time for the duration of the with-block.
 
         Args:
-            email_obj (Email): The email object.
-            field_name (str): The name of the field (e.g., "From", "Subject").
+            now (datetime, optional): The instant to use. Defaults to the current UTC time.
+        """
+        previous = self.pinned
+        self.pinned = now or datetime.now(timezone.utc)
+        try:
+            yield self.pinned
+        finally:
+            self.pinned = previous
 
-        Returns:
-            any: The value of the corresponding email field.
-        """
-        if field_name == "From":
-            return email_obj.from_address
-        elif field_name == "Subject":
-            return email_obj.subject
-        elif field_name == "Message":
-            return email_obj.message_body
-        elif field_name == "Received Date/Time":
-            return email_obj.received_date_time
+
+_reference_time = _ReferenceTime()
+
+
+def _compile_age(field, value, getter, older):
+    """
+    Returns an evaluator comparing the age of the received date against the condition value.
+
+    The comparison uses the epoch seconds precomputed on the Email rather than the datetime.
+
+    Args:
+        older (bool): True for 'greater than' (received before the threshold),
+                      False for 'less than' (received after it).
+    """
+    delta = _age_delta(value)
+    if field != "Received Date/Time" or delta is None:
+        return lambda email_obj: False
+
+    age_seconds = delta.total_seconds()
+    last = [None, None]  # Pinned reference time and the threshold derived from it
+
+    def evaluate(email_obj):
+        received_ts = email_obj._received_ts
+        if received_ts is None:
+            return False
+        now = _reference_time.pinned
+        if now is None:
+            threshold_ts = time.time() - age_seconds
+        elif now is last[0]:
+            threshold_ts = last[1]
         else:
-            logger.warning(f"Warning: Unknown field '{field_name}'. Cannot evaluate condition.")
-            return None
+            threshold_ts = now.timestamp() - age_seconds
+            last[:] = now, threshold_ts
+        # "greater than X days" means OLDER than the threshold, "less than" means MORE recent
+        return received_ts < threshold_ts if older else received_ts > threshold_ts
+    return evaluate
+
+
+# Relative evaluation cost of a condition by field: short header strings and date comparisons
+# are cheap, scanning the message body is not.
+_FIELD_COSTS = {
+    "From": 0,
+    "Subject": 0,
+    "Received Date/Time": 1,
+    "Message": 2,
+}
+
+
+def _condition_cost(condition):
+    """Sort key ordering a rule's conditions from cheapest to most expensive to evaluate."""
+    return _FIELD_COSTS[condition.field]
+
+
+# Predicate names mapped to the function compiling them into an evaluator
+_PREDICATE_COMPILERS = {
+    "contains": _compile_contains,
+    "does not contain": _compile_does_not_contain,
+    "equals": _compile_equals,
+    "does not equal": _compile_does_not_equal,
+    "less than": lambda field, value, getter: _compile_age(field, value, getter, older=False),
+    "greater than": lambda field, value, getter: _compile_age(field, value, getter, older=True),
+}
+
+
+# Action types mapped to the GmailClient method executing them and, for actions that
+# take a value, a description of that value used in error messages
+_ACTION_METHODS = {
+    "Mark as Read": ("mark_as_read", None),
+    "Mark as Unread": ("mark_as_unread", None),
+    "Move Message": ("move_message", "destination mailbox"),
+    "Apply Label": ("apply_label", "label name"),
+}
 
 
 class Action:
@@ -205,6 +446,8 @@ class Action:
     It defines the interface for executing the action via a GmailClient.
     """
 
+    __slots__ = ('action_type', 'value', '_label_id', '_dispatch')
+
     def __init__(self, action_type, value=None):
         """
         Initializes an Action object.
@@ -215,6 +458,9 @@ class Action:
         """
         self.action_type = action_type
         self.value = value
+        self._label_id = None  # Set by resolve_label_id()
+        # (GmailClient method name, description of the required value), resolved once
+        self._dispatch = _ACTION_METHODS.get(action_type)
 
     def execute(self, gmail_client, email_id):
         """
@@ -227,25 +473,65 @@ class Action:
         Returns:
             bool: True if the action was successful, False otherwise.
         """
+        if self._dispatch is None:
+            logger.warning(f"Warning: Unknown action type '{self.action_type}'. Action not executed for email {email_id}.")
+            return False
+        method_name, value_description = self._dispatch
+        if value_description is None:
+            return getattr(gmail_client, method_name)(email_id)
+        if not self.value:
+            print(f"Error: Missing {value_description} for '{self.action_type}' action for email {email_id}.")
+            return False
+        return getattr(gmail_client, method_name)(email_id, self.value)
+
+    def resolve_label_id(self, gmail_client):
+        """
+        Looks up the Gmail label ID for the action's label or mailbox name once, so that
+        label_change does not resolve it again for every email.
+
+        Args:
+            gmail_client (GmailClient): Used to resolve the label name to its label ID.
+
+        Returns:
+            str: The label ID, or None if the action takes no label or it cannot be resolved.
+        """
+        if self.action_type in ("Move Message", "Apply Label") and self.value:
+            self._label_id = gmail_client.get_label_id(self.value)
+        return self._label_id
+
+    def label_change(self, gmail_client, email_obj):
+        """
+        Translates the action into the label IDs it adds to and removes from an email,
+        so that changes from several actions can be merged into a single modify request.
+
+        Args:
+            gmail_client (GmailClient): Used to resolve label names to label IDs.
+            email_obj (Email): The email the action applies to.
+
+        Returns:
+            tuple: (add_label_ids, remove_label_ids), or None if the action cannot be applied.
+        """
         if self.action_type == "Mark as Read":
-            return gmail_client.mark_as_read(email_id)
+            return [], ['UNREAD']
         elif self.action_type == "Mark as Unread":
-            return gmail_client.mark_as_unread(email_id)
-        elif self.action_type == "Move Message":
-            if self.value:
-                return gmail_client.move_message(email_id, self.value)
-            else:
-                print(f"Error: Missing destination mailbox for 'Move Message' action for email {email_id}.")
-                return False
-        elif self.action_type == "Apply Label":
-            if self.value:
-                return gmail_client.apply_label(email_id, self.value)
-            else:
-                print(f"Error: Missing label name for 'Apply Label' action for email {email_id}.")
-                return False
+            return ['UNREAD'], []
+        elif self.action_type in ("Move Message", "Apply Label"):
+            if not self.value:
+                print(f"Error: Missing value for '{self.action_type}' action for email {email_obj.id}.")
+                return None
+            label_id = self._label_id or gmail_client.get_label_id(self.value)
+            if not label_id:
+                print(f"Could not resolve label '{self.value}' for email {email_obj.id}.")
+                return None
+            labels_to_remove = []
+            # Moving out of the inbox removes the INBOX label, as GmailClient.move_message does
+            if self.action_type == "Move Message" and 'INBOX' in (email_obj.label_ids or []) \
+                    and self.value.upper() != 'INBOX':
+                labels_to_remove.append('INBOX')
+            return [label_id], labels_to_remove
         else:
-            logger.warning(f"Warning: Unknown action type '{self.action_type}'. Action not executed for email {email_id}.")
-            return False
+            logger.warning(f"Warning: Unknown action type '{self.action_type}'. Action not executed for email {email_obj.id}.")
+            return None
 
 
 class Rule:
@@ -257,6 +543,8 @@ class Rule:
     and to execute the associated actions.
     """
 
+    __slots__ = ('description', 'overall_predicate', 'conditions', 'actions', '_ordered_conditions', '_match')
+
     def __init__(self, description, overall_predicate, conditions, actions):
         """
         Initializes a Rule object.
@@ -266,34 +554,102 @@ class Rule:
             overall_predicate (str): "all" (AND) or "any" (OR) for combining conditions.
             conditions (list): A list of Condition objects.
             actions (list): A list of Action objects.
+
+        Raises:
+            ValueError: If the overall predicate is neither "all" nor "any".
         """
         self.description = description
         self.overall_predicate = overall_predicate.lower()  # Ensure lowercase for comparison
+        if self.overall_predicate not in ("all", "any"):
+            raise ValueError(f"Unknown overall predicate '{overall_predicate}'")
         self.conditions = conditions
         self.actions = actions
+        # Evaluation order for matches(): cheapest conditions first, so all()/any() settle the
+        # result before the expensive ones (message body scans) run whenever possible.
+        self._ordered_conditions = sorted(conditions, key=_condition_cost)
+        self._match = self._compile_matcher()
 
-    def matches(self, email_obj):
+    def matches(self, email_obj, results=None):
         """
         Checks if the given email matches the conditions of this rule.
 
         Args:
             email_obj (Email): The Email object to check.
+            results (dict, optional): Outcomes of conditions already evaluated for this email,
+                                      keyed by Condition. Conditions shared between rules are
+                                      then evaluated once per email; new outcomes are added.
 
         Returns:
             bool: True if the email matches the rule, False otherwise.
         """
+        if results is None:
+            return self._match(email_obj)
         if not self.conditions:
             return True  # No conditions means it always matches
 
-        evaluated_conditions = [condition.evaluate(email_obj) for condition in self.conditions]
-
+        # Generators let all()/any() stop at the first condition that settles the result
+        outcomes = (self._evaluate_once(condition, email_obj, results) for condition in self._ordered_conditions)
         if self.overall_predicate == "all":
-            return all(evaluated_conditions)  # All conditions must be True
-        elif self.overall_predicate == "any":
-            return any(evaluated_conditions)  # At least one condition must be True
-        else:
-            logger.warning(f"Warning: Unknown overall predicate '{self.overall_predicate}'. Rule will not match.")
+            return all(outcomes)  # All conditions must be True
+        return any(outcomes)  # At least one condition must be True
+
+    def _compile_matcher(self):
+        """
+        Builds the function matches() uses when conditions are not shared with other rules:
+        the conditions' compiled evaluators chained cheapest first, returning as soon as the
+        result is settled. A single-condition rule uses that condition's evaluator directly.
+
+        Returns:
+            callable: A function taking an Email object and returning a bool.
+        """
+        evaluators = tuple(condition._eval for condition in self._ordered_conditions)
+        overall_predicate = self.overall_predicate
+
+        if not evaluators:
+            return lambda email_obj: True  # No conditions means it always matches
+        if len(evaluators) == 1:
+            return evaluators[0]
+
+        # Typical rules have two or three conditions; a straight-line and/or chain for those
+        # avoids the loop overhead. The evaluators return bools, so and/or yield bools too.
+        if len(evaluators) == 2:
+            first, second = evaluators
+            if overall_predicate == "all":
+                return lambda email_obj: first(email_obj) and second(email_obj)
+            return lambda email_obj: first(email_obj) or second(email_obj)
+        if len(evaluators) == 3:
+            first, second, third = evaluators
+            if overall_predicate == "all":
+                return lambda email_obj: first(email_obj) and second(email_obj) and third(email_obj)
+            return lambda email_obj: first(email_obj) or second(email_obj) or third(email_obj)
+
+        if overall_predicate == "all":
+            def match_all(email_obj):
+                for evaluate in evaluators:
+                    if not evaluate(email_obj):
+                        return False
+                return True
+            return match_all
+
+        def match_any(email_obj):
+            for evaluate in evaluators:
+                if evaluate(email_obj):
+                    return True
             return False
+        return match_any
+
+    @staticmethod
+    def _evaluate_once(condition, email_obj, results):
+        """
+        Evaluates a condition unless its outcome for this email is already in `results`.
+
+        Returns:
+            bool: The condition's outcome.
+        """
+        outcome = results.get(condition)
+        if outcome is None:
+            outcome = results[condition] = condition.evaluate(email_obj)
+        return outcome
 
     def execute_actions(self, gmail_client, email_id):
         """
@@ -332,6 +688,50 @@ class RuleEngine:
         """
         self.rules_file = rules_file
         self.rules = self._load_rules()
+        self._prepare_rules()
+
+    @classmethod
+    def from_rules(cls, rules):
+        """
+        Creates a RuleEngine from already built Rule objects, without reading a rules file.
+
+        Args:
+            rules (iterable): The Rule objects to evaluate, in order.
+
+        Returns:
+            RuleEngine: An engine evaluating the given rules.
+        """
+        engine = cls.__new__(cls)
+        engine.rules_file = None
+        engine.rules = list(rules)
+        engine._prepare_rules()
+        return engine
+
+    def _prepare_rules(self):
+        """Derives the lookup structures used by collect_label_changes from self.rules."""
+        # Whether some Condition object is used more than once, making per-email memoization worthwhile
+        all_conditions = [condition for rule in self.rules for condition in rule.conditions]
+        self._shares_conditions = len(set(map(id, all_conditions))) < len(all_conditions)
+        # Fields some condition reads; only these are lower-cased per email
+        self._used_fields = frozenset(condition.field for condition in all_conditions)
+        # Rules reading the message body; skipped for emails whose body could not be loaded
+        self._body_rules = frozenset(
+            rule for rule in self.rules if any(condition.field == "Message" for condition in rule.conditions)
+        )
+        self._equals_index, self._gated_rules = self._build_equals_index()
+
+    def _read_rules_file(self):
+        """
+        Reads the raw contents of the rules file.
+
+        Returns:
+            bytes: The file contents.
+
+        Raises:
+            OSError: If the file does not exist or cannot be read.
+        """
+        with open(self.rules_file, 'rb') as f:
+            return f.read()
 
     def _load_rules(self):
         """
@@ -342,36 +742,52 @@ class RuleEngine:
                   or parsing fails.
         """
         rules = []
-        if not os.path.exists(self.rules_file):
+        try:
+            raw_rules = self._read_rules_file()
+        except FileNotFoundError:
             print(f"Error: Rules file '{self.rules_file}' not found.")
             return []
+        except OSError as e:
+            print(f"Error reading rules file '{self.rules_file}': {e}")
+            return []
 
         try:
-            with open(self.rules_file, 'r', encoding='utf-8') as f:
-                rules_data = json.load(f)
+            # Both parsers accept the UTF-8 bytes as read, without decoding them first
+            rules_data = orjson.loads(raw_rules) if orjson else json.loads(raw_rules)
 
+            # Identical conditions in different rules share one Condition object, so that
+            # process_emails evaluates each of them only once per email.
+            shared_conditions = {}
             for rule_data in rules_data:
+                description = rule_data.get('description', 'Untitled Rule')
                 conditions = []
-                for cond_data in rule_data.get('conditions', []):
-                    conditions.append(Condition(
-                        field=cond_data['field'],
-                        predicate=cond_data['predicate'],
-                        value=cond_data['value']
-                    ))
-
-                actions = []
-                for action_data in rule_data.get('actions', []):
-                    actions.append(Action(
-                        action_type=action_data['type'],
-                        value=action_data.get('value')
+                try:
+                    for cond_data in rule_data.get('conditions', []):
+                        key = (cond_data['field'], cond_data['predicate'], json.dumps(cond_data['value'], sort_keys=True))
+                        if key not in shared_conditions:
+                            shared_conditions[key] = Condition(
+                                field=cond_data['field'],
+                                predicate=cond_data['predicate'],
+                                value=cond_data['value']
+                            )
+                        conditions.append(shared_conditions[key])
+
+                    actions = []
+                    for action_data in rule_data.get('actions', []):
+                        actions.append(Action(
+                            action_type=action_data['type'],
+                            value=action_data.get('value')
+                        ))
+
+                    rules.append(Rule(
+                        description=description,
+                        overall_predicate=rule_data.get('overall_predicate', 'all'),
+                        conditions=conditions,
+                        actions=actions
                     ))
-
-                rules.append(Rule(
-                    description=rule_data.get('description', 'Untitled Rule'),
-                    overall_predicate=rule_data.get('overall_predicate', 'all'),
-                    conditions=conditions,
-                    actions=actions
-                ))
+                except ValueError as e:
+                    # An invalid rule could never be evaluated correctly; the others still load
+                    print(f"Error: Skipping rule '{description}' in '{self.rules_file}': {e}.")
             print(f"Successfully loaded {len(rules)} rules from '{self.rules_file}'.")
             return rules
         except json.JSONDecodeError as e:
@@ -384,6 +800,50 @@ class RuleEngine:
             print(f"An unexpected error occurred while loading rules: {e}")
             return []
 
+    def _build_equals_index(self):
+        """
+        Indexes "all" rules by their first case-insensitive 'equals' condition. Such a rule can
+        only match emails whose field holds exactly that value, so one dict lookup per field
+        finds which of these rules are worth evaluating for an email.
+
+        Returns:
+            tuple: ({field: (lowered_getter, {lower-cased value: [rules]})}, frozenset of indexed rules).
+        """
+        index = {}
+        gated_rules = []
+        for rule in self.rules:
+            if rule.overall_predicate != "all":
+                continue
+            for condition in rule.conditions:
+                if condition.predicate == "equals" and isinstance(condition.value, str):
+                    getter = _FIELD_GETTERS[condition.field]
+                    _, values = index.setdefault(condition.field, (_lowered_getter(condition.field, getter), {}))
+                    values.setdefault(condition.value.lower(), []).append(rule)
+                    gated_rules.append(rule)
+                    break
+        return index, frozenset(gated_rules)
+
+    def _equals_candidates(self, email_obj):
+        """
+        Returns the indexed rules whose 'equals' condition holds for the email.
+
+        Returns:
+            set: Rules from the equals index that may match the email.
+        """
+        candidates = set()
+        for lowered, values in self._equals_index.values():
+            candidates.update(values.get(lowered(email_obj), ()))
+        return candidates
+
+    def requires_message_body(self):
+        """
+        Checks whether any loaded rule has a condition on the message body.
+
+        Returns:
+            bool: True if at least one condition uses the "Message" field.
+        """
+        return "Message" in self._used_fields
+
     def process_emails(self, emails, gmail_client):
         """
         Iterates through a list of emails and applies all loaded rules.
@@ -398,12 +858,92 @@ class RuleEngine:
             return
 
         print(f"\nStarting to process {len(emails)} emails with {len(self.rules)} rules...")
-        for email_obj in emails:
-            print(f"\nProcessing email ID: {email_obj.id}, Subject: '{email_obj.subject}'")
-            for rule in self.rules:
-                if rule.matches(email_obj):
-                    print(f"  Email matches rule: '{rule.description}'")
-                    rule.execute_actions(gmail_client, email_obj.id)
-                else:
-                    print(f"  Email does NOT match rule: '{rule.description}'")
+        ops = self.collect_label_changes(emails, gmail_client)
+        self.apply_label_changes(ops, gmail_client)
         print("\nEmail processing complete.")
+
+    def collect_label_changes(self, emails, gmail_client):
+        """
+        Evaluates all loaded rules against the emails and gathers the label changes their
+        matching actions call for, without sending anything to Gmail.
+
+        Label changes of all matching actions are merged per email, later actions winning
+        over earlier ones. Rules with a condition on the message body are not evaluated
+        for emails whose body is None (not loaded).
+
+        Args:
+            emails (iterable): Email objects to evaluate.
+            gmail_client (GmailClient): Used to resolve label names to label IDs.
+
+        Returns:
+            list: (message_id, add_label_ids, remove_label_ids) tuples, one per email with changes.
+        """
+        for rule in self.rules:
+            for action in rule.actions:
+                action.resolve_label_id(gmail_client)  # Once per batch rather than once per matching email
+
+        ops = []
+        with _reference_time.pin():  # Dates of the whole batch are compared against one instant
+            for email_obj in emails:
+                logger.debug("Processing email ID: %s, Subject: '%s'", email_obj.id, email_obj.subject)
+                # Lower-cased once, shared by every rule's conditions; a body no rule reads is not copied
+                email_obj.cache_lowercase_fields(self._used_fields)
+                labels = {}
+                # Outcomes of conditions shared between rules, for this email
+                condition_results = {} if self._shares_conditions else None
+                # Rules whose indexed 'equals' condition fails cannot match and are not evaluated
+                ruled_out = self._gated_rules.difference(self._equals_candidates(email_obj)) if self._gated_rules else ()
+                if email_obj.message_body is None and self._body_rules:
+                    # Without the body, e.g. "does not equal" would match on missing data
+                    ruled_out = self._body_rules.union(ruled_out)
+                for rule in self.rules:
+                    if rule not in ruled_out and rule.matches(email_obj, condition_results):
+                        logger.debug("  Email matches rule: '%s'", rule.description)
+                        for action in rule.actions:
+                            change = action.label_change(gmail_client, email_obj)
+                            if change is None:
+                                print(f"Action '{action.action_type}' failed for email {email_obj.id}.")
+                                continue
+                            add_label_ids, remove_label_ids = change
+                            labels.update(dict.fromkeys(remove_label_ids, False))
+                            labels.update(dict.fromkeys(add_label_ids, True))
+                    else:
+                        logger.debug("  Email does NOT match rule: '%s'", rule.description)
+                if labels:
+                    ops.append((
+                        email_obj.id,
+                        [label_id for label_id, added in labels.items() if added],
+                        [label_id for label_id, added in labels.items() if not added],
+                    ))
+        return ops
+
+    def apply_label_changes(self, ops, gmail_client):
+        """
+        Sends collected label changes to Gmail. Emails receiving the identical change are
+        modified together with one batchModify call; distinct changes are sent concurrently.
+
+        Args:
+            ops (list): (message_id, add_label_ids, remove_label_ids) tuples from collect_label_changes.
+            gmail_client (GmailClient): An instance of the GmailClient for executing actions.
+
+        Returns:
+            list: IDs of the emails whose changes could not be applied.
+        """
+        groups = {}
+        for message_id, add_label_ids, remove_label_ids in ops:
+            groups.setdefault((tuple(sorted(add_label_ids)), tuple(sorted(remove_label_ids))), []).append(message_id)
+
+        def apply_group(group):
+            (add_label_ids, remove_label_ids), message_ids = group
+            return gmail_client.batch_modify(message_ids, list(add_label_ids), list(remove_label_ids))
+
+        results = {}
+        if groups:
+            # Rules are read-only here and each group touches different emails, so groups are independent
+            with ThreadPoolExecutor(max_workers=min(MAX_API_WORKERS, len(groups))) as executor:
+                for group_results in executor.map(apply_group, groups.items()):
+                    results.update(group_results)
+        failed = [message_id for message_id, succeeded in results.items() if not succeeded]
+        if failed:
+            print(f"Failed to apply actions to {len(failed)} emails: {', '.join(failed)}")
+        return failed
@@ -4,11 +4,130 @@ import unittest
 import os
 from datetime import datetime
 import json
-from database_manager import DatabaseManager
+from database_manager import DatabaseManager, UPSERT_ROWS_PER_STATEMENT
 import sys
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
+# Applied to the shared test database on top of DatabaseManager's own PRAGMAs
+TEST_PRAGMAS = """
+    PRAGMA journal_mode=MEMORY;
+    PRAGMA synchronous=OFF;
+    PRAGMA temp_store=MEMORY;
+    PRAGMA locking_mode=EXCLUSIVE;
+"""
+
+
+# Received date for rows written with raw SQL; fixed so the tests never depend on the clock
+FIXED_ISO = '2024-01-01T00:00:00'
+
+# Read-only email fixtures shared by the tests; DatabaseManager never mutates its input
+EMAIL_1 = {
+    'id': 'test_id_1',
+    'threadId': 'thread_id_1',
+    'From': 'sender@example.com',
+    'Subject': 'Test Subject 1',
+    'Received Date/Time': datetime(2023, 1, 15, 10, 30, 0),
+    'Message Body': 'This is the body of the test email 1.',
+    'labelIds': ['INBOX', 'UNREAD']
+}
+
+EMAIL_ORIGINAL = {
+    'id': 'test_id_2',
+    'threadId': 'thread_id_2',
+    'From': 'old@example.com',
+    'Subject': 'Old Subject',
+    'Received Date/Time': datetime(2023, 2, 1, 9, 0, 0),
+    'Message Body': 'Old body.',
+    'labelIds': ['INBOX']
+}
+
+EMAIL_UPDATED = {
+    'id': 'test_id_2',  # Same ID
+    'threadId': 'thread_2_updated',  # Updated thread ID
+    'From': 'new@example.com',  # Updated sender
+    'Subject': 'New Subject',
+    'Received Date/Time': datetime(2023, 2, 1, 10, 0, 0),
+    'Message Body': 'New body content.',
+    'labelIds': ['INBOX', 'IMPORTANT']  # Updated labels
+}
+
+EMAIL_WITH_BODY = {
+    'id': 'keep_body_id',
+    'threadId': 'keep_body_thread',
+    'From': 'keep@example.com',
+    'Subject': 'Keep Body',
+    'Received Date/Time': datetime(2023, 5, 2, 9, 0, 0),
+    'Message Body': 'Loaded body.',
+    'labelIds': ['INBOX']
+}
+
+EMAIL_A = {
+    'id': 'test_id_3',
+    'threadId': 'thread_id_3',
+    'From': 'a@example.com',
+    'Subject': 'Subject A',
+    'Received Date/Time': datetime(2023, 3, 1, 11, 0, 0).isoformat(),
+    'Message Body': 'Body A',
+    'labelIds': ['INBOX']
+}
+
+EMAIL_B = {
+    'id': 'test_id_4',
+    'threadId': 'thread_id_4',
+    'From': 'b@example.com',
+    'Subject': 'Subject B',
+    'Received Date/Time': datetime(2023, 3, 2, 12, 0, 0).isoformat(),
+    'Message Body': 'Body B',
+    'labelIds': ['SENT', 'STARRED']
+}
+
+BULK_EMAILS = [
+    {
+        'id': 'bulk_id_1',
+        'threadId': 'bulk_thread_1',
+        'From': 'bulk_sender1@example.com',
+        'Subject': 'Bulk Subject 1',
+        'Received Date/Time': datetime(2024, 1, 1, 12, 0, 0),
+        'Message Body': 'This is bulk email 1.',
+        'labelIds': ['INBOX']
+    },
+    {
+        'id': 'bulk_id_2',
+        'threadId': 'bulk_thread_2',
+        'From': 'bulk_sender2@example.com',
+        'Subject': 'Bulk Subject 2',
+        'Received Date/Time': datetime(2024, 1, 2, 13, 0, 0),
+        'Message Body': 'This is bulk email 2.',
+        'labelIds': ['STARRED']
+    }
+]
+
+CHUNK_EMAILS = [
+    {
+        'id': f'chunk_id_{i}',
+        'threadId': f'chunk_thread_{i}',
+        'From': 'chunk@example.com',
+        'Subject': f'Chunk Subject {i}',
+        'Received Date/Time': datetime(2024, 1, 3, 9, i, 0).isoformat(),
+        'Message Body': 'Chunked body.',
+        'labelIds': ['INBOX']
+    }
+    for i in range(7)
+]
+
+ERROR_EMAILS = [
+    {
+        'id': 'error_id_1',
+        'threadId': 'error_thread_1',
+        'From': 'error_sender@example.com',
+        'Subject': 'Error Subject 1',
+        'Received Date/Time': datetime(2024, 2, 1, 10, 0, 0),
+        'Message Body': 'This should fail.',
+        'labelIds': ['INBOX']
+    }
+]
+
 
 class TestDatabaseManager(unittest.TestCase):
     """
@@ -19,19 +138,45 @@ class TestDatabaseManager(unittest.TestCase):
     # Define an in-memory database name for testing
     TEST_DB_NAME = ':memory:'
 
+    @classmethod
+    def setUpClass(cls):
+        """
+        Open one in-memory database, schema included, shared by all tests.
+        """
+        cls.db_manager = DatabaseManager(db_name=cls.TEST_DB_NAME)
+        # Durability is irrelevant for a throwaway test database
+        cls.db_manager.cursor.executescript(TEST_PRAGMAS)
+
+    @classmethod
+    def tearDownClass(cls):
+        """
+        Close the shared database connection after the last test.
+        """
+        cls.db_manager.close_connection()
+
     def setUp(self):
         """
-        Set up an in-memory database for each test.
+        Start each test from empty tables instead of recreating the database and schema.
+        Tests commit their own transactions, so rows are deleted rather than rolled back.
         """
-        self.db_manager = DatabaseManager(db_name=self.TEST_DB_NAME)
-        # Ensure the table is created for the new in-memory DB
-        self.db_manager._create_table()  # Call explicitly if needed, though constructor already does this
+        with self.db_manager.conn:
+            self.db_manager.conn.execute('DELETE FROM emails')
+            self.db_manager.conn.execute('DELETE FROM sync_state')
 
     def tearDown(self):
         """
-        Close the database connection after each test.
+        Discard any transaction a test left open.
         """
-        self.db_manager.close_connection()
+        if self.db_manager.conn.in_transaction:
+            self.db_manager.conn.rollback()
+
+    def _fetch_row(self, email_id):
+        """
+        Returns the stored columns of one email, looked up by primary key, or None.
+        """
+        self.db_manager.cursor.execute('SELECT * FROM emails WHERE id = ?', (email_id,))
+        row = self.db_manager.cursor.fetchone()
+        return dict(row) if row is not None else None
 
     def test_connection_and_table_creation(self):
         """
@@ -44,73 +189,170 @@ class TestDatabaseManager(unittest.TestCase):
         self.db_manager.cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='emails';")
         self.assertIsNotNone(self.db_manager.cursor.fetchone())
 
+    def test_connection_pragmas(self):
+        """
+        Test that the tuned PRAGMAs are applied to the connection.
+        """
+        self.db_manager.cursor.execute("PRAGMA busy_timeout")
+        self.assertEqual(self.db_manager.cursor.fetchone()[0], 5000)
+        self.db_manager.cursor.execute("PRAGMA temp_store")
+        self.assertEqual(self.db_manager.cursor.fetchone()[0], 2)  # 2 == MEMORY
+
+    def test_context_manager_closes_connection(self):
+        """
+        Test that leaving a `with` block closes the connection, and closing again is harmless.
+        """
+        with DatabaseManager(db_name=self.TEST_DB_NAME) as db_manager:
+            self.assertIsNotNone(db_manager.conn)
+        self.assertIsNone(db_manager.conn)
+        db_manager.close_connection()
+
     def test_insert_email(self):
         """
         Test inserting a new email record.
         """
-        email_data = {
-            'id': 'test_id_1',
-            'threadId': 'thread_id_1',
-            'From': 'sender@example.com',
-            'Subject': 'Test Subject 1',
-            'Received Date/Time': datetime(2023, 1, 15, 10, 30, 0),
-            'Message Body': 'This is the body of the test email 1.',
-            'labelIds': ['INBOX', 'UNREAD']
-        }
-
-        self.assertTrue(self.db_manager.insert_email(email_data))
+        self.assertTrue(self.db_manager.insert_email(EMAIL_1))
 
         # Verify insertion
-        self.db_manager.cursor.execute("SELECT * FROM emails WHERE id='test_id_1'")
-        row = self.db_manager.cursor.fetchone()
-        self.assertIsNotNone(row)
-        self.assertEqual(row['id'], 'test_id_1')
-        self.assertEqual(row['from'], 'sender@example.com')
-        self.assertEqual(row['subject'], 'Test Subject 1')
-        self.assertEqual(row['received_date_time'], email_data['Received Date/Time'].isoformat())
-        self.assertEqual(row['message_body'], 'This is the body of the test email 1.')
-        self.assertEqual(json.loads(row['label_ids']), ['INBOX', 'UNREAD'])
+        self.assertDictEqual(self._fetch_row('test_id_1'), {
+            'id': 'test_id_1',
+            'thread_id': 'thread_id_1',
+            'from': 'sender@example.com',
+            'subject': 'Test Subject 1',
+            'received_date_time': EMAIL_1['Received Date/Time'].isoformat(),
+            'message_body': 'This is the body of the test email 1.',
+            'label_ids': 'INBOX,UNREAD'
+        })
 
     def test_insert_email_replace_existing(self):
         """
         Test inserting an email with an existing ID, which should update the record.
         """
-        email_data_original = {
-            'id': 'test_id_2',
-            'threadId': 'thread_id_2',
-            'From': 'old@example.com',
-            'Subject': 'Old Subject',
-            'Received Date/Time': datetime(2023, 2, 1, 9, 0, 0),
-            'Message Body': 'Old body.',
-            'labelIds': ['INBOX']
-        }
-        self.db_manager.insert_email(email_data_original)
-
-        email_data_updated = {
-            'id': 'test_id_2',  # Same ID
-            'threadId': 'thread_2_updated',  # Updated thread ID
-            'From': 'new@example.com',  # Updated sender
-            'Subject': 'New Subject',
-            'Received Date/Time': datetime(2023, 2, 1, 10, 0, 0),
-            'Message Body': 'New body content.',
-            'labelIds': ['INBOX', 'IMPORTANT']  # Updated labels
-        }
-        self.assertTrue(self.db_manager.insert_email(email_data_updated))
+        # Both inserts share one transaction; the second still has to replace the first
+        self.db_manager.begin_transaction()
+        self.db_manager.insert_email(EMAIL_ORIGINAL)
+        self.assertTrue(self.db_manager.insert_email(EMAIL_UPDATED))
+        self.db_manager.commit_transaction()
 
         # Verify update
-        self.db_manager.cursor.execute("SELECT * FROM emails WHERE id='test_id_2'")
-        row = self.db_manager.cursor.fetchone()
+        row = self._fetch_row('test_id_2')
         self.assertIsNotNone(row)
         self.assertEqual(row['id'], 'test_id_2')
         self.assertEqual(row['from'], 'new@example.com')
         self.assertEqual(row['subject'], 'New Subject')
         self.assertEqual(row['thread_id'], 'thread_2_updated')
-        self.assertEqual(json.loads(row['label_ids']), ['INBOX', 'IMPORTANT'])
+        self.assertEqual(row['label_ids'], 'INBOX,IMPORTANT')
 
         # Ensure only one record exists for this ID
         self.db_manager.cursor.execute("SELECT COUNT(*) FROM emails WHERE id='test_id_2'")
         self.assertEqual(self.db_manager.cursor.fetchone()[0], 1)
 
+    def test_insert_email_within_transaction(self):
+        """
+        Test that several inserts inside an explicit transaction are committed together.
+        """
+        self.db_manager.begin_transaction()
+        for i in range(3):
+            self.assertTrue(self.db_manager.insert_email(dict(EMAIL_1, id=f'txn_id_{i}')))
+        self.assertTrue(self.db_manager.conn.in_transaction)
+        self.db_manager.commit_transaction()
+        self.assertFalse(self.db_manager.conn.in_transaction)
+
+        self.db_manager.cursor.execute("SELECT COUNT(*) FROM emails")
+        self.assertEqual(self.db_manager.cursor.fetchone()[0], 3)
+
+    def test_insert_email_repeated_within_transaction(self):
+        """
+        Test a thousand single-row inserts in one transaction, each changing exactly one row.
+        """
+        changes_before = self.db_manager.conn.total_changes
+        self.db_manager.begin_transaction()
+        for i in range(1000):
+            self.assertTrue(self.db_manager.insert_email(dict(EMAIL_1, id=f'prepared_id_{i}')))
+        self.db_manager.commit_transaction()
+        self.assertEqual(self.db_manager.conn.total_changes - changes_before, 1000)
+
+    def test_rollback_transaction(self):
+        """
+        Test that rolling back an explicit transaction discards its inserts.
+        """
+        self.db_manager.begin_transaction()
+        self.db_manager.insert_email(EMAIL_1)
+        self.db_manager.rollback_transaction()
+
+        self.db_manager.cursor.execute("SELECT COUNT(*) FROM emails")
+        self.assertEqual(self.db_manager.cursor.fetchone()[0], 0)
+
+    def test_update_message_body(self):
+        """
+        Test storing a message body for an email inserted without one.
+        """
+        self.db_manager.insert_email(dict(EMAIL_1, **{'Message Body': None}))
+        self.assertTrue(self.db_manager.update_message_body('test_id_1', 'Hydrated body.'))
+
+        self.db_manager.cursor.execute("SELECT message_body FROM emails WHERE id='test_id_1'")
+        self.assertEqual(self.db_manager.cursor.fetchone()[0], 'Hydrated body.')
+
+    def test_insert_email_keeps_loaded_body(self):
+        """
+        Test that re-inserting an email without a body keeps the body already stored.
+        """
+        self.db_manager.begin_transaction()
+        self.db_manager.insert_email(EMAIL_WITH_BODY)
+        self.assertTrue(self.db_manager.insert_email(dict(EMAIL_WITH_BODY, **{'Message Body': None, 'labelIds': []})))
+        self.db_manager.commit_transaction()
+
+        self.db_manager.cursor.execute("SELECT message_body, label_ids FROM emails WHERE id='keep_body_id'")
+        row = self.db_manager.cursor.fetchone()
+        self.assertEqual(row['message_body'], 'Loaded body.')
+        self.assertEqual(row['label_ids'], '')
+
+    def test_get_stored_email_ids(self):
+        """
+        Test retrieving the set of stored email IDs.
+        """
+        self.assertEqual(self.db_manager.get_stored_email_ids(), set())
+        self.db_manager.insert_many_emails([dict(EMAIL_1, id=email_id) for email_id in ('ids_1', 'ids_2')])
+        self.assertEqual(self.db_manager.get_stored_email_ids(), {'ids_1', 'ids_2'})
+
+    def test_long_message_body_compressed(self):
+        """
+        Test that long bodies are stored compressed and read back unchanged.
+        """
+        long_body = 'Quarterly report line.\n' * 200
+        self.db_manager.insert_email(dict(EMAIL_1, **{'Message Body': long_body}))
+
+        self.db_manager.cursor.execute("SELECT message_body FROM emails WHERE id='test_id_1'")
+        stored = self.db_manager.cursor.fetchone()[0]
+        self.assertIsInstance(stored, bytes)
+        self.assertLess(len(stored), len(long_body))
+
+        emails = self.db_manager.get_all_emails()
+        self.assertEqual(emails[0]['message_body'], long_body)
+
+    def test_sync_state(self):
+        """
+        Test storing, reading and overwriting sync state values.
+        """
+        self.assertIsNone(self.db_manager.get_sync_state('history_id'))
+        self.assertTrue(self.db_manager.set_sync_state('history_id', '1000'))
+        self.assertEqual(self.db_manager.get_sync_state('history_id'), '1000')
+        self.assertTrue(self.db_manager.set_sync_state('history_id', '2000'))
+        self.assertEqual(self.db_manager.get_sync_state('history_id'), '2000')
+
+    def test_insert_many_emails_joins_caller_transaction(self):
+        """
+        Test that bulk inserts inside an explicit transaction are not committed on their own.
+        """
+        rows = [('join_id', 'join_thread', 'join@example.com', 'Join', None, None, [])]
+        self.db_manager.begin_transaction()
+        self.assertEqual(self.db_manager.insert_many_emails(rows), 1)
+        self.assertTrue(self.db_manager.conn.in_transaction)
+        self.db_manager.rollback_transaction()
+
+        self.db_manager.cursor.execute("SELECT COUNT(*) FROM emails")
+        self.assertEqual(self.db_manager.cursor.fetchone()[0], 0)
+
     def test_get_all_emails_empty(self):
         """
         Test retrieving all emails when the table is empty.
@@ -122,41 +364,54 @@ class TestDatabaseManager(unittest.TestCase):
         """
         Test retrieving all emails when there is data in the table.
         """
-        email_data_1 = {
-            'id': 'test_id_3',
-            'threadId': 'thread_id_3',
-            'From': 'a@example.com',
-            'Subject': 'Subject A',
-            'Received Date/Time': datetime(2023, 3, 1, 11, 0, 0),
-            'Message Body': 'Body A',
-            'labelIds': ['INBOX']
-        }
-        email_data_2 = {
-            'id': 'test_id_4',
-            'threadId': 'thread_id_4',
-            'From': 'b@example.com',
-            'Subject': 'Subject B',
-            'Received Date/Time': datetime(2023, 3, 2, 12, 0, 0),
-            'Message Body': 'Body B',
-            'labelIds': ['SENT', 'STARRED']
-        }
-        self.db_manager.insert_email(email_data_1)
-        self.db_manager.insert_email(email_data_2)
+        self.assertEqual(self.db_manager.insert_many_emails([EMAIL_A, EMAIL_B]), 2)
 
-        emails = self.db_manager.get_all_emails()
+        # Index the result once by ID instead of scanning it for every email checked
+        emails = {e['id']: e for e in self.db_manager.get_all_emails()}
         self.assertEqual(len(emails), 2)
 
         # Verify content and type conversions
-        email1 = next(e for e in emails if e['id'] == 'test_id_3')
-        self.assertEqual(email1['from'], 'a@example.com')
-        self.assertIsInstance(email1['received_date_time'], datetime)
-        self.assertEqual(email1['received_date_time'], email_data_1['Received Date/Time'])
-        self.assertEqual(email1['label_ids'], ['INBOX'])
+        self.assertDictEqual(emails['test_id_3'], {
+            'id': 'test_id_3',
+            'thread_id': 'thread_id_3',
+            'from': 'a@example.com',
+            'subject': 'Subject A',
+            'received_date_time': datetime(2023, 3, 1, 11, 0, 0),
+            'message_body': 'Body A',
+            'label_ids': ['INBOX']
+        })
+        self.assertDictEqual(emails['test_id_4'], {
+            'id': 'test_id_4',
+            'thread_id': 'thread_id_4',
+            'from': 'b@example.com',
+            'subject': 'Subject B',
+            'received_date_time': datetime(2023, 3, 2, 12, 0, 0),
+            'message_body': 'Body B',
+            'label_ids': ['SENT', 'STARRED']
+        })
+
+    def test_iter_email_tuples(self):
+        """
+        Test that email records come back as positional tuples, with or without the body.
+        """
+        self.db_manager.insert_email(EMAIL_1)
+
+        self.assertEqual(
+            [('test_id_1', 'thread_id_1', 'sender@example.com', 'Test Subject 1', datetime(2023, 1, 15, 10, 30, 0),
+              'This is the body of the test email 1.', ['INBOX', 'UNREAD'])],
+            list(self.db_manager.iter_email_tuples())
+        )
+        (record,) = self.db_manager.iter_email_tuples(include_body=False)
+        self.assertIsNone(record[5])
 
-        email2 = next(e for e in emails if e['id'] == 'test_id_4')
-        self.assertEqual(email2['subject'], 'Subject B')
-        self.assertIsInstance(email2['received_date_time'], datetime)
-        self.assertEqual(email2['label_ids'], ['SENT', 'STARRED'])
+    def test_indexes_created(self):
+        """
+        Test that the secondary indexes exist.
+        """
+        self.db_manager.cursor.execute("SELECT name FROM sqlite_master WHERE type='index' AND tbl_name='emails'")
+        index_names = {row[0] for row in self.db_manager.cursor.fetchall()}
+        self.assertIn('idx_emails_received', index_names)
+        self.assertIn('idx_emails_from', index_names)
 
     def test_get_all_emails_malformed_json_label_ids(self):
         """
@@ -171,7 +426,7 @@ class TestDatabaseManager(unittest.TestCase):
             'thread',
             'mal@formed.com',
             'Malformed',
-            datetime.now().isoformat(),
+            FIXED_ISO,
             'Body',
             '{invalid json'  # This is the malformed JSON string
         ))
@@ -182,32 +437,25 @@ class TestDatabaseManager(unittest.TestCase):
         self.assertEqual(emails[0]['id'], 'malformed_id')
         self.assertEqual(emails[0]['label_ids'], [])  # Should default to empty list
 
+    def test_get_all_emails_legacy_json_label_ids(self):
+        """
+        Test that label_ids stored as a JSON array by older versions are still decoded.
+        """
+        self.db_manager.cursor.execute(
+            'INSERT INTO emails (id, thread_id, "from", subject, received_date_time, message_body, label_ids) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?)',
+            ('legacy_id', 'thread', 'legacy@example.com', 'Legacy', None, 'Body', json.dumps(['INBOX', 'STARRED']))
+        )
+        self.db_manager.conn.commit()
+
+        emails = self.db_manager.get_all_emails()
+        self.assertEqual(emails[0]['label_ids'], ['INBOX', 'STARRED'])
+
     def test_insert_many_emails_success(self):
         """
         Test successful bulk insertion of multiple email records.
         """
-        emails_data = [
-            {
-                'id': 'bulk_id_1',
-                'threadId': 'bulk_thread_1',
-                'From': 'bulk_sender1@example.com',
-                'Subject': 'Bulk Subject 1',
-                'Received Date/Time': datetime(2024, 1, 1, 12, 0, 0),
-                'Message Body': 'This is bulk email 1.',
-                'labelIds': ['INBOX']
-            },
-            {
-                'id': 'bulk_id_2',
-                'threadId': 'bulk_thread_2',
-                'From': 'bulk_sender2@example.com',
-                'Subject': 'Bulk Subject 2',
-                'Received Date/Time': datetime(2024, 1, 2, 13, 0, 0),
-                'Message Body': 'This is bulk email 2.',
-                'labelIds': ['STARRED']
-            }
-        ]
-
-        inserted_count = self.db_manager.insert_many_emails(emails_data)
+        inserted_count = self.db_manager.insert_many_emails(BULK_EMAILS)
         self.assertEqual(inserted_count, 2)
 
         # Verify insertion by fetching all and checking count and content
@@ -223,6 +471,71 @@ class TestDatabaseManager(unittest.TestCase):
         self.assertEqual(email1['message_body'], 'This is bulk email 1.')
         self.assertEqual(email1['label_ids'], ['INBOX'])
 
+    def test_insert_many_emails_from_rows(self):
+        """
+        Test bulk insertion of row tuples as produced by Email.to_row().
+        """
+        rows = [
+            ('row_id_1', 'row_thread_1', 'row1@example.com', 'Row Subject 1',
+             datetime(2024, 1, 4, 9, 0, 0).isoformat(), 'Row body 1.', ['INBOX']),
+            ('row_id_2', 'row_thread_2', 'row2@example.com', 'Row Subject 2',
+             None, None, []),
+        ]
+
+        self.assertEqual(self.db_manager.insert_many_emails(rows), 2)
+
+        emails = {e['id']: e for e in self.db_manager.get_all_emails()}
+        self.assertEqual(emails['row_id_1']['received_date_time'], datetime(2024, 1, 4, 9, 0, 0))
+        self.assertEqual(emails['row_id_1']['label_ids'], ['INBOX'])
+        self.assertIsNone(emails['row_id_2']['message_body'])
+        self.assertEqual(emails['row_id_2']['label_ids'], [])
+
+    def test_insert_many_emails_in_chunks(self):
+        """
+        Test that bulk insertion spanning several chunks stores every row.
+        """
+        inserted_count = self.db_manager.insert_many_emails(CHUNK_EMAILS, batch_size=3)
+        self.assertEqual(inserted_count, 7)
+
+        self.db_manager.cursor.execute("SELECT COUNT(*) FROM emails")
+        self.assertEqual(self.db_manager.cursor.fetchone()[0], 7)
+
+    def test_insert_many_emails_commits_once_per_call(self):
+        """
+        Test that bulk insertion commits once however many rows and chunks it writes.
+        """
+        # sqlite3.Connection.commit cannot be patched, so COMMIT statements are counted through the trace hook
+        statements = []
+        self.db_manager.conn.set_trace_callback(statements.append)
+        try:
+            for n in (1, 100, 10_000):
+                with self.subTest(n=n):
+                    statements.clear()
+                    rows = [dict(EMAIL_A, id=f'sweep_{n}_{i}') for i in range(n)]
+                    self.assertEqual(self.db_manager.insert_many_emails(rows), n)
+                    self.assertEqual(statements.count('COMMIT'), 1)
+                    self.db_manager.cursor.execute("SELECT COUNT(*) FROM emails WHERE id LIKE ?", (f'sweep_{n}_%',))
+                    self.assertEqual(self.db_manager.cursor.fetchone()[0], n)
+        finally:
+            self.db_manager.conn.set_trace_callback(None)
+
+    def test_insert_many_emails_uses_multi_row_statements(self):
+        """
+        Test that bulk insertion sends one multi-row INSERT per group of rows instead of one per row.
+        """
+        statements = []
+        self.db_manager.conn.set_trace_callback(statements.append)
+        try:
+            rows = [dict(EMAIL_A, id=f'multi_{i}') for i in range(500)]
+            self.assertEqual(self.db_manager.insert_many_emails(rows), 500)
+        finally:
+            self.db_manager.conn.set_trace_callback(None)
+
+        inserts = [sql for sql in statements if sql.lstrip().startswith('INSERT INTO emails')]
+        self.assertEqual(len(inserts), -(-500 // UPSERT_ROWS_PER_STATEMENT))
+        self.db_manager.cursor.execute("SELECT COUNT(*) FROM emails WHERE id LIKE 'multi_%'")
+        self.assertEqual(self.db_manager.cursor.fetchone()[0], 500)
+
     def test_insert_many_emails_empty_list(self):
         """
         Test handling of an empty list for bulk insertion.
@@ -242,25 +555,15 @@ class TestDatabaseManager(unittest.TestCase):
         Test error handling during bulk insertion.
         Simulate an error by closing the connection prematurely.
         """
-        emails_data = [
-            {
-                'id': 'error_id_1',
-                'threadId': 'error_thread_1',
-                'From': 'error_sender@example.com',
-                'Subject': 'Error Subject 1',
-                'Received Date/Time': datetime(2024, 2, 1, 10, 0, 0),
-                'Message Body': 'This should fail.',
-                'labelIds': ['INBOX']
-            }
-        ]
-
-        # Simulate a database error by making the connection invalid
-        self.db_manager.conn.close()
-        self.db_manager.conn = None  # Explicitly set to None to simulate broken connection
-        self.db_manager.cursor = None  # Also invalidate cursor
+        # Simulate a database error by making the connection invalid.
+        # A separate manager is broken so the connection shared by the other tests stays usable.
+        db_manager = DatabaseManager(db_name=self.TEST_DB_NAME)
+        db_manager.conn.close()
+        db_manager.conn = None  # Explicitly set to None to simulate broken connection
+        db_manager.cursor = None  # Also invalidate cursor
 
         # The method should catch the error and return 0
-        inserted_count = self.db_manager.insert_many_emails(emails_data)
+        inserted_count = db_manager.insert_many_emails(ERROR_EMAILS)
         self.assertEqual(inserted_count, 0)
 
 
@@ -0,0 +1,90 @@
+# tests/test_fetch_and_store.py
+
+import unittest
+from unittest.mock import MagicMock, patch
+import os
+import sys
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from fetch_and_store import fetch_and_store_emails, HISTORY_ID_STATE_KEY
+
+# Parsed message details as yielded by GmailClient.iter_emails_details_batches
+EMAIL_DETAILS = [
+    {'id': f'msg{i}', 'threadId': f'thread{i}', 'From': 'sender@example.com',
+     'Subject': f'Subject {i}', 'Received Date/Time': datetime(2025, 6, 18, 9, 13, tzinfo=timezone.utc),
+     'Message Body': None, 'labelIds': ['INBOX']}
+    for i in range(4)
+]
+
+
+# One email per batch and a single queue slot, so a stalled writer would block the producer
+@patch('fetch_and_store.DB_WRITER_QUEUE_SIZE', 1)
+@patch('fetch_and_store.DB_WRITER_CHUNK_SIZE', 1)
+class TestFetchAndStore(unittest.TestCase):
+    """
+    Unit tests for fetch_and_store_emails and its database writer thread.
+    GmailClient and DatabaseManager are mocked; the writer thread runs for real.
+    """
+
+    def setUp(self):
+        """Set up mocked Gmail and database clients returned by their context managers."""
+        self.gmail_client = MagicMock()
+        self.gmail_client.get_current_history_id.return_value = '12345'
+        self.gmail_client.get_emails.return_value = [{'id': details['id']} for details in EMAIL_DETAILS]
+        self.gmail_client.iter_emails_details_batches.return_value = iter([[details] for details in EMAIL_DETAILS])
+
+        self.db_manager = MagicMock()
+        self.db_manager.get_sync_state.return_value = None
+        self.db_manager.get_stored_email_ids.return_value = set()
+        self.db_manager.insert_many_emails.side_effect = len
+
+        gmail_patcher = patch('fetch_and_store.GmailClient')
+        db_patcher = patch('fetch_and_store.DatabaseManager')
+        mock_gmail_cls = gmail_patcher.start()
+        mock_db_cls = db_patcher.start()
+        self.addCleanup(gmail_patcher.stop)
+        self.addCleanup(db_patcher.stop)
+        mock_gmail_cls.return_value.__enter__.return_value = self.gmail_client
+        # The main thread and the writer thread both get the same database mock
+        mock_db_cls.return_value.__enter__.return_value = self.db_manager
+
+    def test_stores_all_batches_and_records_history_id(self):
+        """Test that every fetched email is stored and the history ID is then recorded."""
+        fetch_and_store_emails()
+
+        stored_ids = [row[0] for call in self.db_manager.insert_many_emails.call_args_list for row in call.args[0]]
+        self.assertEqual(stored_ids, [details['id'] for details in EMAIL_DETAILS])
+        self.db_manager.set_sync_state.assert_called_once_with(HISTORY_ID_STATE_KEY, '12345')
+
+    def test_failed_insert_does_not_hang_or_record_history_id(self):
+        """Test that an insert raising in the writer thread neither hangs the producer nor advances the history ID."""
+        self.db_manager.insert_many_emails.side_effect = TypeError("bad row")
+
+        fetch_and_store_emails()
+
+        self.assertEqual(self.db_manager.insert_many_emails.call_count, len(EMAIL_DETAILS))
+        self.db_manager.set_sync_state.assert_not_called()
+
+    def test_dropped_details_do_not_record_history_id(self):
+        """Test that messages whose details could not be fetched keep the history ID from advancing."""
+        self.gmail_client.iter_emails_details_batches.return_value = iter([[details] for details in EMAIL_DETAILS[1:]])
+
+        fetch_and_store_emails()
+
+        self.assertEqual(self.db_manager.insert_many_emails.call_count, len(EMAIL_DETAILS) - 1)
+        self.db_manager.set_sync_state.assert_not_called()
+
+    def test_failed_listing_does_not_record_history_id(self):
+        """Test that a listing error is not mistaken for an empty mailbox."""
+        self.gmail_client.get_emails.return_value = None
+
+        fetch_and_store_emails()
+
+        self.gmail_client.iter_emails_details_batches.assert_not_called()
+        self.db_manager.set_sync_state.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -3,16 +3,27 @@
 import unittest
 from unittest.mock import MagicMock, patch
 import os
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 import json
 import base64
 from bs4 import BeautifulSoup
 import sys
+import tempfile
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from gmail_client import GmailClient
-from config import TOKEN_FILE, CREDENTIALS_FILE
+from googleapiclient.errors import HttpError
+
+from gmail_client import GmailClient, FULL_MESSAGE_FIELDS, METADATA_MESSAGE_FIELDS, LIST_FIELDS
+from config import TOKEN_FILE, CREDENTIALS_FILE, API_NUM_RETRIES
+
+# Base64url-encoded MIME part bodies for the message fixtures, encoded once at import
+PLAIN_BODY_B64 = base64.urlsafe_b64encode(b'Test plain text body').decode('utf-8')
+HTML_BODY_B64 = base64.urlsafe_b64encode(b'<html><body><p>Test HTML body</p></body></html>').decode('utf-8')
+HTML_ONLY_BODY_B64 = base64.urlsafe_b64encode(b'<html><body><h1>Hello</h1><p>World</p></body></html>').decode('utf-8')
+PREFERRED_PLAIN_BODY_B64 = base64.urlsafe_b64encode(b'Plain text preferred').decode('utf-8')
+SECONDARY_HTML_BODY_B64 = base64.urlsafe_b64encode(b'<html><body>HTML content</body></html>').decode('utf-8')
+INVALID_UTF8_BODY_B64 = base64.urlsafe_b64encode(b'caf\xe9 menu').decode('utf-8')
 
 
 class TestGmailClient(unittest.TestCase):
@@ -21,34 +32,50 @@ class TestGmailClient(unittest.TestCase):
     Mocks external dependencies like Google API client and file system operations.
     """
 
+    @classmethod
     @patch('gmail_client.os.path.exists')
     @patch('gmail_client.InstalledAppFlow.from_client_secrets_file')
     @patch('gmail_client.build')
     @patch('gmail_client.open', MagicMock())
-    def setUp(self, mock_build, mock_flow_from_file, mock_os_exists):
+    def setUpClass(cls, mock_build, mock_flow_from_file, mock_os_exists):
         """
-        Set up for each test. Mocks authentication flow and Gmail API service.
+        Runs the mocked authentication flow once; every test reuses its credentials.
         """
         # Mock the flow.run_local_server() return value (credentials object)
-        self.mock_creds = MagicMock()
-        self.mock_creds.valid = True
-        self.mock_creds.expired = False
-        self.mock_creds.to_json.return_value = '{"mock_token": "some_value"}'
-        mock_flow_from_file.return_value.run_local_server.return_value = self.mock_creds
+        cls.mock_creds = MagicMock()
+        cls.mock_creds.valid = True
+        cls.mock_creds.expired = False
+        cls.mock_creds.to_json.return_value = '{"mock_token": "some_value"}'
+        mock_flow_from_file.return_value.run_local_server.return_value = cls.mock_creds
+        mock_build.return_value = MagicMock()
+
+        # Ensure credentials.json exists for the flow to be created
+        mock_os_exists.side_effect = lambda x: x == CREDENTIALS_FILE
 
-        # Configure the return value for gmail_client.build() directly
+        cls.authenticated_client = GmailClient(label_cache_file=None)
+
+    def setUp(self):
+        """
+        Set up for each test: a fresh Gmail API service mock and a client using it,
+        without repeating the authentication flow.
+        """
         self.mock_service = MagicMock()
-        mock_build.return_value = self.mock_service
+        # Resources reached through users(); bound once instead of walking the mock chain in every test
+        self.messages_mock = self.mock_service.users.return_value.messages.return_value
+        self.labels_mock = self.mock_service.users.return_value.labels.return_value
+        self.mock_service.users.return_value.getProfile.return_value.execute.return_value = {
+            'emailAddress': 'me@example.com', 'historyId': '1000'
+        }
 
         # Configure common chained calls that GmailClient makes on the mock_service
-        self.mock_service.users.return_value.messages.return_value.list.return_value.execute.return_value = {
+        self.messages_mock.list.return_value.execute.return_value = {
             'messages': [{'id': 'msg1', 'threadId': 'thread1'}, {'id': 'msg2', 'threadId': 'thread2'}]
         }
 
         # Mock for messages().get().execute()
         # Create a mock for the result of .get() call
         self.mock_get_response = MagicMock()
-        self.mock_service.users.return_value.messages.return_value.get.return_value = self.mock_get_response
+        self.messages_mock.get.return_value = self.mock_get_response
 
         # Set a default return value for execute() on this mock_get_response
         self.mock_get_response.execute.return_value = {
@@ -63,16 +90,14 @@ class TestGmailClient(unittest.TestCase):
                 ],
                 'parts': [
                     {'mimeType': 'text/plain',
-                     'body': {'data': base64.urlsafe_b64encode(b'Test plain text body').decode('utf-8')}},
-                    {'mimeType': 'text/html', 'body': {
-                        'data': base64.urlsafe_b64encode(b'<html><body><p>Test HTML body</p></body></html>').decode(
-                            'utf-8')}}
+                     'body': {'data': PLAIN_BODY_B64}},
+                    {'mimeType': 'text/html', 'body': {'data': HTML_BODY_B64}}
                 ]
             }
         }
 
-        self.mock_service.users.return_value.messages.return_value.modify.return_value.execute.return_value = {}
-        self.mock_service.users.return_value.labels.return_value.list.return_value.execute.return_value = {
+        self.messages_mock.modify.return_value.execute.return_value = {}
+        self.labels_mock.list.return_value.execute.return_value = {
             'labels': [
                 {'id': 'INBOX', 'name': 'INBOX'},
                 {'id': 'Label_1', 'name': 'Promotions'},
@@ -82,10 +107,10 @@ class TestGmailClient(unittest.TestCase):
             ]
         }
 
-        # Ensure credentials.json exists for the flow to be created
-        mock_os_exists.side_effect = lambda x: x == CREDENTIALS_FILE
-
-        self.client = GmailClient()
+        # Keep the label cache in memory so tests do not read or write a cache file
+        with patch.object(GmailClient, '_authenticate', return_value=self.mock_service):
+            self.client = GmailClient(label_cache_file=None)
+        self.client.creds = self.mock_creds
 
     def tearDown(self):
         """Clean up after each test if necessary."""
@@ -93,7 +118,14 @@ class TestGmailClient(unittest.TestCase):
 
     def test_authentication_success(self):
         """Test if authentication completes successfully."""
-        self.assertIsNotNone(self.client.service)
+        self.assertIsNotNone(self.authenticated_client.service)
+        self.assertIs(self.authenticated_client.creds, self.mock_creds)
+
+    def test_context_manager_closes_service(self):
+        """Test that leaving a `with` block closes the service's HTTP connections."""
+        with self.client as client:
+            self.assertIs(client, self.client)
+        self.mock_service.close.assert_called_once()
 
     def test_get_emails_success(self):
         """Test successful fetching of email IDs."""
@@ -101,18 +133,75 @@ class TestGmailClient(unittest.TestCase):
         self.assertIsInstance(messages, list)
         self.assertEqual(len(messages), 2)
         self.assertEqual(messages[0]['id'], 'msg1')
-        self.mock_service.users.return_value.messages.return_value.list.assert_called_once_with(
-            userId='me', q='is:unread', maxResults=50
+        self.messages_mock.list.assert_called_once_with(
+            userId='me', q='is:unread', maxResults=50, fields=LIST_FIELDS
         )
 
+    def test_get_emails_follows_pages_up_to_max_results(self):
+        """Test that listing follows nextPageToken and stops once max_results IDs are collected."""
+        list_mock = self.messages_mock.list
+        list_mock.reset_mock()
+        list_mock.return_value.execute.side_effect = [
+            {'messages': [{'id': 'm1'}, {'id': 'm2'}], 'nextPageToken': 'page2'},
+            {'messages': [{'id': 'm3'}, {'id': 'm4'}], 'nextPageToken': 'page3'},
+        ]
+
+        messages = self.client.get_emails(max_results=3)
+        self.assertEqual(['m1', 'm2', 'm3'], [m['id'] for m in messages])
+        self.assertEqual(2, list_mock.call_count)
+        list_mock.assert_called_with(userId='me', q='in:inbox', maxResults=3, fields=LIST_FIELDS, pageToken='page2')
+
+    def test_iter_emails_pages(self):
+        """Test that iter_emails yields every page until there is no nextPageToken."""
+        list_mock = self.messages_mock.list
+        list_mock.return_value.execute.side_effect = [
+            {'messages': [{'id': 'm1'}], 'nextPageToken': 'page2'},
+            {'messages': [{'id': 'm2'}]},
+        ]
+        self.assertEqual([[{'id': 'm1'}], [{'id': 'm2'}]], list(self.client.iter_emails(page_size=1)))
+
     def test_get_emails_no_messages(self):
         """Test fetching when no messages are found."""
-        self.mock_service.users.return_value.messages.return_value.list.return_value.execute.return_value = {
+        self.messages_mock.list.return_value.execute.return_value = {
             'messages': []
         }
         messages = self.client.get_emails()
         self.assertEqual(messages, [])
 
+    def test_get_emails_error(self):
+        """Test that a listing error returns None rather than an empty list."""
+        self.messages_mock.list.return_value.execute.side_effect = HttpError(MagicMock(status=500), b'Server Error')
+        self.assertIsNone(self.client.get_emails())
+
+    def test_get_history(self):
+        """Test incremental listing of added messages across history pages."""
+        history_mock = self.mock_service.users.return_value.history.return_value
+        history_mock.list.return_value.execute.side_effect = [
+            {
+                'history': [{'messagesAdded': [{'message': {'id': 'new1', 'threadId': 't1', 'labelIds': ['INBOX']}}]}],
+                'historyId': '150',
+                'nextPageToken': 'page2'
+            },
+            {
+                'history': [
+                    {'messagesAdded': [{'message': {'id': 'new2', 'threadId': 't2'}}]},
+                    {'messagesAdded': [{'message': {'id': 'new1', 'threadId': 't1'}}]}
+                ],
+                'historyId': '200'
+            }
+        ]
+
+        messages, history_id = self.client.get_history('100')
+        self.assertEqual(messages, [{'id': 'new1', 'threadId': 't1'}, {'id': 'new2', 'threadId': 't2'}])
+        self.assertEqual(history_id, '200')
+        self.assertEqual(history_mock.list.call_count, 2)
+
+    def test_get_history_expired(self):
+        """Test that an expired start history ID signals a full fetch."""
+        history_mock = self.mock_service.users.return_value.history.return_value
+        history_mock.list.return_value.execute.side_effect = HttpError(MagicMock(status=404), b'Not Found')
+        self.assertIsNone(self.client.get_history('1'))
+
     def test_get_email_details_success(self):
         """Test successful retrieval and parsing of email details."""
         # This test relies on the default mock_get_response.execute.return_value from setUp
@@ -124,10 +213,115 @@ class TestGmailClient(unittest.TestCase):
         self.assertIsInstance(details['Received Date/Time'], datetime)
         self.assertEqual(details['Received Date/Time'].year, 2025)
         self.assertIn('Test plain text body', details['Message Body'])
-        self.mock_service.users.return_value.messages.return_value.get.assert_called_once_with(
-            userId='me', id='msg1', format='full'
+        self.messages_mock.get.assert_called_once_with(
+            userId='me', id='msg1', format='full', fields=FULL_MESSAGE_FIELDS
+        )
+
+    def test_get_email_details_uses_internal_date(self):
+        """Test that Gmail's internalDate takes precedence over the Date header."""
+        self.mock_get_response.execute.return_value = dict(
+            self.mock_get_response.execute.return_value, internalDate='1750238000000'
+        )
+        details = self.client.get_email_details('msg1')
+        self.assertEqual(details['Received Date/Time'], datetime.fromtimestamp(1750238000, tz=timezone.utc))
+
+    def test_get_email_details_metadata_only(self):
+        """Test that include_body=False requests metadata headers and skips the body."""
+        details = self.client.get_email_details('msg1', include_body=False)
+        self.assertIsNotNone(details)
+        self.assertEqual(details['Subject'], 'Test Subject 1')
+        self.assertIsNone(details['Message Body'])
+        self.messages_mock.get.assert_called_once_with(
+            userId='me', id='msg1', format='metadata', metadataHeaders=['From', 'Subject', 'Date', 'Message-ID'],
+            fields=METADATA_MESSAGE_FIELDS
+        )
+
+    def test_hydrate_bodies(self):
+        """Test batched body retrieval returns a body per message ID."""
+        def new_batch(callback):
+            batch = MagicMock()
+            added = []
+            batch.add.side_effect = lambda request, request_id: added.append(request_id)
+            batch.execute.side_effect = lambda http=None: [
+                callback(rid, dict(self.mock_get_response.execute.return_value, id=rid), None) for rid in added
+            ]
+            return batch
+
+        self.mock_service.new_batch_http_request.side_effect = new_batch
+
+        bodies = self.client.hydrate_bodies(['msg1', 'msg2', 'msg3'], batch_size=2)
+        self.assertEqual(bodies, {mid: 'Test plain text body' for mid in ['msg1', 'msg2', 'msg3']})
+        self.assertEqual(self.mock_service.new_batch_http_request.call_count, 2)
+        self.messages_mock.get.assert_called_with(
+            userId='me', id='msg3', format='full', fields=FULL_MESSAGE_FIELDS
         )
 
+    def test_get_emails_details_batch(self):
+        """Test batched retrieval groups requests and returns parsed details in order."""
+        batches = []
+
+        def new_batch(callback):
+            batch = MagicMock()
+            added = []
+            batch.add.side_effect = lambda request, request_id: added.append(request_id)
+            batch.execute.side_effect = lambda http=None: [
+                callback(rid, dict(self.mock_get_response.execute.return_value, id=rid), None) for rid in added
+            ]
+            batches.append(added)
+            return batch
+
+        self.mock_service.new_batch_http_request.side_effect = new_batch
+
+        details = self.client.get_emails_details_batch(['m1', 'm2', 'm3'], batch_size=2)
+        self.assertEqual(batches, [['m1', 'm2'], ['m3']])
+        self.assertEqual([d['id'] for d in details], ['m1', 'm2', 'm3'])
+        self.assertEqual(details[0]['Subject'], 'Test Subject 1')
+        self.assertEqual(details[0]['Message Body'], 'Test plain text body')
+
+    def test_get_emails_details_batch_skips_failed_requests(self):
+        """Test that messages whose batch sub-request failed are omitted."""
+        def new_batch(callback):
+            batch = MagicMock()
+            added = []
+            batch.add.side_effect = lambda request, request_id: added.append(request_id)
+            batch.execute.side_effect = lambda http=None: [
+                callback('ok', dict(self.mock_get_response.execute.return_value, id='ok'), None),
+                callback('bad', None, Exception('boom')),
+            ]
+            return batch
+
+        self.mock_service.new_batch_http_request.side_effect = new_batch
+
+        details = self.client.get_emails_details_batch(['ok', 'bad'])
+        self.assertEqual([d['id'] for d in details], ['ok'])
+
+    @patch('gmail_client.time.sleep')
+    def test_get_emails_details_batch_retries_throttled_requests(self, mock_sleep):
+        """Test that sub-requests rejected with 429 are retried in a follow-up batch."""
+        batches = []
+
+        def new_batch(callback):
+            batch = MagicMock()
+            added = []
+            batch.add.side_effect = lambda request, request_id: added.append(request_id)
+
+            def execute(http=None):
+                for rid in added:
+                    if rid == 'm2' and len(batches) == 1:
+                        callback(rid, None, HttpError(MagicMock(status=429), b'Rate Limit Exceeded'))
+                    else:
+                        callback(rid, dict(self.mock_get_response.execute.return_value, id=rid), None)
+            batch.execute.side_effect = execute
+            batches.append(added)
+            return batch
+
+        self.mock_service.new_batch_http_request.side_effect = new_batch
+
+        details = self.client.get_emails_details_batch(['m1', 'm2', 'm3'])
+        self.assertEqual(batches, [['m1', 'm2', 'm3'], ['m2']])
+        self.assertEqual(['m1', 'm2', 'm3'], [d['id'] for d in details])
+        mock_sleep.assert_called_once()
+
     @patch('gmail_client.BeautifulSoup', wraps=BeautifulSoup)
     def test_get_message_body_html_fallback(self, mock_bs4):
         """Test message body extraction when only HTML part is available."""
@@ -140,17 +334,12 @@ class TestGmailClient(unittest.TestCase):
             'parts': [
                 {
                     'mimeType': 'text/html',
-                    'body': {
-                        'data': base64.urlsafe_b64encode(
-                            b'<html><body><h1>Hello</h1><p>World</p></body></html>'
-                        ).decode('utf-8')
-                    }
+                    'body': {'data': HTML_ONLY_BODY_B64}
                 }
             ]
         }
 
-        users_mock = self.mock_service.users.return_value
-        messages_mock = users_mock.messages.return_value
+        messages_mock = self.messages_mock
         get_mock = messages_mock.get.return_value
         get_mock.execute.return_value = {
             'id': 'msg_html',
@@ -164,7 +353,7 @@ class TestGmailClient(unittest.TestCase):
         self.assertIn('Hello', details['Message Body'])
         self.assertIn('World', details['Message Body'])
         mock_bs4.assert_called_once()
-        messages_mock.get.assert_called_once_with(userId='me', id='msg_html', format='full')
+        messages_mock.get.assert_called_once_with(userId='me', id='msg_html', format='full', fields=FULL_MESSAGE_FIELDS)
 
     def test_get_message_body_plain_priority(self):
         """Test message body extraction prioritizes plain text over HTML."""
@@ -177,25 +366,16 @@ class TestGmailClient(unittest.TestCase):
             'parts': [
                 {
                     'mimeType': 'text/plain',
-                    'body': {
-                        'data': base64.urlsafe_b64encode(
-                            b'Plain text preferred'
-                        ).decode('utf-8')
-                    }
+                    'body': {'data': PREFERRED_PLAIN_BODY_B64}
                 },
                 {
                     'mimeType': 'text/html',
-                    'body': {
-                        'data': base64.urlsafe_b64encode(
-                            b'<html><body>HTML content</body></html>'
-                        ).decode('utf-8')
-                    }
+                    'body': {'data': SECONDARY_HTML_BODY_B64}
                 }
             ]
         }
 
-        users_mock = self.mock_service.users.return_value
-        messages_mock = users_mock.messages.return_value
+        messages_mock = self.messages_mock
         get_mock = messages_mock.get.return_value
         get_mock.execute.return_value = {
             'id': 'msg_plain_html',
@@ -207,72 +387,255 @@ class TestGmailClient(unittest.TestCase):
         details = self.client.get_email_details('msg_plain_html')
         self.assertIsNotNone(details)
         self.assertEqual('Plain text preferred', details['Message Body'])
-        messages_mock.get.assert_called_once_with(userId='me', id='msg_plain_html', format='full')
+        messages_mock.get.assert_called_once_with(userId='me', id='msg_plain_html', format='full', fields=FULL_MESSAGE_FIELDS)
 
-    def test_mark_as_read_success(self):
-        """Test marking an email as read."""
-        self.mock_service.users().messages().modify.reset_mock()  # Reset mock for this test
-        result = self.client.mark_as_read('msg1')
-        self.assertTrue(result)
-        self.mock_service.users.return_value.messages.return_value.modify.assert_called_once_with(
-            userId='me', id='msg1', body={'removeLabelIds': ['UNREAD']}
-        )
+    def test_get_message_body_nested_multipart(self):
+        """Test that text/plain is found inside nested multiparts, ahead of an earlier HTML part."""
+        def encode(text):
+            return base64.urlsafe_b64encode(text.encode('utf-8')).decode('utf-8')
 
-    def test_mark_as_unread_success(self):
-        """Test marking an email as unread."""
-        self.mock_service.users().messages().modify.reset_mock()  # Reset mock for this test
-        result = self.client.mark_as_unread('msg1')
-        self.assertTrue(result)
-        self.mock_service.users.return_value.messages.return_value.modify.assert_called_once_with(
-            userId='me', id='msg1', body={'addLabelIds': ['UNREAD']}
-        )
+        payload = {
+            'mimeType': 'multipart/mixed',
+            'parts': [
+                {'mimeType': 'text/html', 'body': {'data': encode('<p>Banner</p>')}},
+                {'mimeType': 'multipart/related', 'parts': [
+                    {'mimeType': 'multipart/alternative', 'parts': [
+                        {'mimeType': 'text/plain', 'body': {'data': encode('Nested plain')}},
+                        {'mimeType': 'text/html', 'body': {'data': encode('<p>Nested html</p>')}},
+                    ]},
+                ]},
+                {'mimeType': 'application/pdf', 'body': {'attachmentId': 'att1'}},
+            ]
+        }
+        self.assertEqual('Nested plain', self.client._get_message_body(payload))
+
+        # Without any text/plain part, the first HTML part in document order is converted
+        payload['parts'][1]['parts'][0]['parts'].pop(0)
+        self.assertEqual('Banner', self.client._get_message_body(payload))
 
-    def test_move_message_success(self):
-        """Test moving a message to a valid label."""
-        self.mock_service.users().messages().modify.reset_mock()  # Reset modify mock
-        self.mock_service.users().labels().list.return_value.execute.reset_mock()  # Reset labels list mock
+        # A single-part message carries its data directly on the payload
+        self.assertEqual('Just text', self.client._get_message_body({'body': {'data': encode('Just text')}}))
 
-        # Configure the mock for current message labels for this specific test's move
-        self.mock_get_response.execute.return_value = {'id': 'msg_moved_test', 'labelIds': ['INBOX']}
+    def test_get_message_body_invalid_utf8(self):
+        """Test that undecodable bytes are replaced instead of failing the whole message."""
+        payload = {
+            'mimeType': 'text/plain',
+            'body': {'data': INVALID_UTF8_BODY_B64}
+        }
+        self.assertEqual('caf\ufffd menu', self.client._get_message_body(payload))
+
+    def test_extract_headers(self):
+        """Test that requested headers are looked up by name, with None for missing ones."""
+        headers = [
+            {'name': 'Received', 'value': 'by mx.example.com'},
+            {'name': 'From', 'value': 'a@example.com'},
+            {'name': 'Subject', 'value': 'Hi'},
+        ]
+        self.assertEqual(
+            {'From': 'a@example.com', 'Subject': 'Hi', 'Date': None},
+            GmailClient._extract_headers(headers, ('From', 'Subject', 'Date'))
+        )
 
-        result = self.client.move_message('msg_moved_test', 'Promotions')
+    def test_label_mutations(self):
+        """Test that each single-message label change sends the expected modify body."""
+        # move_message looks up the message's current labels before moving it
+        self.mock_get_response.execute.return_value = {'id': 'msg1', 'labelIds': ['INBOX']}
+        cases = [
+            ('read', self.client.mark_as_read, {'removeLabelIds': ['UNREAD']}),
+            ('unread', self.client.mark_as_unread, {'addLabelIds': ['UNREAD']}),
+            ('move', lambda msg_id: self.client.move_message(msg_id, 'Promotions'),
+             {'removeLabelIds': ['INBOX'], 'addLabelIds': ['Label_1']}),
+            ('label', lambda msg_id: self.client.apply_label(msg_id, 'Important'),
+             {'addLabelIds': ['Label_2']}),
+        ]
+        for name, method, expected_body in cases:
+            with self.subTest(name=name):
+                self.messages_mock.modify.reset_mock()
+                self.assertTrue(method('msg1'))
+                self.messages_mock.modify.assert_called_once_with(
+                    userId='me', id='msg1', body=expected_body
+                )
+                # Transient 429/5xx failures are retried by googleapiclient
+                self.messages_mock.modify.return_value.execute.assert_called_once_with(
+                    http=None, num_retries=API_NUM_RETRIES
+                )
+        # Both label names were resolved from a single labels.list call
+        self.labels_mock.list.assert_called_once_with(userId='me')
+
+    def test_move_message_with_known_labels_skips_get(self):
+        """Test that known label IDs avoid fetching the message before moving it."""
+        messages_mock = self.messages_mock
+        messages_mock.modify.reset_mock()
+        messages_mock.get.reset_mock()
+
+        result = self.client.move_message('msg1', 'Promotions', current_label_ids=['INBOX', 'UNREAD'])
         self.assertTrue(result)
-        self.mock_service.users().labels().list.assert_called_once()  # Should be called to get label ID
-        self.mock_service.users().messages().modify.assert_called_once_with(
-            userId='me', id='msg_moved_test', body={'removeLabelIds': ['INBOX'], 'addLabelIds': ['Label_1']}
+        messages_mock.get.assert_not_called()
+        messages_mock.modify.assert_called_once_with(
+            userId='me', id='msg1', body={'removeLabelIds': ['INBOX'], 'addLabelIds': ['Label_1']}
         )
 
+    def test_get_label_id_lists_labels_once(self):
+        """Test that label lookups are case-insensitive and share a single labels.list call."""
+        list_mock = self.labels_mock.list
+        list_mock.reset_mock()
+
+        self.assertEqual('Label_1', self.client.get_label_id('Promotions'))
+        self.assertEqual('Label_2', self.client.get_label_id('important'))
+        self.assertIsNone(self.client.get_label_id('DoesNotExist'))
+        self.assertIsNone(self.client.get_label_id('doesnotexist'))
+        list_mock.assert_called_once_with(userId='me')
+
+    def test_apply_label_reuses_label_cache(self):
+        """Test that consecutive apply_label calls resolve their labels from one labels.list call."""
+        self.labels_mock.list.reset_mock()
+        self.assertTrue(self.client.apply_label('msg1', 'Important'))
+        self.assertTrue(self.client.apply_label('msg1', 'Newsletter'))
+        self.assertEqual(self.labels_mock.list.call_count, 1)
+
+    def test_label_cache_persists_between_clients(self):
+        """Test that labels listed by one client are reused from disk by the next one."""
+        list_mock = self.labels_mock.list
+        list_mock.reset_mock()
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            self.client.label_cache_file = os.path.join(tmp_dir, 'labels.json')
+            self.assertEqual('Label_1', self.client.get_label_id('Promotions'))
+            self.assertEqual(1, list_mock.call_count)
+
+            # A fresh client (simulated by resetting the in-memory state) starts from the file
+            self.client.label_id_map = {}
+            self.client._labels_primed = False
+            self.assertEqual('Label_2', self.client.get_label_id('Important'))
+            self.assertEqual(1, list_mock.call_count)
+
+            # A name missing from the saved cache triggers one refresh in case it was created since
+            self.assertIsNone(self.client.get_label_id('Brand New'))
+            self.assertIsNone(self.client.get_label_id('Brand New'))
+            self.assertEqual(2, list_mock.call_count)
+
+    def test_label_cache_keyed_by_account(self):
+        """Test that labels saved for one account are not used for another."""
+        list_mock = self.labels_mock.list
+        list_mock.reset_mock()
+        profile_mock = self.mock_service.users.return_value.getProfile.return_value
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            self.client.label_cache_file = os.path.join(tmp_dir, 'labels.json')
+            self.assertEqual('Label_1', self.client.get_label_id('Promotions'))
+
+            # Another account (simulated by resetting the in-memory state) lists its own labels
+            profile_mock.execute.return_value = {'emailAddress': 'other@example.com'}
+            self.client.label_id_map = {}
+            self.client._labels_primed = False
+            self.client._account_email = None
+            self.assertEqual('Label_1', self.client.get_label_id('Promotions'))
+            self.assertEqual(2, list_mock.call_count)
+
+            with open(self.client.label_cache_file, encoding='utf-8') as f:
+                self.assertEqual({'me@example.com', 'other@example.com'}, set(json.load(f)))
+
+    def test_batch_modify_refreshes_stale_label_cache(self):
+        """Test that a rejected label ID from the on-disk cache re-lists labels and resends the chunk."""
+        batch_modify_mock = self.messages_mock.batchModify
+        batch_modify_mock.reset_mock()
+        batch_modify_mock.return_value.execute.side_effect = [HttpError(MagicMock(status=400), b'Invalid label'), {}]
+        self.client.label_id_map = {'PROMOTIONS': 'Label_old'}
+        self.client._labels_primed = True
+        self.client._labels_from_disk = True
+
+        with patch.object(self.client, 'modify_many') as modify_many_mock:
+            results = self.client.batch_modify(['m1', 'm2'], add_label_ids=['Label_old'], remove_label_ids=['INBOX'])
+
+        self.assertEqual({'m1': True, 'm2': True}, results)
+        modify_many_mock.assert_not_called()
+        batch_modify_mock.assert_called_with(
+            userId='me', body={'ids': ['m1', 'm2'], 'addLabelIds': ['Label_1'], 'removeLabelIds': ['INBOX']}
+        )
+        self.assertEqual('Label_1', self.client.get_label_id('Promotions'))
+        batch_modify_mock.return_value.execute.side_effect = None
+
     def test_move_message_invalid_mailbox(self):
         """Test moving a message to a non-existent mailbox."""
-        self.mock_service.users.return_value.labels.return_value.list.return_value.execute.return_value = {
+        self.labels_mock.list.return_value.execute.return_value = {
             'labels': []  # No labels available to simulate non-existent
         }
-        self.mock_service.users().messages().modify.reset_mock()  # Reset mock for modify
+        self.messages_mock.modify.reset_mock()  # Reset mock for modify
         result = self.client.move_message('msg1', 'NonExistentMailbox')
         self.assertFalse(result)
-        self.mock_service.users.return_value.messages.return_value.modify.assert_not_called()
+        self.messages_mock.modify.assert_not_called()
+
+    def test_modify_many(self):
+        """Test that modify_many applies each label change and reports per-message success."""
+        modify_mock = self.messages_mock.modify
+        modify_mock.reset_mock()
+
+        def modify_side_effect(userId, id, body):
+            request = MagicMock()
+            if id == 'bad':
+                request.execute.side_effect = HttpError(MagicMock(status=400), b'Bad Request')
+            return request
+        modify_mock.side_effect = modify_side_effect
+
+        with patch.object(self.client, '_thread_http', return_value='thread_http'):
+            results = self.client.modify_many([
+                ('msg1', [], ['UNREAD']),
+                ('msg2', ['Label_1'], ['INBOX']),
+                ('bad', ['UNREAD'], []),
+            ], max_workers=2)
+
+        self.assertEqual({'msg1': True, 'msg2': True, 'bad': False}, results)
+        modify_mock.assert_any_call(userId='me', id='msg1', body={'removeLabelIds': ['UNREAD']})
+        modify_mock.assert_any_call(userId='me', id='msg2', body={'removeLabelIds': ['INBOX'], 'addLabelIds': ['Label_1']})
+        self.assertEqual({}, self.client.modify_many([]))
+        modify_mock.side_effect = None
+
+    @patch('gmail_client.BATCH_MODIFY_MAX_IDS', 2)
+    def test_batch_modify_chunks_ids(self):
+        """Test that batch_modify sends one batchModify call per chunk of IDs."""
+        batch_modify_mock = self.messages_mock.batchModify
+        batch_modify_mock.reset_mock()
+
+        results = self.client.batch_modify(['m1', 'm2', 'm3'], remove_label_ids=['UNREAD'])
+
+        self.assertEqual({'m1': True, 'm2': True, 'm3': True}, results)
+        self.assertEqual(2, batch_modify_mock.call_count)
+        batch_modify_mock.assert_any_call(
+            userId='me', body={'ids': ['m1', 'm2'], 'addLabelIds': [], 'removeLabelIds': ['UNREAD']}
+        )
+        batch_modify_mock.assert_any_call(
+            userId='me', body={'ids': ['m3'], 'addLabelIds': [], 'removeLabelIds': ['UNREAD']}
+        )
+        # Sent over the calling thread's transport, so groups can be applied from several threads
+        batch_modify_mock.return_value.execute.assert_called_with(
+            http=self.client._thread_http(), num_retries=API_NUM_RETRIES
+        )
 
-    def test_apply_label_success(self):
-        """Test applying a label to a message."""
-        self.mock_service.users().messages().return_value.modify.reset_mock()  # Reset modify mock
-        self.mock_service.users().labels().list.return_value.execute.reset_mock()  # Reset labels list mock
+    def test_batch_modify_falls_back_on_client_error(self):
+        """Test that a 4xx batchModify failure retries the messages individually."""
+        batch_modify_mock = self.messages_mock.batchModify
+        batch_modify_mock.return_value.execute.side_effect = HttpError(MagicMock(status=400), b'Invalid id')
 
-        result = self.client.apply_label('msg1', 'Important')
-        self.assertTrue(result)
-        self.mock_service.users().labels().list.assert_called_once()  # Should be called to get label ID
-        self.mock_service.users().messages().modify.assert_called_once_with(
-            userId='me', id='msg1', body={'addLabelIds': ['Label_2']}
-        )
+        with patch.object(self.client, 'modify_many', return_value={'m1': True, 'm2': False}) as modify_many_mock:
+            results = self.client.batch_modify(['m1', 'm2'], add_label_ids=['Label_1'])
+
+        self.assertEqual({'m1': True, 'm2': False}, results)
+        modify_many_mock.assert_called_once_with([('m1', ['Label_1'], None), ('m2', ['Label_1'], None)])
+
+        batch_modify_mock.return_value.execute.side_effect = HttpError(MagicMock(status=503), b'Unavailable')
+        with patch.object(self.client, 'modify_many') as modify_many_mock:
+            results = self.client.batch_modify(['m1'], add_label_ids=['Label_1'])
+        self.assertEqual({'m1': False}, results)
+        modify_many_mock.assert_not_called()
+        batch_modify_mock.return_value.execute.side_effect = None
 
     def test_apply_label_invalid_label(self):
         """Test applying a non-existent label."""
-        self.mock_service.users.return_value.labels.return_value.list.return_value.execute.return_value = {
+        self.labels_mock.list.return_value.execute.return_value = {
             'labels': []  # No labels available to simulate non-existent
         }
-        self.mock_service.users().messages().modify.reset_mock()  # Reset modify mock
+        self.messages_mock.modify.reset_mock()  # Reset modify mock
         result = self.client.apply_label('msg1', 'NonExistentLabel')
         self.assertFalse(result)
-        self.mock_service.users.return_value.messages.return_value.modify.assert_not_called()
+        self.messages_mock.modify.assert_not_called()
 
     @patch('gmail_client.os.path.exists', return_value=True)
     @patch('gmail_client.Credentials.from_authorized_user_file')
@@ -322,5 +685,45 @@ class TestGmailClient(unittest.TestCase):
             self.assertTrue(client.creds.valid)
 
 
+    @patch('gmail_client.os.path.exists', side_effect=lambda x: x == TOKEN_FILE)
+    @patch('gmail_client.Credentials.from_authorized_user_file')
+    @patch('gmail_client.build')
+    def test_authentication_refreshes_token_about_to_expire(self, mock_build, mock_creds_from_file, mock_os_exists):
+        """Test that a still-valid token close to expiry is refreshed and saved up front."""
+        mock_creds = MagicMock()
+        mock_creds.valid = True
+        mock_creds.expired = False
+        mock_creds.refresh_token = 'some_refresh_token'
+        mock_creds.expiry = datetime.now(timezone.utc).replace(tzinfo=None) + timedelta(minutes=2)
+        mock_creds.to_json.side_effect = ['{"token": "old"}', '{"token": "new"}']
+        mock_creds_from_file.return_value = mock_creds
+
+        with patch('gmail_client.Request'), patch('gmail_client.open', unittest.mock.mock_open()) as mock_file:
+            GmailClient()
+
+        mock_creds.refresh.assert_called_once()
+        mock_file.assert_called_once_with(TOKEN_FILE, 'w')
+        mock_file.return_value.write.assert_called_once_with('{"token": "new"}')
+        mock_build.assert_called_once_with('gmail', 'v1', credentials=mock_creds, static_discovery=True)
+
+    @patch('gmail_client.os.path.exists', side_effect=lambda x: x == TOKEN_FILE)
+    @patch('gmail_client.Credentials.from_authorized_user_file')
+    @patch('gmail_client.build')
+    def test_authentication_skips_saving_unchanged_token(self, mock_build, mock_creds_from_file, mock_os_exists):
+        """Test that a valid token far from expiry is neither refreshed nor rewritten."""
+        mock_creds = MagicMock()
+        mock_creds.valid = True
+        mock_creds.expired = False
+        mock_creds.refresh_token = 'some_refresh_token'
+        mock_creds.expiry = datetime.now(timezone.utc).replace(tzinfo=None) + timedelta(minutes=50)
+        mock_creds.to_json.return_value = '{"token": "current"}'
+        mock_creds_from_file.return_value = mock_creds
+
+        with patch('gmail_client.open', unittest.mock.mock_open()) as mock_file:
+            GmailClient()
+
+        mock_creds.refresh.assert_not_called()
+        mock_file.assert_not_called()
+
 if __name__ == '__main__':
     unittest.main()
@@ -3,13 +3,14 @@
 import unittest
 from unittest.mock import MagicMock, patch
 import os
+import itertools
 import json
 from datetime import datetime, timedelta, timezone
 import sys
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from rule_engine import Email, Condition, Action, Rule, RuleEngine
+from rule_engine import Email, Condition, Action, Rule, RuleEngine, _reference_time
 
 # Define a mock rules.json content for testing
 MOCK_RULES_CONTENT = [
@@ -80,6 +81,24 @@ MOCK_RULES_CONTENT = [
 ]
 
 
+def _patch_rules_file(rules):
+    """Patches RuleEngine to read the given rule definitions instead of the rules file."""
+    return patch.object(RuleEngine, '_read_rules_file', return_value=json.dumps(rules).encode('utf-8'))
+
+
+def _build_rules(definitions):
+    """Builds Rule objects directly from rule definitions, bypassing the JSON loader."""
+    return [
+        Rule(
+            description=rule_data['description'],
+            overall_predicate=rule_data['overall_predicate'],
+            conditions=[Condition(c['field'], c['predicate'], c['value']) for c in rule_data['conditions']],
+            actions=[Action(a['type'], a.get('value')) for a in rule_data['actions']],
+        )
+        for rule_data in definitions
+    ]
+
+
 class TestEmail(unittest.TestCase):
     """Unit tests for the Email data model."""
 
@@ -98,6 +117,54 @@ class TestEmail(unittest.TestCase):
         self.assertEqual(email_dict['Received Date/Time'], now.isoformat())
         self.assertEqual(email_dict['labelIds'], ['INBOX'])
 
+    def test_email_received_timestamp(self):
+        received = datetime(2023, 1, 1, 12, 0, tzinfo=timezone.utc)
+        email_obj = Email('e1', 't1', 'a@b.com', 'Sub', received, 'Body')
+        self.assertEqual(received.timestamp(), email_obj._received_ts)
+        naive = Email('e2', 't2', 'a@b.com', 'Sub', received.replace(tzinfo=None), 'Body')
+        self.assertEqual(received.timestamp(), naive._received_ts)  # Naive datetimes are taken as UTC
+        self.assertIsNone(Email('e3', 't3', 'a@b.com', 'Sub', None, 'Body')._received_ts)
+
+    def test_rule_classes_have_no_instance_dict(self):
+        condition = Condition("Subject", "contains", "update")
+        action = Action("Mark as Read")
+        rule = Rule("Slotted", "all", [condition], [action])
+        email_obj = Email('e1', 't1', 'a@b.com', 'Sub', None, 'Body')
+        for obj in (email_obj, condition, action, rule):
+            self.assertFalse(hasattr(obj, '__dict__'))
+
+    def test_email_to_row(self):
+        received = datetime(2023, 1, 1, 12, 0, tzinfo=timezone.utc)
+        email_obj = Email(
+            id='e3', thread_id='t3', from_address='a@b.com', subject='Sub',
+            received_date_time=received, message_body='Body', label_ids=['INBOX', 'UNREAD']
+        )
+        self.assertEqual(
+            email_obj.to_row(),
+            ('e3', 't3', 'a@b.com', 'Sub', received.isoformat(), 'Body', ['INBOX', 'UNREAD'])
+        )
+
+    def test_email_cache_lowercase_fields(self):
+        email_obj = Email(
+            id='e4', thread_id='t4', from_address='Boss@Example.com', subject='URGENT Review',
+            received_date_time=None, message_body=None
+        )
+        email_obj.cache_lowercase_fields()
+        self.assertEqual('boss@example.com', email_obj._from_lc)
+        self.assertEqual('urgent review', email_obj._subject_lc)
+        self.assertIsNone(email_obj._body_lc)
+        self.assertTrue(Condition("Subject", "contains", "Urgent").evaluate(email_obj))
+        self.assertTrue(Condition("From", "equals", "boss@example.com").evaluate(email_obj))
+        self.assertFalse(Condition("Message", "contains", "review").evaluate(email_obj))
+
+    def test_email_cache_lowercase_fields_subset(self):
+        email_obj = Email('e5', 't5', 'Boss@Example.com', 'URGENT Review', None, 'Large BODY')
+        email_obj.cache_lowercase_fields({"Subject", "Received Date/Time"})
+        self.assertEqual('urgent review', email_obj._subject_lc)
+        self.assertIsNone(email_obj._from_lc)
+        self.assertIsNone(email_obj._body_lc)
+        self.assertTrue(Condition("From", "contains", "boss@").evaluate(email_obj))  # Still lower-cased on the fly
+
     def test_email_from_db_row(self):
         iso_dt = '2023-01-01T12:00:00'
         db_row = {
@@ -111,13 +178,30 @@ class TestEmail(unittest.TestCase):
         self.assertEqual(email_obj.received_date_time, datetime.fromisoformat(iso_dt))
         self.assertEqual(email_obj.label_ids, ['SENT'])
 
+    def test_email_from_db_tuple(self):
+        received = datetime(2023, 1, 1, 12, 0, tzinfo=timezone.utc)
+        email_obj = Email.from_db_tuple(('e4', 't4', 'x@y.com', 'Sub', received, None, ['INBOX']))
+        self.assertEqual(('e4', 't4', 'x@y.com', 'Sub', received.isoformat(), None, ['INBOX']), email_obj.to_row())
+        self.assertEqual(received.timestamp(), email_obj._received_ts)
+
+    def test_email_from_db_row_interns_repeated_strings(self):
+        rows = [
+            {'id': f'e{i}', 'thread_id': f't{i}', 'from': ''.join(['news', '@shop.com']), 'subject': 'Sale',
+             'received_date_time': None, 'message_body': None, 'label_ids': [''.join(['CATEGORY_', 'PROMOTIONS'])]}
+            for i in range(2)
+        ]
+        first, second = (Email.from_db_row(row) for row in rows)
+        self.assertIs(first.from_address, second.from_address)
+        self.assertIs(first.label_ids[0], second.label_ids[0])
+
 
 class TestCondition(unittest.TestCase):
     """Unit tests for the Condition class and its evaluation logic."""
 
-    def setUp(self):
-        # Create a mock email object for testing conditions
-        self.email = Email(
+    @classmethod
+    def setUpClass(cls):
+        # Condition evaluation never modifies these emails, so every test can share them
+        cls.email = Email(
             id='test_email_id',
             thread_id='test_thread_id',
             from_address='sender@example.com',
@@ -126,7 +210,7 @@ class TestCondition(unittest.TestCase):
             message_body='Hello team,\n\nThis is an important update regarding the project. Please review the attached document.\n\nRegards,\nManager',
             label_ids=['INBOX', 'UNREAD']
         )
-        self.old_email = Email(
+        cls.old_email = Email(
             id='old_email_id',
             thread_id='old_thread_id',
             from_address='old@archive.com',
@@ -135,7 +219,7 @@ class TestCondition(unittest.TestCase):
             message_body='This is an old email.',
             label_ids=['ARCHIVE']
         )
-        self.no_body_email = Email(
+        cls.no_body_email = Email(
             id='no_body_id',
             thread_id='no_body_thread',
             from_address='no_body@test.com',
@@ -144,7 +228,7 @@ class TestCondition(unittest.TestCase):
             message_body=None,  # Simulate missing message body
             label_ids=[]
         )
-        self.case_sensitive_email = Email(
+        cls.case_sensitive_email = Email(
             id='case_id',
             thread_id='case_thread',
             from_address='JOHN.DOE@example.com',
@@ -154,131 +238,81 @@ class TestCondition(unittest.TestCase):
             label_ids=[]
         )
 
-    def test_contains_match(self):
-        cond = Condition("From", "contains", "example.com")
-        self.assertTrue(cond.evaluate(self.email))
-
-        cond = Condition("Subject", "contains", "Meeting")
-        self.assertTrue(cond.evaluate(self.email))
-
-        cond = Condition("Message", "contains", "attached document")
-        self.assertTrue(cond.evaluate(self.email))
-
-        cond = Condition("From", "contains", "JOHN.DOE")  # Should be case-insensitive
-        self.assertTrue(cond.evaluate(self.case_sensitive_email))
-
-        cond = Condition("Message", "contains", "mixed case")  # Should be case-insensitive
-        self.assertTrue(cond.evaluate(self.case_sensitive_email))
-
-    def test_contains_no_match(self):
-        cond = Condition("From", "contains", "nonexistent.com")
-        self.assertFalse(cond.evaluate(self.email))
-
-        cond = Condition("Subject", "contains", "Invoice")
-        self.assertFalse(cond.evaluate(self.email))
-
-        cond = Condition("Message", "contains", "nonexistent phrase")
-        self.assertFalse(cond.evaluate(self.email))
-
-        cond = Condition("Message", "contains", "project")  # Test when message body is None
-        self.assertFalse(cond.evaluate(self.no_body_email))
-
-    def test_does_not_contain_match(self):
-        cond = Condition("From", "does not contain", "nonexistent.com")
-        self.assertTrue(cond.evaluate(self.email))
-
-        cond = Condition("Subject", "does not contain", "Invoice")
-        self.assertTrue(cond.evaluate(self.email))
-
-    def test_does_not_contain_no_match(self):
-        cond = Condition("From", "does not contain", "example.com")
-        self.assertFalse(cond.evaluate(self.email))
-
-        cond = Condition("Subject", "does not contain", "Update")
-        self.assertFalse(cond.evaluate(self.email))
-
-    def test_equals_match(self):
-        cond = Condition("From", "equals", "sender@example.com")
-        self.assertTrue(cond.evaluate(self.email))
-
-        cond = Condition("Subject", "equals", "Important Update - Meeting Details")
-        self.assertTrue(cond.evaluate(self.email))
-
-        cond = Condition("From", "equals", "john.doe@example.com")  # Case-insensitive
-        self.assertTrue(cond.evaluate(self.case_sensitive_email))
-
-        cond = Condition("Subject", "equals", "case study")  # Case-insensitive
-        self.assertTrue(cond.evaluate(self.case_sensitive_email))
-
-    def test_equals_no_match(self):
-        cond = Condition("From", "equals", "different@example.com")
-        self.assertFalse(cond.evaluate(self.email))
-
-        cond = Condition("Subject", "equals", "Just a normal email")
-        self.assertFalse(cond.evaluate(self.email))
-
-        cond = Condition("Message", "equals", "This is exactly the body.")  # Full text equality
-        self.assertFalse(cond.evaluate(self.email))  # Should be false as it's partial
-
-    def test_does_not_equal_match(self):
-        cond = Condition("From", "does not equal", "different@example.com")
-        self.assertTrue(cond.evaluate(self.email))
-
-        cond = Condition("From", "does not equal", "john.doe@test.com")  # Case-insensitive
-        self.assertTrue(cond.evaluate(self.case_sensitive_email))
-
-    def test_does_not_equal_no_match(self):
-        cond = Condition("From", "does not equal", "sender@example.com")
-        self.assertFalse(cond.evaluate(self.email))
-
-        cond = Condition("Subject", "does not equal", "important update - meeting details")  # Case-insensitive
-        self.assertFalse(cond.evaluate(self.email))
-
-    def test_less_than_days_match(self):
-        # Email is 3 days old, rule is "less than 7 days old" (meaning received more recently than 7 days ago)
+    # (field, predicate, value, email fixture, expected outcome)
+    PREDICATE_CASES = [
+        ("From", "contains", "example.com", 'email', True),
+        ("Subject", "contains", "Meeting", 'email', True),
+        ("Message", "contains", "attached document", 'email', True),
+        ("From", "contains", "JOHN.DOE", 'case_sensitive_email', True),  # Case-insensitive
+        ("Message", "contains", "mixed case", 'case_sensitive_email', True),  # Case-insensitive
+        ("From", "contains", "nonexistent.com", 'email', False),
+        ("Subject", "contains", "Invoice", 'email', False),
+        ("Message", "contains", "nonexistent phrase", 'email', False),
+        ("Message", "contains", "project", 'no_body_email', False),  # Message body is None
+        ("From", "does not contain", "nonexistent.com", 'email', True),
+        ("Subject", "does not contain", "Invoice", 'email', True),
+        ("From", "does not contain", "example.com", 'email', False),
+        ("Subject", "does not contain", "Update", 'email', False),
+        ("From", "equals", "sender@example.com", 'email', True),
+        ("Subject", "equals", "Important Update - Meeting Details", 'email', True),
+        ("From", "equals", "john.doe@example.com", 'case_sensitive_email', True),  # Case-insensitive
+        ("Subject", "equals", "case study", 'case_sensitive_email', True),  # Case-insensitive
+        ("From", "equals", "different@example.com", 'email', False),
+        ("Subject", "equals", "Just a normal email", 'email', False),
+        ("Message", "equals", "This is exactly the body.", 'email', False),  # Full text equality only
+        ("From", "does not equal", "different@example.com", 'email', True),
+        ("From", "does not equal", "john.doe@test.com", 'case_sensitive_email', True),  # Case-insensitive
+        ("From", "does not equal", "sender@example.com", 'email', False),
+        ("Subject", "does not equal", "important update - meeting details", 'email', False),  # Case-insensitive
+        # "less than N days" means received more recently than N days ago; the email is 3 days old
+        ("Received Date/Time", "less than", {"days": 7}, 'email', True),
+        ("Received Date/Time", "less than", {"days": 2}, 'email', False),
+        ("Received Date/Time", "less than", {"days": 30}, 'old_email', False),  # 40 days old
+        # "greater than N days" means received earlier than N days ago
+        ("Received Date/Time", "greater than", {"days": 30}, 'old_email', True),
+        ("Received Date/Time", "greater than", {"days": 7}, 'email', False),
+    ]
+
+    def test_predicates(self):
+        for field, predicate, value, email_name, expected in self.PREDICATE_CASES:
+            with self.subTest(field=field, predicate=predicate, value=value, email=email_name):
+                cond = Condition(field, predicate, value)
+                self.assertIs(cond.evaluate(getattr(self, email_name)), expected)
+
+    def test_age_measured_from_pinned_reference_time(self):
         cond = Condition("Received Date/Time", "less than", {"days": 7})
+        # Pinned 10 days ahead, the 3-day-old email is 13 days old for the whole batch
+        with _reference_time.pin(datetime.now(timezone.utc) + timedelta(days=10)):
+            self.assertFalse(cond.evaluate(self.email))
+            self.assertFalse(cond.evaluate(self.email))
+        self.assertIsNone(_reference_time.pinned)
         self.assertTrue(cond.evaluate(self.email))
 
-        # Email is 3 days old, rule is "less than 2 days old" (meaning received more recently than 2 days ago)
-        # This should be false, as it's older than 2 days but still less than 7 days old.
-        cond = Condition("Received Date/Time", "less than", {"days": 2})
-        self.assertFalse(cond.evaluate(self.email))  # Email is older than 2 days
-
-    def test_less_than_days_no_match(self):
-        # Email is 40 days old, rule is "less than 30 days old"
-        cond = Condition("Received Date/Time", "less than", {"days": 30})
-        self.assertFalse(cond.evaluate(self.old_email))
-
-    def test_greater_than_days_match(self):
-        # Email is 40 days old, rule is "greater than 30 days old" (meaning received earlier than 30 days ago)
-        cond = Condition("Received Date/Time", "greater than", {"days": 30})
-        self.assertTrue(cond.evaluate(self.old_email))
-
-    def test_greater_than_days_no_match(self):
-        # Email is 3 days old, rule is "greater than 7 days old"
-        cond = Condition("Received Date/Time", "greater than", {"days": 7})
+    def test_non_string_contains_value(self):
+        cond = Condition("Subject", "contains", 42)  # Malformed rule value never matches
         self.assertFalse(cond.evaluate(self.email))
 
     def test_unknown_field(self):
-        cond = Condition("NonExistentField", "equals", "value")
-        # Should return False and print a warning
-        with self.assertLogs('root', level='WARNING') as cm:  # Capture log output
-            self.assertFalse(cond.evaluate(self.email))
-        self.assertIn("Unknown field 'NonExistentField'", cm.output[0])
+        # Rejected when the condition is created rather than on every evaluation
+        with self.assertRaisesRegex(ValueError, "Unknown field 'NonExistentField'"):
+            Condition("NonExistentField", "equals", "value")
 
     def test_unknown_predicate(self):
-        cond = Condition("Subject", "unknown_predicate", "value")
-        # Should return False and print a warning
-        with self.assertLogs('root', level='WARNING') as cm:
-            self.assertFalse(cond.evaluate(self.email))
-        self.assertIn("Unknown predicate 'unknown_predicate'", cm.output[0])
+        with self.assertRaisesRegex(ValueError, "Unknown predicate 'unknown_predicate'"):
+            Condition("Subject", "unknown_predicate", "value")
 
 
 class TestAction(unittest.TestCase):
     """Unit tests for the Action class."""
 
+    @classmethod
+    def setUpClass(cls):
+        # One mock per class, reset before each test, instead of a new MagicMock tree per test
+        cls._mock_gmail_client = MagicMock()
+
     def setUp(self):
-        self.mock_gmail_client = MagicMock()
+        self._mock_gmail_client.reset_mock(return_value=True, side_effect=True)
+        self.mock_gmail_client = self._mock_gmail_client
         self.email_id = "mock_email_id_123"
 
     def test_mark_as_read_action(self):
@@ -302,6 +336,24 @@ class TestAction(unittest.TestCase):
         self.assertFalse(result)  # Should fail as no destination is given
         self.mock_gmail_client.move_message.assert_not_called()
 
+    def test_apply_label_action(self):
+        action = Action("Apply Label", value="Important")
+        action.execute(self.mock_gmail_client, self.email_id)
+        self.mock_gmail_client.apply_label.assert_called_once_with(self.email_id, "Important")
+        self.assertFalse(Action("Apply Label").execute(self.mock_gmail_client, self.email_id))
+        self.mock_gmail_client.apply_label.assert_called_once()
+
+    def test_resolve_label_id_once(self):
+        mock_gmail_client = MagicMock()
+        mock_gmail_client.get_label_id.return_value = 'Label_7'
+        email_obj = Email('e1', 't1', 'a@b.com', 'Sub', None, 'Body', label_ids=['INBOX'])
+        action = Action("Move Message", "Archive")
+        self.assertEqual('Label_7', action.resolve_label_id(mock_gmail_client))
+        self.assertEqual((['Label_7'], ['INBOX']), action.label_change(mock_gmail_client, email_obj))
+        self.assertEqual((['Label_7'], ['INBOX']), action.label_change(mock_gmail_client, email_obj))
+        mock_gmail_client.get_label_id.assert_called_once_with("Archive")
+        self.assertIsNone(Action("Mark as Read").resolve_label_id(mock_gmail_client))
+
     def test_unknown_action(self):
         action = Action("NonExistentAction")
         result = action.execute(self.mock_gmail_client, self.email_id)
@@ -314,8 +366,13 @@ class TestAction(unittest.TestCase):
 class TestRule(unittest.TestCase):
     """Unit tests for the Rule class (combining conditions and actions)."""
 
+    @classmethod
+    def setUpClass(cls):
+        cls._mock_gmail_client = MagicMock()
+
     def setUp(self):
-        self.mock_gmail_client = MagicMock()
+        self._mock_gmail_client.reset_mock(return_value=True, side_effect=True)
+        self.mock_gmail_client = self._mock_gmail_client
         self.email_matching_all = Email(
             id='email_all_match',
             thread_id='t_all',
@@ -383,6 +440,39 @@ class TestRule(unittest.TestCase):
         self.assertTrue(rule.matches(self.email_matching_any))
         self.assertFalse(rule.matches(self.email_not_matching))
 
+    def test_rule_matches_short_circuits_cheap_conditions_first(self):
+        body_condition = Condition("Message", "contains", "viagra")
+        body_eval = body_condition._eval = MagicMock(wraps=body_condition._eval)
+        subject_condition = Condition("Subject", "equals", "Meeting Invite")
+        rule = Rule("Ordered", "all", [body_condition, subject_condition], [])
+        self.assertEqual([subject_condition, body_condition], rule._ordered_conditions)
+        self.assertEqual([body_condition, subject_condition], rule.conditions)  # Declared order is kept
+
+        self.assertFalse(rule.matches(self.email_matching_any))  # Subject differs: body never scanned
+        body_eval.assert_not_called()
+        self.assertFalse(rule.matches(self.email_matching_any, results={}))
+        body_eval.assert_not_called()
+        self.assertFalse(rule.matches(self.email_matching_all))  # Subject matches, body has no "viagra"
+        self.assertFalse(rule.matches(self.email_matching_all, results={}))
+        self.assertEqual(2, body_eval.call_count)
+
+    def test_rule_compiled_matcher_edge_cases(self):
+        self.assertTrue(Rule("Empty", "all", [], []).matches(self.email_not_matching))
+        single = Condition("Subject", "contains", "update")
+        self.assertIs(single._eval, Rule("Single", "any", [single], [])._match)
+        with self.assertRaisesRegex(ValueError, "Unknown overall predicate 'most'"):
+            Rule("Bad", "most", [single], [])
+
+    def test_rule_compiled_matcher_condition_counts(self):
+        email_obj = Email('e1', 't1', 'a@b.com', 'Quarterly report', None, 'Body', label_ids=[])
+        outcomes = {True: Condition("Subject", "contains", "report"), False: Condition("Subject", "contains", "invoice")}
+        for count in (2, 3, 4):
+            for combination in itertools.product((True, False), repeat=count):
+                conditions = [outcomes[outcome] for outcome in combination]
+                with self.subTest(count=count, combination=combination):
+                    self.assertIs(Rule("All", "all", conditions, []).matches(email_obj), all(combination))
+                    self.assertIs(Rule("Any", "any", conditions, []).matches(email_obj), any(combination))
+
     def test_rule_execute_actions(self):
         rule = Rule(
             description=self.rule_all_match_data['description'],
@@ -410,32 +500,72 @@ class TestRule(unittest.TestCase):
 class TestRuleEngine(unittest.TestCase):
     """Unit tests for the RuleEngine class."""
 
-    @patch('builtins.open', new_callable=unittest.mock.mock_open, read_data=json.dumps(MOCK_RULES_CONTENT))
-    @patch('os.path.exists', return_value=True)
-    def test_load_rules_success(self, mock_exists, mock_open):
-        engine = RuleEngine(rules_file="mock_rules.json")
+    def test_load_rules_success(self):
+        with _patch_rules_file(MOCK_RULES_CONTENT):
+            engine = RuleEngine(rules_file="mock_rules.json")
         self.assertEqual(len(engine.rules), len(MOCK_RULES_CONTENT))
         self.assertIsInstance(engine.rules[0], Rule)
         self.assertEqual(engine.rules[0].description, "Test Rule 1: All conditions match")
 
-    @patch('os.path.exists', return_value=False)
-    def test_load_rules_file_not_found(self, mock_exists):
-        engine = RuleEngine(rules_file="non_existent_rules.json")
+    def test_load_rules_file_not_found(self):
+        with patch.object(RuleEngine, '_read_rules_file', side_effect=FileNotFoundError):
+            engine = RuleEngine(rules_file="non_existent_rules.json")
         self.assertEqual(len(engine.rules), 0)
 
-    @patch('builtins.open', new_callable=unittest.mock.mock_open, read_data='{"invalid json"')
-    @patch('os.path.exists', return_value=True)
-    def test_load_rules_invalid_json(self, mock_exists, mock_open):
-        engine = RuleEngine(rules_file="invalid_rules.json")
+    def test_load_rules_invalid_json(self):
+        with patch.object(RuleEngine, '_read_rules_file', return_value=b'{"invalid json"'):
+            engine = RuleEngine(rules_file="invalid_rules.json")
         self.assertEqual(len(engine.rules), 0)
 
+    def test_load_rules_with_and_without_orjson(self):
+        fake_orjson = MagicMock()
+        fake_orjson.loads.side_effect = json.loads
+        for parser in (None, fake_orjson):
+            with _patch_rules_file(MOCK_RULES_CONTENT), patch('rule_engine.orjson', parser):
+                engine = RuleEngine(rules_file="mock_rules.json")
+            self.assertEqual(len(MOCK_RULES_CONTENT), len(engine.rules))
+        fake_orjson.loads.assert_called_once()
+
+    def test_load_rules_skips_rule_with_invalid_condition(self):
+        rules = [
+            {"description": "Bad", "conditions": [{"field": "Cc", "predicate": "contains", "value": "x"}],
+             "actions": [{"type": "Mark as Read"}]},
+            MOCK_RULES_CONTENT[0],
+        ]
+        with _patch_rules_file(rules):
+            engine = RuleEngine(rules_file="mock_rules.json")
+        self.assertEqual([MOCK_RULES_CONTENT[0]["description"]], [rule.description for rule in engine.rules])
+
+    def test_load_rules_skips_rule_with_unknown_overall_predicate(self):
+        rules = [dict(MOCK_RULES_CONTENT[0], description="Bad", overall_predicate="most"), MOCK_RULES_CONTENT[0]]
+        with _patch_rules_file(rules):
+            engine = RuleEngine(rules_file="mock_rules.json")
+        self.assertEqual([MOCK_RULES_CONTENT[0]["description"]], [rule.description for rule in engine.rules])
+
+    def test_requires_message_body(self):
+        with _patch_rules_file(MOCK_RULES_CONTENT):
+            engine = RuleEngine(rules_file="mock_rules.json")
+        self.assertTrue(engine.requires_message_body())  # Rules 2 and 4 use "Message"
+
+        header_only_rules = [MOCK_RULES_CONTENT[0], MOCK_RULES_CONTENT[2]]
+        with _patch_rules_file(header_only_rules):
+            engine = RuleEngine(rules_file="mock_rules.json")
+        self.assertFalse(engine.requires_message_body())
+
+    def test_from_rules(self):
+        rules = _build_rules(MOCK_RULES_CONTENT)
+        engine = RuleEngine.from_rules(rules)
+        self.assertIsNone(engine.rules_file)
+        self.assertEqual(rules, engine.rules)
+        self.assertTrue(engine.requires_message_body())
+        self.assertFalse(RuleEngine.from_rules(_build_rules([MOCK_RULES_CONTENT[0]])).requires_message_body())
+
     def test_process_emails(self):
         mock_gmail_client = MagicMock()
 
-        # Setup mock for GmailClient methods used by actions
-        mock_gmail_client.mark_as_read.return_value = True
-        mock_gmail_client.mark_as_unread.return_value = True
-        mock_gmail_client.move_message.return_value = True
+        # Setup mock for GmailClient methods used by the rule engine
+        mock_gmail_client.get_label_id.side_effect = lambda name: f'Label_{name}'
+        mock_gmail_client.batch_modify.return_value = {}
 
         email1 = Email(  # Matches Rule 1 (Mark as Read)
             id='e1', thread_id='t1', from_address='tester@example.com',
@@ -475,49 +605,114 @@ class TestRuleEngine(unittest.TestCase):
 
         emails_to_process = [email1, email2, email3, email4, email5, email6, email7]
 
-        # Use mock_open to provide the rules.json content
-        with patch('builtins.open', new_callable=unittest.mock.mock_open, read_data=json.dumps(MOCK_RULES_CONTENT)), \
-                patch('os.path.exists', return_value=True):
-            engine = RuleEngine(rules_file="mock_rules.json")
-            engine.process_emails(emails_to_process, mock_gmail_client)
+        engine = RuleEngine.from_rules(_build_rules(MOCK_RULES_CONTENT))
+        engine.process_emails(emails_to_process, mock_gmail_client)
 
-        # Assertions for each email based on mock rules
-        # email1 matches Rule 1: Mark as Read
-        mock_gmail_client.mark_as_read.assert_any_call('e1')
+        # Label changes are resolved through get_label_id, then emails sharing the same change
+        # are flushed together in one batch_modify call per distinct change
+        calls = {
+            (tuple(c.args[1]), tuple(c.args[2])): c.args[0]
+            for c in mock_gmail_client.batch_modify.call_args_list
+        }
+        self.assertEqual(4, mock_gmail_client.batch_modify.call_count)
 
+        # Rule 5 (Mark as Unread) matches every email and Rule 6 (Mark as Read) every email but e6;
+        # the later rule wins when both apply.
+        self.assertEqual(['e1', 'e4', 'e5', 'e7'], calls[((), ('UNREAD',))])
         # email2 matches Rule 2: Move to Spam, Mark as Unread
-        mock_gmail_client.move_message.assert_any_call('e2', 'Spam')
-        mock_gmail_client.mark_as_unread.assert_any_call('e2')
-
+        self.assertEqual(['e2'], calls[(('Label_Spam',), ('UNREAD',))])
         # email3 matches Rule 3: Move to Archive
-        mock_gmail_client.move_message.assert_any_call('e3', 'Archive')
-
-        # email4 matches Rule 4: Mark as Read
-        mock_gmail_client.mark_as_read.assert_any_call('e4')
+        self.assertEqual(['e3'], calls[(('Label_Archive',), ('UNREAD',))])
+        # email6 does NOT match Rule 6, so only Rule 5's Mark as Unread applies
+        self.assertEqual(['e6'], calls[(('UNREAD',), ())])
+
+        # Per-message action methods are no longer called one at a time
+        mock_gmail_client.mark_as_read.assert_not_called()
+        mock_gmail_client.mark_as_unread.assert_not_called()
+        mock_gmail_client.move_message.assert_not_called()
+
+    def test_shared_conditions_evaluated_once_per_email(self):
+        shared = {"field": "Message", "predicate": "contains", "value": "invoice"}
+        rules = [
+            {"description": "A", "overall_predicate": "all", "conditions": [shared], "actions": [{"type": "Mark as Read"}]},
+            {"description": "B", "overall_predicate": "any",
+             "conditions": [dict(shared), {"field": "Subject", "predicate": "contains", "value": "bill"}],
+             "actions": [{"type": "Apply Label", "value": "Finance"}]},
+        ]
+        with _patch_rules_file(rules):
+            engine = RuleEngine(rules_file="mock_rules.json")
+        condition = engine.rules[0].conditions[0]
+        self.assertIs(condition, engine.rules[1].conditions[0])
 
-        # email5 matches Rule 5: Mark as Unread
-        mock_gmail_client.mark_as_unread.assert_any_call('e5')
+        mock_gmail_client = MagicMock()
+        mock_gmail_client.get_label_id.side_effect = lambda name: f'Label_{name}'
+        email_obj = Email(
+            id='e1', thread_id='t1', from_address='billing@shop.com', subject='Your order',
+            received_date_time=datetime.now(timezone.utc), message_body='Invoice attached.'
+        )
+        with patch.object(condition, '_eval', wraps=condition._eval) as shared_eval:
+            ops = engine.collect_label_changes([email_obj], mock_gmail_client)
+        shared_eval.assert_called_once_with(email_obj)
+        self.assertEqual([('e1', ['Label_Finance'], ['UNREAD'])], ops)
+
+    def test_equals_index_skips_rules_that_cannot_match(self):
+        rules = [
+            {"description": "Invite", "overall_predicate": "all",
+             "conditions": [{"field": "Subject", "predicate": "equals", "value": "Meeting Invite"},
+                            {"field": "Message", "predicate": "contains", "value": "agenda"}],
+             "actions": [{"type": "Apply Label", "value": "Meetings"}]},
+            {"description": "Report", "overall_predicate": "all",
+             "conditions": [{"field": "Subject", "predicate": "equals", "value": "weekly report"}],
+             "actions": [{"type": "Mark as Read"}]},
+        ]
+        with _patch_rules_file(rules):
+            engine = RuleEngine(rules_file="mock_rules.json")
+        self.assertEqual(frozenset(engine.rules), engine._gated_rules)
 
-        # email6 does NOT match Rule 6: No actions triggered for e6 by Rule 6, as Subject is 'Daily Report'
-        # The specific check would be that if no other rule matches, no actions are called.
-        # This test ensures calls happened only for matching rules.
+        mock_gmail_client = MagicMock()
+        mock_gmail_client.get_label_id.side_effect = lambda name: f'Label_{name}'
+        email_obj = Email(
+            id='e1', thread_id='t1', from_address='boss@company.com', subject='Weekly Report',
+            received_date_time=datetime.now(timezone.utc), message_body='Agenda attached.'
+        )
+        with patch.object(engine.rules[0], '_match') as invite_match:
+            ops = engine.collect_label_changes([email_obj], mock_gmail_client)
+        invite_match.assert_not_called()
+        self.assertEqual([('e1', [], ['UNREAD'])], ops)
+
+    def test_body_rules_skipped_without_body(self):
+        rules = [
+            {"description": "Not spam", "overall_predicate": "all",
+             "conditions": [{"field": "Message", "predicate": "does not equal", "value": "spam"}],
+             "actions": [{"type": "Apply Label", "value": "Clean"}]},
+            {"description": "Report", "overall_predicate": "all",
+             "conditions": [{"field": "Subject", "predicate": "contains", "value": "report"}],
+             "actions": [{"type": "Mark as Read"}]},
+        ]
+        engine = RuleEngine.from_rules(_build_rules(rules))
 
-        # email7 matches Rule 6: Mark as Read
-        mock_gmail_client.mark_as_read.assert_any_call('e7')
+        mock_gmail_client = MagicMock()
+        mock_gmail_client.get_label_id.side_effect = lambda name: f'Label_{name}'
+        email_obj = Email(
+            id='e1', thread_id='t1', from_address='boss@company.com', subject='Weekly Report',
+            received_date_time=datetime.now(timezone.utc), message_body=None
+        )
+        self.assertEqual([('e1', [], ['UNREAD'])], engine.collect_label_changes([email_obj], mock_gmail_client))
 
-        # Verify total calls (simplified: check if expected methods were called at least once)
-        self.assertTrue(mock_gmail_client.mark_as_read.called)
-        self.assertTrue(mock_gmail_client.mark_as_unread.called)
-        self.assertTrue(mock_gmail_client.move_message.called)
+    def test_process_emails_moves_out_of_inbox(self):
+        mock_gmail_client = MagicMock()
+        mock_gmail_client.get_label_id.side_effect = lambda name: f'Label_{name}'
+        mock_gmail_client.batch_modify.return_value = {'e3': True}
+        email3 = Email(
+            id='e3', thread_id='t3', from_address='old@company.com',
+            subject='Old Report', received_date_time=datetime.now(timezone.utc) - timedelta(days=60),
+            message_body='Old document here.', label_ids=['INBOX']
+        )
 
-        # Verify specific counts for demonstration
-        # Expected mark_as_read calls: (7 calls)
-        self.assertEqual(mock_gmail_client.mark_as_read.call_count, 7)
-        # Expected mark_as_unread calls: (8 calls)
-        self.assertEqual(mock_gmail_client.mark_as_unread.call_count, 8)
-        # Expected move_message calls: e2, e3 (2 calls)
-        self.assertEqual(mock_gmail_client.move_message.call_count, 2)
+        engine = RuleEngine.from_rules(_build_rules([MOCK_RULES_CONTENT[2]]))
+        engine.process_emails([email3], mock_gmail_client)
 
+        mock_gmail_client.batch_modify.assert_called_once_with(['e3'], ['Label_Archive'], ['INBOX'])
 
 if __name__ == '__main__':
     unittest.main()